@@ -1,18 +1,21 @@
 
 
 # src/api_main.py
-import logging, pickle, json, pathlib
+import asyncio, hashlib, logging, json, os, pathlib
 from datetime import date, timedelta
-from typing import List, Optional, Union
+from functools import partial
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
-from fastapi import FastAPI, Body, HTTPException, Request
+from fastapi import FastAPI, Body, HTTPException, Query, Request
 from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, Field
 
-from features import LagMaker, safe_mape    # только transform + метрика
-from error_handler import handle_errors, exception_handler, ModelError, DataProcessingError, ExternalServiceError
+from features import LagMaker, aggregate_daily, safe_mape    # только transform + метрика
+from error_handler import handle_errors, exception_handler, format_error_response, ModelError, DataProcessingError, ExternalServiceError
+from model_artifact import ModelArtifact
+from model_registry import ModelRegistry
 
 app = FastAPI()
 logging.basicConfig(level=logging.INFO)
@@ -20,45 +23,53 @@ logging.basicConfig(level=logging.INFO)
 # Регистрируем глобальный обработчик ошибок
 app.add_exception_handler(Exception, exception_handler)
 MAX_HORIZON = 60
+# Товары, которых не было при обучении:
+#   UNKNOWN_ITEM_CODE     — значение ItemEnc для них ("nan" = пропуск для LightGBM);
+#   UNKNOWN_ITEM_FALLBACK — "model" (прогноз модели с этим кодом) или
+#                           "ma" (наивный прогноз: среднее за 7 дней / последняя продажа)
+UNKNOWN_ITEM_FALLBACKS = ("model", "ma")
+UNKNOWN_ITEM_CODE     = float(os.getenv("UNKNOWN_ITEM_CODE", "nan"))
+UNKNOWN_ITEM_FALLBACK = os.getenv("UNKNOWN_ITEM_FALLBACK", "model").strip().lower()
+if UNKNOWN_ITEM_FALLBACK not in UNKNOWN_ITEM_FALLBACKS:
+    # опечатка в настройке не должна молча менять прогноз новых товаров
+    raise ValueError(f"Неизвестный UNKNOWN_ITEM_FALLBACK: {UNKNOWN_ITEM_FALLBACK!r} "
+                     f"(допустимо: {', '.join(UNKNOWN_ITEM_FALLBACKS)})")
 # Импортируем кеш и метрики
-from cache_manager import cache_manager
+from cache_manager import cache_manager, series_digests
 from metrics import metrics_collector, track_request_metrics, track_prediction_time, track_data_processing_time
+from batcher import predict_batcher
+from executor import stage_executor
+from columnar import ARROW_STREAM, COLUMNAR_TYPES, PARQUET, sales_frame_columnar
+from events import parse_batch_json, parse_events, parse_events_json
+from horizon import HorizonRoller
+from series import SERIES_COL, STORE_COL, SeriesKeys, concat_series, intern_series
 
-# ────────── загружаем САМЫЙ новый pkl
-def load_latest_model():
-    try:
-        pkls = sorted(pathlib.Path("models").glob("model-*.pkl"))
-        if not pkls:
-            raise ModelError("Нет обученных моделей в директории /models")
-        return pickle.load(open(pkls[-1], "rb"))
-    except Exception as e:
-        if not isinstance(e, ModelError):
-            raise ModelError(f"Ошибка загрузки модели: {str(e)}")
-        raise
+# ────────── реестр моделей: САМЫЙ новый артефакт + горячая замена
+registry = ModelRegistry(pathlib.Path("models"))
 
 try:
-    artifact = load_latest_model()
-    model          = artifact["model"]
-    encoder        = artifact["encoder"]
-    FEAT_COLS      = artifact["feature_cols"]
-    TRAIN_MAE      = artifact["metrics"]["mae"]
-    TRAIN_MAPE     = artifact["metrics"]["mape"]
-    #HORIZON        = artifact["horizon"]
-    #MAX_HORIZON = 60
-    
-    # Проверка модели на тестовом примере
-    import numpy as np
-    test_data = np.zeros((1, len(FEAT_COLS)))
-    try:
-        _ = model.predict(test_data)
-        logging.info("Модель успешно загружена и проверена")
-    except Exception as e:
-        logging.error(f"Ошибка при проверке модели: {str(e)}")
-        raise ModelError("Модель не может делать предсказания на тестовых данных")
-        
+    registry.reload()
+    logging.info("Модель успешно загружена и проверена")
 except Exception as e:
     logging.error(f"Ошибка при инициализации сервиса: {str(e)}")
     # Продолжаем работу, но ошибки будут обрабатываться при обращении к API
+registry.start_watching()
+
+@app.on_event("startup")
+async def connect_cache():
+    # проверка Redis — в event loop сервиса, а не при импорте модуля
+    await cache_manager.connect()
+    # замена модели фоновым опросом каталога (поток) → прогрев в event loop сервиса
+    loop = asyncio.get_running_loop()
+    registry.on_swap = lambda old, new: asyncio.run_coroutine_threadsafe(
+        after_model_swap(old, new), loop)
+
+def current_model() -> ModelArtifact:
+    """Снимок текущей модели на весь запрос (не меняется при горячей замене)"""
+    art = registry.current
+    if art is None:
+        raise ModelError("Модель не загружена")
+    return art
 # ────────── схемы запроса
 class DaysHeader(BaseModel):
     DaysCount: int = Field(..., ge=1, le=MAX_HORIZON)
@@ -114,6 +125,8 @@ class Row(BaseModel):
     MAPE: float
     MAE: float
     Количество: int
+    КоличествоПоДням: List[float]   # прогноз по дням горизонта; Количество — их сумма
+    Адрес_точки: Optional[str] = None   # только в ответах по точкам продаж (X-Per-Store)
 # ────────────────────────── helper
 def make_features(df: pd.DataFrame) -> pd.DataFrame:
     return LagMaker().transform(df)
@@ -123,108 +136,438 @@ def build_features_live(df: pd.DataFrame) -> pd.DataFrame:
     maker = LagMaker()
     return maker.transform(df)
 
-# ────────── энд-пойнт
-@app.post("/forecast")
-@handle_errors
-@track_request_metrics(endpoint="/forecast")
-async def forecast(payload: Payload = Body(...)):
+def build_rows(series: np.ndarray, keys: SeriesKeys, sales_df: pd.DataFrame,
+               period_pred: np.ndarray, period_str: str, mape: float, mae: float,
+               day_pred: Optional[np.ndarray] = None) -> List[dict]:
+    """
+    Строки ответа (схема Row) по рядам series без построчной фильтрации
+    sales_df: первые непустые ВидНоменклатуры / Код берутся одним
+    groupby-проходом по целочисленному ключу ряда, колонки собираются
+    целиком, pydantic-объекты Row не создаются.
+    """
+    meta = (sales_df.groupby(SERIES_COL, sort=False)[["ВидНоменклатуры", "Код"]]
+                    .first()
+                    .reindex(series))
+
+    vis = meta["ВидНоменклатуры"].astype(object)
+    names = np.where(vis.notna().values, vis.values, keys.items(series)).tolist()
+    code = meta["Код"].astype(object)
+    codes = code.where(code.notna(), None).tolist()
+    qty = np.asarray(period_pred, dtype=np.int64).tolist()
+
+    rows = [
+        {"Период": period_str, "Номенклатура": n, "Код": c,
+         "MAPE": mape, "MAE": mae, "Количество": q}
+        for n, c, q in zip(names, codes, qty)
+    ]
+    if day_pred is not None:
+        for row, days in zip(rows, np.round(day_pred, 2).tolist()):
+            row["КоличествоПоДням"] = days
+    if keys.has_stores:
+        for row, store in zip(rows, keys.stores(series).tolist()):
+            row[STORE_COL] = store
+    return rows
+
+# ────────── стадии прогноза (общие для /forecast и /forecast/batch)
+def per_store(request: Request) -> bool:
+    """
+    Заголовок X-Per-Store: 1 — ряды (товар, точка) и Адрес_точки в строках
+    ответа; без него — ряд товара по всей сети, как у обученной модели
+    """
+    return request.headers.get("x-per-store", "").strip().lower() in ("1", "true", "yes")
+
+def daily_sales(sales_df: pd.DataFrame, by_store: bool = False) -> Tuple[pd.DataFrame, SeriesKeys]:
+    """
+    Ряды (товар или, при by_store, товар и точка) интернируются в
+    int32-колонку SERIES_COL, чеки / смены сворачиваются в одну строку
+    на (ряд, день); степень сжатия — в метрики
+    """
+    sales_df[SERIES_COL], keys = intern_series(sales_df, by_store)
+    daily = aggregate_daily(sales_df, group_col=SERIES_COL)
+    metrics_collector.record_preaggregation(len(sales_df), len(daily))
+    return daily, keys
+
+def batch_frame(frames: List[pd.DataFrame], keys: List[SeriesKeys], refs: List[pd.Timestamp]):
+    """
+    Продажи нескольких запросов в одном кадре: номера рядов сдвигаются,
+    чтобы одинаковые SKU разных организаций не смешивались. → (кадр,
+    общая таблица рядов, сдвиги: ряды запроса i — [offsets[i], offsets[i+1]),
+    дата отсчёта запроса на каждую строку кадра — until для transform_latest)
+    """
+    merged, offsets = concat_series(keys)
+    all_df = pd.concat([df.assign(**{SERIES_COL: df[SERIES_COL].to_numpy() + off})
+                        for df, off in zip(frames, offsets)], ignore_index=True)
+    until = np.repeat(np.array([r.to_datetime64() for r in refs], dtype="datetime64[ns]"),
+                      [len(df) for df in frames])
+    return all_df, merged, offsets, until
+
+def encode_items(art: ModelArtifact, latest: pd.DataFrame, keys: SeriesKeys) -> np.ndarray:
+    """Заполняет ItemEnc; возвращает маску товаров, неизвестных модели"""
+    item_codes = keys.encode_items(art.encoder)[latest[SERIES_COL].to_numpy()]
+    unknown = item_codes < 0
+    latest["ItemEnc"] = np.where(unknown, UNKNOWN_ITEM_CODE, item_codes)
+    if unknown.any():
+        metrics_collector.record_unknown_items(int(unknown.sum()))
+        logging.warning(f"Товаров без истории обучения: {int(unknown.sum())} "
+                        f"(fallback={UNKNOWN_ITEM_FALLBACK})")
+    return unknown
+
+async def predict_horizon(art: ModelArtifact, latest: pd.DataFrame, history: np.ndarray,
+                          unknown: np.ndarray, horizon: int) -> np.ndarray:
+    """
+    Прогноз спроса (>= 0) на horizon дней вперёд для каждой строки latest:
+    матрица (строки × дни). Прогноз дня дописывается в историю ряда, и
+    признаки следующего дня пересчитываются по ней (horizon.HorizonRoller) —
+    один батчевый predict на день горизонта.
+    """
     try:
-        header = next(p for p in payload if isinstance(p, DaysHeader))
-    except StopIteration:
-        raise HTTPException(422, "Отсутствует объект DaysCount")
+        roller = HorizonRoller(latest, history, art.feature_cols)
+        out = np.empty((len(latest), horizon))
+        for day in range(horizon):
+            # predict — через микро-батчер: в рабочем потоке, вместе с
+            # конкурентными запросами (время предсказания пишет батчер);
+            # окно ожидания — только на первом дне
+            raw_pred = await predict_batcher.predict(art, roller.frame(), wait=day == 0)
+            if UNKNOWN_ITEM_FALLBACK == "ma" and unknown.any():
+                ma_7 = roller.mean(7)
+                naive = np.where(ma_7 > 0, ma_7, roller.last())
+                raw_pred = np.where(unknown, naive, raw_pred)
+            out[:, day] = np.clip(raw_pred, 0, None)
+            if day + 1 < horizon:
+                roller.step(out[:, day])
+        return out
+    except Exception as e:
+        raise ModelError(f"Ошибка при прогнозировании: {str(e)}")
+
+def build_answer(art: ModelArtifact, series: np.ndarray, keys: SeriesKeys,
+                 sales_df: pd.DataFrame, day_pred: np.ndarray, horizon: int) -> List[dict]:
+    """
+    Head + Row: сумма прогнозов по дням (ряды × дни) на период от последней
+    даты запроса — от неё же прогнозируется каждый ряд (ref_date)
+    """
+    period_pred = day_pred.sum(axis=1).round().astype(int)
+    ref_date   = ref_date_of(sales_df)
+    period_str = f"{ref_date:%Y-%m-%d} - {(ref_date + timedelta(days=horizon-1)):%Y-%m-%d}"
 
-    horizon = header.DaysCount
-    sales = [p for p in payload if isinstance(p, SaleEvt)]
-    if not sales:
-        raise HTTPException(422, "Нет продаж в запросе")
+    head = Head(MAPE=round(art.metrics["mape"]*100, 1), MAE=round(art.metrics["mae"], 3),
+                DaysPredict=horizon)
+    answer: List[dict] = [head.dict()]
+    answer += build_rows(series, keys, sales_df, period_pred, period_str, head.MAPE, head.MAE,
+                         day_pred)
+    return answer
 
-    # Кеширование
+def ref_date_of(sales_df: pd.DataFrame) -> pd.Timestamp:
+    """
+    Дата отсчёта прогноза — последняя дата продаж запроса: все ряды, и давно
+    не продававшиеся, прогнозируются с неё (transform_latest(until=...))
+    """
+    return sales_df["Период"].max()
+
+class SkuLookup(NamedTuple):
+    """Ряды запроса (0..n-1 — по возрастанию, как в transform_latest), их ключи и прогнозы"""
+    org: str
+    version: str
+    series_keys: SeriesKeys
+    keys: List[str]
+    daily: np.ndarray   # ряды × дни горизонта; строка NaN — промах кеша, нужно посчитать
+
+    @property
+    def series(self) -> np.ndarray:
+        return np.arange(len(self.series_keys))
+
+    @property
+    def items(self) -> np.ndarray:
+        """Товары рядов — для индексов инвалидации кеша"""
+        return self.series_keys.items(self.series)
+
+    @property
+    def miss(self) -> np.ndarray:
+        return np.isnan(self.daily[:, 0])
+
+async def sku_lookup(org: str, digests: pd.Series, keys: SeriesKeys, horizon: int,
+                     version: str, ref_date: pd.Timestamp) -> SkuLookup:
+    """
+    Прогнозы по дням для рядов с неизменной историей — из кеша по рядам;
+    прогноз ряда зависит и от даты отсчёта запроса, она входит в ключ
+    """
+    cache_keys = await stage_executor.run("cache", cache_manager.generate_sku_cache_keys,
+                                          org, digests, horizon, version, ref_date)
+    return SkuLookup(org, version, keys, cache_keys,
+                     await cache_manager.get_sku_forecasts(cache_keys, horizon))
+
+def miss_frame(sales_df: pd.DataFrame, lookup: SkuLookup) -> pd.DataFrame:
+    """Продажи только тех рядов, прогноз которых не нашёлся в кеше"""
+    miss = lookup.miss
+    if miss.all():
+        return sales_df
+    return sales_df[miss[sales_df[SERIES_COL].to_numpy()]]
+
+async def cache_sku_forecasts(lookup: SkuLookup, computed: np.ndarray):
+    """Кладёт в кеш посчитанные (бывшие промахами) прогнозы товаров"""
     try:
-        cache_key = cache_manager.generate_cache_key([s.dict() for s in sales], horizon)
-        cached_result = cache_manager.get_cached_forecast(cache_key)
-        if cached_result:
-            return cached_result
+        await cache_manager.set_sku_forecasts([k for k, m in zip(lookup.keys, computed) if m],
+                                        lookup.daily[computed], items=lookup.items[computed],
+                                        org=lookup.org, model_version=lookup.version)
     except Exception as e:
-        logging.warning(f"Cache error: {str(e)}")
+        logging.warning(f"Cache set error: {str(e)}")
 
+async def read_body(request: Request) -> Tuple[bytes, str]:
+    """Тело запроса и его хеш, посчитанный по мере приёма чанков (один раз)"""
+    hasher = hashlib.blake2b(digest_size=20)
+    chunks = []
+    async for chunk in request.stream():
+        if len(chunk) > 2**20:   # крупный чанк хешируем вне event loop (hashlib отпускает GIL)
+            await asyncio.to_thread(hasher.update, chunk)
+        else:
+            hasher.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), hasher.hexdigest()
+
+async def cache_answer(cache_key: str, answer: List[dict], lookup: SkuLookup):
+    """Кладёт ответ в кеш целиком (с индексами по товарам, организации и модели)"""
     try:
-        sales_df = pd.DataFrame([s.dict() for s in sales])
-        sales_df["Период"] = pd.to_datetime(sales_df["Период"])
+        if cache_key:
+            await cache_manager.set_cached_forecast(cache_key, answer, items=lookup.items,
+                                              org=lookup.org, model_version=lookup.version)
     except Exception as e:
-        raise DataProcessingError(f"Ошибка при преобразовании данных: {str(e)}")
+        logging.warning(f"Cache set error: {str(e)}")
+
+async def cache_lookup(cache_key_fn, *args):
+    """(ключ, закешированный ответ или None); ошибки кеша не роняют запрос"""
+    try:
+        cache_key = cache_key_fn(*args)
+        return cache_key, await cache_manager.get_cached_forecast(cache_key)
+    except Exception as e:
+        logging.warning(f"Cache error: {str(e)}")
+        return None, None
+
+async def compute_forecast(art: ModelArtifact, body: bytes, content_type: str,
+                           horizon: Optional[int], org: str, cache_key: Optional[str],
+                           by_store: bool = False) -> List[dict]:
+    """Разбор, прогноз и кеширование ответа /forecast (промах кеша ответов)"""
+    # CPU-стадии — в пулах stage_executor, event loop остаётся свободным
+    if content_type in COLUMNAR_TYPES:
+        sales_df = await stage_executor.run("parse", sales_frame_columnar, body, content_type)
+    else:
+        horizon, sales_df = await stage_executor.run("parse", parse_events_json, body, DaysHeader)
+    sales_df, keys = await stage_executor.run("parse", daily_sales, sales_df, by_store)
 
     # Подключение к внешним сервисам для получения дополнительных данных (опционально)
     # Здесь вы можете добавить вызовы внешних сервисов с использованием функции get_external_data
     # из error_handler.py
     
-    try:
-        # фичи на последние даты
-        df_feat = make_features(sales_df)
-        latest = df_feat.groupby("Номенклатура").tail(1).copy()
-        latest["ItemEnc"] = encoder.transform(latest["Номенклатура"])
-        X = latest[FEAT_COLS]
-    except Exception as e:
-        raise DataProcessingError(f"Ошибка при создании признаков: {str(e)}")
-
-    try:
-        # --- 4. прогноз суточного спроса → умножаем на DaysCount
-        import time
-        start_time = time.time()
-        raw_pred   = model.predict(X) 
-        daily_pred = np.clip(raw_pred, 0, None)
-        period_pred = (daily_pred * horizon).round().astype(int)
-        duration = time.time() - start_time
-        metrics_collector.record_prediction_time("lightgbm", duration)
-    except Exception as e:
-        raise ModelError(f"Ошибка при прогнозировании: {str(e)}")
+    # кеш по рядам: модель считает только ряды с изменившейся историей
+    digests = await stage_executor.run("parse", series_digests, sales_df, keys)
+    ref_date = ref_date_of(sales_df)
+    lookup = await sku_lookup(org, digests, keys, horizon, art.version, ref_date)
+    computed = lookup.miss
+    if computed.any():
+        try:
+            # фичи на последние даты
+            latest, history = await stage_executor.run("features",
+                                                       LagMaker(group_col=SERIES_COL).transform_latest_history,
+                                                       miss_frame(sales_df, lookup), ref_date)
+            unknown = encode_items(art, latest, keys)
+        except Exception as e:
+            raise DataProcessingError(f"Ошибка при создании признаков: {str(e)}")
+
+        # --- 4. прогноз спроса по дням горизонта
+        lookup.daily[computed] = await predict_horizon(art, latest, history, unknown, horizon)
+        await cache_sku_forecasts(lookup, computed)
 
     # --- 5. формируем ответ
-    ref_date   = sales_df["Период"].max()
-    period_str = f"{ref_date:%Y-%m-%d} - {(ref_date + timedelta(days=horizon-1)):%Y-%m-%d}"
-
-    answer: List[dict] = [
-        Head(MAPE=round(TRAIN_MAPE*100, 1), MAE=round(TRAIN_MAE, 3), DaysPredict=horizon).dict()
-    ]
-
-    for (_, row), qty in zip(latest.iterrows(), period_pred):
-        subset = sales_df[sales_df["Номенклатура"] == row["Номенклатура"]]
-        vis = subset["ВидНоменклатуры"].dropna().head(1)
-        name = vis.iloc[0] if not vis.empty else row["Номенклатура"]
-        code = subset["Код"].dropna().head(1)
-        answer.append(Row(
-            Период=period_str,
-            Номенклатура=name,
-            Код=code.iloc[0] if not code.empty else None,
-            MAPE=round(TRAIN_MAPE*100, 1),
-            MAE=round(TRAIN_MAE, 3),
-            Количество=int(qty)
-        ).dict())
+    answer = await stage_executor.run("response", build_answer, art, lookup.series, keys,
+                                      sales_df, lookup.daily, horizon)
 
     # Кеширование ответа
-    try:
-        cache_manager.set_cached_forecast(cache_key, answer)
-    except Exception as e:
-        logging.warning(f"Cache set error: {str(e)}")
+    await cache_answer(cache_key, answer, lookup)
     return answer
 
+async def warm_up_cache(limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Прогрев кеша ответов текущей моделью по самым частым запросам
+    (статистика cache_manager.record_request). Прогревает одна реплика —
+    под блокировкой в Redis; ответы, которые уже есть в кеше, пропускаются.
+    """
+    art = current_model()
+    lock = await cache_manager.acquire_warmup_lock()
+    if lock is None:
+        return {"warmed": 0, "fresh": 0, "failed": 0, "skipped": 1}
+    stats = {"warmed": 0, "fresh": 0, "failed": 0, "skipped": 0}
+    try:
+        for recipe in await cache_manager.hot_recipes(limit):
+            cache_key = cache_manager.generate_body_cache_key(recipe.body_digest, recipe.horizon,
+                                                              art.version, recipe.org,
+                                                              recipe.by_store)
+            if await cache_manager.is_cached(cache_key):
+                stats["fresh"] += 1
+                continue
+            try:
+                await cache_manager.single_flight(cache_key, partial(
+                    compute_forecast, art, recipe.body, recipe.content_type,
+                    horizon=recipe.horizon, org=recipe.org, cache_key=cache_key,
+                    by_store=recipe.by_store))
+                stats["warmed"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                logging.warning(f"Прогрев запроса {recipe.recipe_id} не удался: {str(e)}")
+    finally:
+        await cache_manager.release_warmup_lock(lock)
+    metrics_collector.record_cache_operation("warmup", "warmed", stats["warmed"])
+    logging.info(f"Прогрев кеша моделью {art.version}: {stats}")
+    return stats
+
+async def after_model_swap(old: Optional[ModelArtifact], new: ModelArtifact):
+    """Новая модель: прогнозы старой удаляются, частые запросы прогреваются в фоне"""
+    if old is not None and old.version != new.version:
+        # прогнозы старой модели больше не находятся — освобождаем память Redis
+        await cache_manager.invalidate_model_version(old.version)
+    cache_manager.spawn(warm_up_cache())
+
+# ────────── энд-пойнт
+@app.post("/forecast", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {
+            "application/json": {"schema": {"type": "array", "items": {}}},
+            ARROW_STREAM: {"schema": {"type": "string", "format": "binary"}},
+            PARQUET: {"schema": {"type": "string", "format": "binary"}},
+        },
+    },
+})
+@handle_errors
+@track_request_metrics(endpoint="/forecast")
+async def forecast(request: Request,
+                   DaysCount: Optional[int] = Query(None, ge=1, le=MAX_HORIZON,
+                                                    description="Горизонт для Arrow/Parquet-тела")):
+    """
+    Тело — JSON-массив [DaysHeader, SaleEvt...] или таблица Arrow IPC
+    stream / Parquet (Content-Type) с горизонтом в ?DaysCount=N.
+    Заголовок X-Organization-Id (необязательный) разделяет кеш прогнозов
+    товаров между организациями; X-Per-Store: 1 — прогноз по точкам
+    продаж (Адрес_точки) вместо товара по всей сети.
+    """
+    body, body_digest = await read_body(request)
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip()
+    art = current_model()
+
+    columnar = content_type in COLUMNAR_TYPES
+    if columnar and DaysCount is None:
+        raise HTTPException(422, "Отсутствует параметр DaysCount")
+    org = request.headers.get("x-organization-id", "")
+    by_store = per_store(request)
+    # горизонт JSON-запроса — внутри тела, и он уже учтён в его хеше
+    horizon = DaysCount if columnar else None
+    cache_key, cached_result = await cache_lookup(cache_manager.generate_body_cache_key,
+                                                  body_digest, horizon, art.version, org, by_store)
+    # частота запроса — для прогрева кеша после смены модели (в фоне)
+    cache_manager.spawn(cache_manager.record_request(
+        cache_manager.generate_recipe_id(body_digest, horizon, org, by_store),
+        body, content_type, horizon, org, body_digest, by_store))
+    if cached_result:
+        return cached_result
+    # одинаковые запросы, пришедшие одновременно, считаются один раз
+    return await cache_manager.single_flight(cache_key, lambda: compute_forecast(
+        art, body, content_type, horizon=DaysCount, org=org, cache_key=cache_key,
+        by_store=by_store))
+
+# ────────── пакетный энд-пойнт: много независимых запросов (организаций) за раз
+@app.post("/forecast/batch", openapi_extra={
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": {
+            "type": "object", "additionalProperties": {"type": "array", "items": {}}}}},
+    },
+})
+@handle_errors
+@track_request_metrics(endpoint="/forecast/batch")
+async def forecast_batch(request: Request):
+    """
+    {ключ: payload как у /forecast} → {ключ: ответ как у /forecast}.
+    Признаки всех запросов строятся в одном DataFrame, прогноз — одним
+    model.predict. Ошибка одного запроса (нет DaysCount / продаж, неверные
+    поля) возвращается под его ключом и не мешает остальным.
+    X-Per-Store — как у /forecast, для всех запросов пакета.
+    """
+    payloads = await stage_executor.run("parse", parse_batch_json, await request.body())
+    by_store = per_store(request)
+    art = current_model()
+    results: Dict[str, Any] = {}
+    pending = []   # (ключ, горизонт, cache_key, sales_df, SkuLookup); ключ = организация
+
+    for key, items in payloads.items():
+        try:
+            horizon, sales_df = await stage_executor.run("parse", parse_events, items, DaysHeader)
+        except HTTPException as e:
+            results[key] = format_error_response("API_ERROR", e.detail)
+            continue
+        sales_df, keys = await stage_executor.run("parse", daily_sales, sales_df, by_store)
+
+        digests = await stage_executor.run("parse", series_digests, sales_df, keys)
+        cache_key, cached_result = await cache_lookup(cache_manager.generate_frame_cache_key,
+                                                      sales_df, horizon, art.version, digests, key)
+        if cached_result:
+            results[key] = cached_result
+            continue
+        lookup = await sku_lookup(key, digests, keys, horizon, art.version,
+                                  ref_date_of(sales_df))
+        pending.append((key, horizon, cache_key, sales_df, lookup))
+
+    # промахи всех запросов — в одном кадре признаков и одном predict
+    computing = [p for p in pending if p[4].miss.any()]
+    computed = [p[4].miss for p in pending]
+    if computing:
+        try:
+            all_df, all_keys, offsets, until = await stage_executor.run(
+                "parse", batch_frame, [miss_frame(p[3], p[4]) for p in computing],
+                [p[4].series_keys for p in computing], [ref_date_of(p[3]) for p in computing])
+            latest, history = await stage_executor.run(
+                "features", LagMaker(group_col=SERIES_COL).transform_latest_history, all_df, until)
+            unknown = encode_items(art, latest, all_keys)
+        except Exception as e:
+            raise DataProcessingError(f"Ошибка при создании признаков: {str(e)}")
+
+        # один прогон на самый длинный горизонт; запросу — его первые дни
+        day_pred = await predict_horizon(art, latest, history, unknown,
+                                         max(p[1] for p in computing))
+
+        # latest отсортирован по сдвинутому номеру ряда → у каждого запроса свой срез
+        bounds = np.searchsorted(latest[SERIES_COL].to_numpy(), offsets)
+        for i, (_, horizon, _, _, lookup) in enumerate(computing):
+            lookup.daily[lookup.miss] = day_pred[bounds[i]:bounds[i + 1], :horizon]
+
+    for (key, horizon, cache_key, sales_df, lookup), miss in zip(pending, computed):
+        if miss.any():
+            await cache_sku_forecasts(lookup, miss)
+        answer = await stage_executor.run("response", build_answer, art, lookup.series,
+                                          lookup.series_keys, sales_df, lookup.daily, horizon)
+        results[key] = answer
+        await cache_answer(cache_key, answer, lookup)
+
+    return {key: results[key] for key in payloads}
+
 # Эндпоинт для проверки состояния сервиса
 @app.get("/health")
 async def health_check():
     try:
         # Простая проверка доступности модели
-        test_data = np.zeros((1, len(FEAT_COLS)))
-        _ = model.predict(test_data)
+        art = current_model()
+        test_data = np.zeros((1, len(art.feature_cols)))
+        _ = art.predict(test_data)
 
-        # Статистика кеша и метрики использования сервиса
-        cache_stats = cache_manager.get_cache_stats()
+        # Статистика кеша без обхода ключей: /health — HEALTHCHECK контейнера
+        # с коротким таймаутом; подробная статистика — GET /cache/stats
+        cache_stats = await cache_manager.get_cache_stats(scan_keys=False)
 
         return {
             "status": "ok",
             "model_loaded": True,
             "train_metrics": {
-                "mae": float(TRAIN_MAE),
-                "mape": float(TRAIN_MAPE)
+                "mae": float(art.metrics["mae"]),
+                "mape": float(art.metrics["mape"])
             },
+            "model_path": str(art.path),
+            "model_load_seconds": round(art.load_seconds, 4),
             "cache_stats": cache_stats,
         }
     except Exception as e:
@@ -234,6 +577,25 @@ async def health_check():
             "model_loaded": False
         }
 
+# Эндпоинт для горячей перезагрузки модели (без рестарта сервиса)
+@app.post("/model/reload")
+async def reload_model(force: bool = False):
+    try:
+        old = registry.current
+        # загрузка и прогрев — в потоке, event loop продолжает обслуживать запросы
+        swapped = await asyncio.to_thread(registry.reload, force)
+        art = registry.current
+        if swapped:
+            await after_model_swap(old, art)
+        return {
+            "message": f"Model {'reloaded' if swapped else 'unchanged'}: {art.path}",
+            "model_path": str(art.path),
+            "model_load_seconds": round(art.load_seconds, 4),
+            "status": "success",
+        }
+    except Exception as e:
+        return {"message": f"Error reloading model: {str(e)}", "status": "error"}
+
 # Эндпоинт для метрик Prometheus
 @app.get("/metrics")
 async def metrics():
@@ -244,25 +606,42 @@ async def metrics():
 @app.delete("/cache")
 async def clear_cache():
     try:
-        count = cache_manager.invalidate_cache_by_pattern()
+        count = await cache_manager.invalidate_cache_by_pattern()
+        # тела запросов, сохранённые для прогрева (сырые продажи), — тоже
+        count += await cache_manager.invalidate_warmup_recipes()
         return {"message": f"Cache cleared. Removed {count} entries", "status": "success"}
     except Exception as e:
         return {"message": f"Error clearing cache: {str(e)}", "status": "error"}
 
-# Эндпоинт для очистки кеша для конкретных товаров
+# Эндпоинт для очистки кеша для конкретных товаров / организации / версии модели
 @app.post("/cache/invalidate")
-async def invalidate_cache_for_items(items: List[str]):
+async def invalidate_cache_for_items(items: List[str] = Body(default=[]),
+                                     org: Optional[str] = None,
+                                     model_version: Optional[str] = None):
     try:
-        count = cache_manager.invalidate_cache_for_items(items)
+        count = await cache_manager.invalidate_cache_for_items(items) if items else 0
+        if org is not None:
+            count += await cache_manager.invalidate_cache_for_org(org)
+        if model_version:
+            count += await cache_manager.invalidate_model_version(model_version)
         return {"message": f"Invalidated cache for {len(items)} items. Removed {count} entries", "status": "success"}
     except Exception as e:
         return {"message": f"Error invalidating cache: {str(e)}", "status": "error"}
 
+# Эндпоинт для прогрева кеша (например, после ночного ETL)
+@app.post("/cache/warmup")
+async def warmup_cache(limit: Optional[int] = Query(None, ge=1)):
+    try:
+        stats = await warm_up_cache(limit)
+        return {"stats": stats, "status": "success"}
+    except Exception as e:
+        return {"message": f"Error warming up cache: {str(e)}", "status": "error"}
+
 # Эндпоинт для статистики кеша
 @app.get("/cache/stats")
 async def cache_stats():
     try:
-        stats = cache_manager.get_cache_stats()
+        stats = await cache_manager.get_cache_stats()
         return {"stats": stats, "status": "success"}
     except Exception as e:
         return {"message": f"Error getting cache stats: {str(e)}", "status": "error"}
@@ -0,0 +1,120 @@
+# src/batcher.py
+"""
+Микро-батчинг model.predict для конкурентных запросов.
+
+Корутины кладут свои матрицы признаков в очередь и ждут future. Фоновая
+задача забирает первый элемент, добирает всё, что пришло за max_wait_ms
+(но не больше max_batch_rows строк), склеивает в один DataFrame и
+вызывает predict один раз в пуле стадии "predict" (executor.py) — event
+loop при этом не блокируется. Результат режется обратно по запросам.
+
+Запросы, пришедшие на разных моделях (горячая замена посреди батча),
+в один predict не склеиваются.
+"""
+
+import asyncio, logging, os, time
+from typing import List, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from executor import stage_executor
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class _Job(NamedTuple):
+    art: object
+    X: pd.DataFrame
+    future: asyncio.Future
+    wait: bool
+
+
+class PredictBatcher:
+    def __init__(self, max_batch_rows: int = None, max_wait_ms: float = None):
+        if max_batch_rows is None:
+            max_batch_rows = int(os.getenv("PREDICT_BATCH_MAX_ROWS", "100000"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("PREDICT_BATCH_MAX_WAIT_MS", "5"))
+        self.max_batch_rows = max_batch_rows
+        self.max_wait = max_wait_ms / 1000
+        self._loop = None
+        self._queue: asyncio.Queue = None
+        self._worker: asyncio.Task = None
+
+    def _ensure_worker(self):
+        # очередь и фоновая задача привязаны к текущему event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def predict(self, art, X: pd.DataFrame, wait: bool = True) -> np.ndarray:
+        """
+        art.predict(X), но вместе с запросами, пришедшими в то же окно.
+        wait=False — окно не ждать, склеить только уже стоящие в очереди
+        (шаги прогноза на горизонт: конкурентные запросы и так идут в ногу).
+        """
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._queue.put_nowait(_Job(art, X, future, wait))
+        metrics_collector.set_queue_size("predict", self._queue.qsize())
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            rows = len(batch[0].X)
+            deadline = self._loop.time() + (self.max_wait if batch[0].wait else 0.0)
+            while rows < self.max_batch_rows:
+                timeout = deadline - self._loop.time()
+                try:
+                    if timeout > 0:
+                        job = await asyncio.wait_for(self._queue.get(), timeout)
+                    else:
+                        job = self._queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                batch.append(job)
+                rows += len(job.X)
+            metrics_collector.set_queue_size("predict", self._queue.qsize())
+
+            by_model = {}
+            for job in batch:
+                by_model.setdefault(id(job.art), []).append(job)
+            for jobs in by_model.values():
+                await self._flush(jobs)
+
+    async def _flush(self, jobs: List[_Job]):
+        """
+        Один predict на jobs. Любая ошибка (склейка, predict, нарезка) уходит
+        в future ещё не завершённых запросов: фоновая задача продолжает
+        работать, и ни один запрос батча не остаётся ждать вечно.
+        """
+        jobs = [j for j in jobs if not j.future.done()]   # клиент мог отключиться
+        if not jobs:
+            return
+        try:
+            X = jobs[0].X if len(jobs) == 1 else pd.concat([j.X for j in jobs], ignore_index=True)
+            metrics_collector.record_batch_size(len(X))
+            start_time = time.time()
+            pred = await stage_executor.run("predict", jobs[0].art.predict, X)
+            metrics_collector.record_prediction_time("lightgbm", time.time() - start_time)
+
+            bounds = np.cumsum([0] + [len(j.X) for j in jobs])
+            if len(pred) != bounds[-1]:
+                raise ValueError(f"predict вернул {len(pred)} значений на {bounds[-1]} строк")
+            for j, lo, hi in zip(jobs, bounds[:-1], bounds[1:]):
+                if not j.future.done():
+                    j.future.set_result(pred[lo:hi])
+        except Exception as e:
+            logger.warning(f"Ошибка батча predict ({len(jobs)} запросов): {str(e)}")
+            for j in jobs:
+                if not j.future.done():
+                    j.future.set_exception(e)
+
+
+# Глобальный батчер для всех запросов процесса
+predict_batcher = PredictBatcher()
@@ -0,0 +1,87 @@
+# src/bench_aggregate.py
+"""
+Бенчмарк пред-агрегации чеков до (товар, день): pandas groupby.agg
+против features.aggregate_daily (результаты заодно сверяются) и
+сколько строк остаётся признакам.
+
+    python bench_aggregate.py --skus 1000 --days 90 --receipts 2 10 50
+"""
+
+import argparse, time
+
+import numpy as np
+import pandas as pd
+
+from features import aggregate_daily
+
+
+def make_receipts(n_skus: int, days: int, receipts: int, seed: int = 42) -> pd.DataFrame:
+    """До receipts чеков на товар в день, вперемешку; Код известен не в каждом чеке"""
+    rng = np.random.default_rng(seed)
+    per_day = rng.integers(1, 2 * receipts, n_skus * days)
+    item = np.repeat(np.repeat(np.arange(n_skus), days), per_day)
+    day = np.repeat(np.tile(np.arange(days), n_skus), per_day)
+    n = len(item)
+    ts = (pd.Timestamp("2024-01-01").to_datetime64()
+          + day.astype("timedelta64[D]")
+          + rng.integers(8 * 3600, 22 * 3600, n).astype("timedelta64[s]"))
+    code = np.array([f"T{i:06d}" for i in range(n_skus)], dtype=object)[item]
+    code[rng.random(n) < 0.3] = None
+    df = pd.DataFrame({
+        "Номенклатура": np.array([f"Товар{i}" for i in range(n_skus)], dtype=object)[item],
+        "Период": ts,
+        "Количество": rng.integers(1, 5, n),
+        "Код": code,
+        "ВидНоменклатуры": "Продукты",
+        "Temp": rng.normal(10, 5, n).round(1),
+    })
+    return df.sample(frac=1.0, random_state=seed, ignore_index=True)
+
+
+def pandas_daily(df: pd.DataFrame) -> pd.DataFrame:
+    return (df.assign(Период=df["Период"].dt.normalize())
+              .groupby(["Номенклатура", "Период"], sort=True)
+              .agg(Количество=("Количество", "sum"), Код=("Код", "first"),
+                   ВидНоменклатуры=("ВидНоменклатуры", "first"), Temp=("Temp", "mean"))
+              .reset_index())
+
+
+def timeit(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_same(a: pd.DataFrame, b: pd.DataFrame):
+    assert len(a) == len(b), "разное число строк"
+    for col in a.columns:
+        x, y = a[col].to_numpy(), b[col].to_numpy()
+        if col == "Temp":
+            assert np.allclose(x.astype(float), y.astype(float)), f"расхождение в {col}"
+        else:
+            assert (pd.Series(x).fillna("") == pd.Series(y).fillna("")).all(), f"расхождение в {col}"
+
+
+def main(args):
+    print(f"{'чеков/день':>10} {'строк':>10} {'(товар, день)':>14} {'сжатие':>7} "
+          f"| {'groupby, s':>10} {'numpy, s':>9} {'x':>5}")
+    for receipts in args.receipts:
+        df = make_receipts(args.skus, args.days, receipts)
+        daily = aggregate_daily(df)
+        check_same(pandas_daily(df), daily)
+        t_pd = timeit(pandas_daily, df)
+        t_np = timeit(aggregate_daily, df)
+        print(f"{receipts:>10} {len(df):>10} {len(daily):>14} {len(df) / len(daily):>7.1f} "
+              f"| {t_pd:>10.3f} {t_np:>9.3f} {t_pd / t_np:>5.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, default=1000)
+    p.add_argument("--days", type=int, default=90)
+    p.add_argument("--receipts", type=int, nargs="+", default=[2, 10, 50],
+                   help="Среднее число чеков на товар в день")
+    main(p.parse_args())
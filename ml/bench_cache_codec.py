@@ -0,0 +1,51 @@
+# src/bench_cache_codec.py
+"""
+Бенчмарк сериализации ответов /forecast в кеше: pickle (прежний формат)
+против forecast_codec (колонки + сжатие) для каждой версии формата и
+каждого доступного сжатия.
+Показывает размер записи в Redis, время кодирования и декодирования;
+проверяет, что декодированный ответ совпадает с исходным.
+
+    python bench_cache_codec.py --skus 100 1000 20000
+"""
+
+import argparse, pickle
+
+from bench_response import make_frames, timeit
+from api_main import build_rows
+from series import SERIES_COL
+from forecast_codec import COMPRESSION_IDS, ENCODERS, ForecastCodec, lz4_frame, zstandard
+
+AVAILABLE = [name for name in COMPRESSION_IDS
+             if (name != "zstd" or zstandard is not None) and (name != "lz4" or lz4_frame is not None)]
+
+
+def make_answer(n_skus: int):
+    latest, sales_df, period_pred, keys = make_frames(n_skus, rows_per_sku=5)
+    head = {"MAPE": 21.6, "MAE": 3.338, "DaysPredict": 7}   # как в build_answer
+    return [head] + build_rows(latest[SERIES_COL].to_numpy(), keys, sales_df, period_pred,
+                               "2024-03-31 - 2024-04-06", 21.6, 3.338)
+
+
+def main(args):
+    print(f"{'SKU':>7} {'формат':>10} {'байт':>10} {'x':>6} {'encode, мс':>11} {'decode, мс':>11}")
+    for n in args.skus:
+        answer = make_answer(n)
+        blob = pickle.dumps(answer)
+        base = len(blob)
+        print(f"{n:>7} {'pickle':>10} {base:>10} {1:>6.1f} "
+              f"{timeit(pickle.dumps, answer) * 1e3:>11.3f} {timeit(pickle.loads, blob) * 1e3:>11.3f}")
+        for version in ENCODERS:
+            for name in AVAILABLE:
+                codec = ForecastCodec(version, compression=COMPRESSION_IDS[name])
+                blob = codec.encode(answer)
+                assert codec.decode(blob) == answer, f"v{version} {name}: ответ не совпадает после декодирования"
+                print(f"{'':>7} {f'v{version} {name}':>10} {len(blob):>10} {base / len(blob):>6.1f} "
+                      f"{timeit(codec.encode, answer) * 1e3:>11.3f} "
+                      f"{timeit(codec.decode, blob) * 1e3:>11.3f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, nargs="+", default=[100, 1000, 20000])
+    main(p.parse_args())
@@ -0,0 +1,70 @@
+# src/bench_cache_key.py
+"""
+Бенчмарк ключей кеша /forecast на запросах разного размера.
+Сравнивает прежний ключ (pydantic-разбор + json.dumps всех s.dict() +
+sha256) с ключом по хешу сырого тела и отпечатками рядов (series_digests,
+считаются по уже разобранному кадру — так их строит /forecast/batch),
+а также с полным путём промаха кеша (разбор, признаки, predict, ответ).
+Путь попадания (ключ по телу) должен быть дешевле промаха при любом
+размере запроса.
+
+    python bench_cache_key.py --events 1000 10000 100000
+"""
+
+import argparse, hashlib, json, pathlib
+
+from bench_horizon import rollout
+from bench_parse import legacy_adapter, make_body, timeit
+from api_main import DaysHeader, SaleEvt, build_answer, daily_sales
+from cache_manager import cache_manager
+from events import parse_events_json
+from features import LagMaker
+from model_artifact import load_latest
+from series import SERIES_COL
+
+
+def legacy_key(body: bytes) -> str:
+    payload = legacy_adapter.validate_json(body)
+    horizon = next(p for p in payload if isinstance(p, DaysHeader)).DaysCount
+    sales = [p for p in payload if isinstance(p, SaleEvt)]
+    data_str = json.dumps([s.dict() for s in sales], sort_keys=True, default=str)
+    return hashlib.sha256(f"{data_str}:{horizon}:".encode()).hexdigest()
+
+
+def body_key(body: bytes) -> str:
+    hasher = hashlib.blake2b(digest_size=20)
+    for i in range(0, len(body), 65536):   # как при чтении request.stream()
+        hasher.update(body[i:i + 65536])
+    return hashlib.sha256(f"{hasher.hexdigest()}:None:".encode()).hexdigest()
+
+
+def frame_key(sales_df) -> str:
+    return cache_manager.generate_frame_cache_key(sales_df, 7)
+
+
+def miss_path(art, body: bytes):
+    horizon, sales_df = parse_events_json(body, DaysHeader)
+    sales_df, keys = daily_sales(sales_df)
+    latest, history = LagMaker(group_col=SERIES_COL).transform_latest_history(sales_df)
+    series = latest[SERIES_COL].to_numpy()
+    latest["ItemEnc"] = keys.encode_items(art.encoder)[series]
+    day_pred = rollout(art, latest, history, horizon)
+    return build_answer(art, series, keys, sales_df, day_pred, horizon)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--events", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    p.add_argument("--models", type=pathlib.Path, default=pathlib.Path("models"))
+    args = p.parse_args()
+    art = load_latest(args.models)
+
+    print(f"{'events':>8} {'legacy key':>11} {'body key':>9} {'frame key':>10} {'miss path':>10}")
+    for n in args.events:
+        body = make_body(n)
+        t_legacy = timeit(legacy_key, body)
+        t_body = timeit(body_key, body)
+        t_frame = timeit(frame_key, parse_events_json(body, DaysHeader)[1])
+        t_miss = timeit(miss_path, art, body)
+        print(f"{n:>8} {t_legacy:>11.4f} {t_body:>9.4f} {t_frame:>10.4f} {t_miss:>10.4f}")
+        assert t_body < t_miss, "ключ по телу не должен стоить как промах"
@@ -0,0 +1,109 @@
+# src/bench_features.py
+"""
+Бенчмарк построения признаков (результаты заодно сверяются):
+  • обучение — прежний pandas-вариант LagMaker.transform (groupby.shift /
+    rolling / transform(lambda)) против плотной сетки DayGrid;
+  • инференс — transform(...).groupby("Номенклатура").tail(1) против
+    LagMaker.transform_latest(...).
+
+    python bench_features.py --skus 1000 5000 --days 365
+"""
+
+import argparse, time
+
+import numpy as np
+import pandas as pd
+
+from features import LagMaker
+
+
+def make_history(n_skus: int, days: int, shuffle: bool = False,
+                 seed: int = 42) -> pd.DataFrame:
+    """История «как в выгрузке»: по дням, внутри дня — все товары."""
+    rng = np.random.default_rng(seed)
+    items = np.array([f"Товар{i}" for i in range(n_skus)], dtype=object)
+    df = pd.DataFrame({
+        "Номенклатура": np.repeat(items, days),
+        "Период": np.tile(pd.date_range("2024-01-01", periods=days), n_skus),
+        "Количество": rng.integers(0, 50, n_skus * days),
+        "Код": np.repeat([f"T{i:06d}" for i in range(n_skus)], days).astype(object),
+        "ВидНоменклатуры": "Продукты",
+    }).sort_values("Период", kind="stable", ignore_index=True)
+    return df.sample(frac=1.0, random_state=seed) if shuffle else df
+
+
+def legacy_transform(X: pd.DataFrame) -> pd.DataFrame:
+    """LagMaker.transform до перехода на GroupIndex (без экзогенных)"""
+    df = X.copy()
+    if not np.issubdtype(df["Период"].dtype, np.datetime64):
+        df["Период"] = pd.to_datetime(df["Период"])
+
+    df = df.sort_values(["Номенклатура", "Период"])
+    g_sales = df.groupby("Номенклатура")["Количество"]
+    for lag in (7, 14, 30, 60):
+        df[f"lag_{lag}"] = g_sales.shift(lag).fillna(0)
+    for win in (7, 30):
+        df[f"ma_{win}"] = (
+            g_sales.rolling(win).mean().reset_index(0, drop=True).fillna(0)
+        )
+    df["trend_7"] = g_sales.transform(
+        lambda s: (s - s.shift(7)).fillna(0) / 7
+    )
+    df["dow"]     = df["Период"].dt.dayofweek
+    df["weeknum"] = df["Период"].dt.isocalendar().week.astype(int)
+    df["month"]   = df["Период"].dt.month
+    df["quarter"] = df["Период"].dt.quarter
+    df["year"]    = df["Период"].dt.year
+    return df.fillna(0.0)
+
+
+def numpy_transform(df: pd.DataFrame) -> pd.DataFrame:
+    return LagMaker().transform(df)
+
+
+def full_then_tail(df: pd.DataFrame) -> pd.DataFrame:
+    return LagMaker().transform(df).groupby("Номенклатура").tail(1)
+
+
+def latest_only(df: pd.DataFrame) -> pd.DataFrame:
+    return LagMaker().transform_latest(df)
+
+
+def timeit(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_same(a: pd.DataFrame, b: pd.DataFrame):
+    assert list(a.columns) == list(b.columns), "разный набор колонок"
+    assert a.index.equals(b.index), "разный порядок строк"
+    for col in a.columns:
+        assert (a[col].to_numpy() == b[col].to_numpy()).all(), f"расхождение в {col}"
+
+
+def main(args):
+    print(f"{'SKU':>7} {'строк':>10} | {'pandas, s':>10} {'numpy, s':>9} {'x':>5} "
+          f"| {'transform+tail, s':>18} {'transform_latest, s':>20} {'x':>5}")
+    for n in args.skus:
+        df = make_history(n, args.days, args.shuffle)
+        check_same(legacy_transform(df), numpy_transform(df))
+        check_same(full_then_tail(df), latest_only(df))
+        t_pd = timeit(legacy_transform, df)
+        t_np = timeit(numpy_transform, df)
+        t_full = timeit(full_then_tail, df)
+        t_last = timeit(latest_only, df)
+        print(f"{n:>7} {len(df):>10} | {t_pd:>10.3f} {t_np:>9.3f} {t_pd / t_np:>5.1f} "
+              f"| {t_full:>18.3f} {t_last:>20.3f} {t_full / t_last:>5.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, nargs="+", default=[1000, 5000])
+    p.add_argument("--days", type=int, default=365)
+    p.add_argument("--shuffle", action="store_true",
+                   help="Перемешать строки (худший случай для сортировки)")
+    main(p.parse_args())
@@ -0,0 +1,63 @@
+# src/bench_horizon.py
+"""
+Бенчмарк рекурсивного прогноза на горизонт (horizon.HorizonRoller).
+На N товарах с историей rows_per_sku дней меряет: признаки последней
+даты + хвост истории (transform_latest_history) и прогон на H дней —
+H батчевых predict по всем товарам. Для сравнения — прежний прогноз
+«суточный × H» (один predict) и оценка H × N одиночных predict по
+времени predict одной строки.
+
+    python bench_horizon.py --skus 1000 10000 --horizons 7 30 60
+"""
+
+import argparse, pathlib, time
+
+import numpy as np
+
+from bench_response import make_frames, timeit
+from features import LagMaker
+from horizon import HorizonRoller
+from model_artifact import load_latest
+
+
+def rollout(art, latest, history, horizon: int) -> np.ndarray:
+    """Синхронный аналог api_main.predict_horizon (без микро-батчера)"""
+    roller = HorizonRoller(latest, history, art.feature_cols)
+    out = np.empty((len(latest), horizon))
+    for day in range(horizon):
+        out[:, day] = np.clip(art.predict(roller.frame()), 0, None)
+        if day + 1 < horizon:
+            roller.step(out[:, day])
+    return out
+
+
+def prepare(art, n_skus: int, rows_per_sku: int):
+    _, sales_df, _, _ = make_frames(n_skus, rows_per_sku)
+    latest, history = LagMaker().transform_latest_history(sales_df)
+    latest["ItemEnc"] = art.encoder.encode(latest["Номенклатура"])
+    return sales_df, latest, history
+
+
+def main(args):
+    art = load_latest(args.models)
+    print(f"{'SKU':>7} {'H':>4} {'признаки, s':>12} {'прогон, s':>10} {'мс/день':>8} "
+          f"{'суточный×H, s':>14} {'H×N одиночных, s (оценка)':>27}")
+    for n in args.skus:
+        sales_df, latest, history = prepare(art, n, args.rows_per_sku)
+        t_feat = timeit(LagMaker().transform_latest_history, sales_df)
+        one = latest[art.feature_cols].iloc[:1]
+        t_single = timeit(art.predict, one, repeat=20)
+        t_daily = timeit(art.predict, latest[art.feature_cols])
+        for h in args.horizons:
+            t_roll = timeit(rollout, art, latest, history, h)
+            print(f"{n:>7} {h:>4} {t_feat:>12.3f} {t_roll:>10.3f} {t_roll / h * 1e3:>8.2f} "
+                  f"{t_daily:>14.3f} {t_single * n * h:>27.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, nargs="+", default=[1000, 10000])
+    p.add_argument("--horizons", type=int, nargs="+", default=[7, 30, 60])
+    p.add_argument("--rows-per-sku", type=int, default=120)
+    p.add_argument("--models", type=pathlib.Path, default=pathlib.Path("models"))
+    main(p.parse_args())
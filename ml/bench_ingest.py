@@ -0,0 +1,157 @@
+# src/bench_ingest.py
+"""
+Бенчмарк чтения выгрузки продаж для обучения: прежний pd.read_csv всех
+колонок + pd.to_datetime(dayfirst=True) и json.load всего массива
+против ingest.py (многопоточный pyarrow.csv с проекцией колонок, разбор
+Периода по формату, Количество в int32, JSON потоком). Каждый загрузчик
+запускается в отдельном процессе — видно его время и пиковый RSS;
+результаты на небольшой выгрузке заодно сверяются.
+
+    python bench_ingest.py --rows 10000000 --json-rows 1000000 --dir /tmp/ingest
+"""
+
+import argparse, json, multiprocessing, multiprocessing.forkserver, pathlib, resource, time
+
+import numpy as np
+import pandas as pd
+
+from ingest import SALES_COLS, parse_period, read_sales_csv, read_sales_json
+
+
+def make_export(n_rows: int, n_skus: int = 10_000, seed: int = 42) -> pd.DataFrame:
+    """Выгрузка 1С: DD.MM.YYYY, кириллица и лишние для обучения колонки"""
+    rng = np.random.default_rng(seed)
+    item = rng.integers(0, n_skus, n_rows)
+    dates = pd.date_range("2022-01-01", periods=730).strftime("%d.%m.%Y").to_numpy(dtype=object)
+    return pd.DataFrame({
+        "Type": "Продажа",
+        "Период": dates[rng.integers(0, len(dates), n_rows)],
+        "Номенклатура": np.array([f"Товар молочный №{i}" for i in range(n_skus)], dtype=object)[item],
+        "Код": np.array([f"T{i:07d}" for i in range(n_skus)], dtype=object)[item],
+        "ВидНоменклатуры": "Молочная продукция",
+        "Адрес_точки": np.array([f"г. Москва, ул. Ленина, д. {s}" for s in range(20)],
+                                dtype=object)[rng.integers(0, 20, n_rows)],
+        "Количество": rng.integers(1, 20, n_rows),
+        "Сумма": rng.integers(50, 5000, n_rows) / 10,
+        "Комментарий": "",
+    })
+
+
+def _parts(n_rows: int, part: int = 1_000_000):
+    for i, start in enumerate(range(0, n_rows, part)):
+        yield make_export(min(part, n_rows - start), seed=i)
+
+
+def write_csv(path: pathlib.Path, n_rows: int):
+    """Выгрузка кусками по миллиону строк — генерация не держит её в памяти целиком"""
+    import pyarrow as pa, pyarrow.csv as pa_csv
+    writer = None
+    for df in _parts(n_rows):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        writer = writer or pa_csv.CSVWriter(path, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+
+def write_json(path: pathlib.Path, n_rows: int):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        sep = ""
+        for df in _parts(n_rows):
+            for rec in df.to_dict("records"):
+                f.write(sep + json.dumps(rec, ensure_ascii=False) + "\n")
+                sep = ","
+        f.write("]\n")
+
+
+def legacy_csv(path: pathlib.Path) -> pd.DataFrame:
+    df = pd.read_csv(path)
+    df["Период"] = pd.to_datetime(df["Период"], dayfirst=True, errors="coerce")
+    return df
+
+
+def new_csv(path: pathlib.Path) -> pd.DataFrame:
+    df = read_sales_csv(path)
+    df["Период"] = parse_period(df["Период"])
+    return df
+
+
+def legacy_json(path: pathlib.Path) -> pd.DataFrame:
+    events = json.load(open(path, encoding="utf-8"))
+    df = pd.DataFrame([e for e in events if e.get("Type") == "Продажа"])
+    df["Период"] = pd.to_datetime(df["Период"], dayfirst=True, errors="coerce")
+    return df
+
+
+def new_json(path: pathlib.Path) -> pd.DataFrame:
+    df = read_sales_json(path)
+    df["Период"] = parse_period(df["Период"])
+    return df
+
+
+def _child(fn, path, queue):
+    t0 = time.perf_counter()
+    df = fn(path)
+    queue.put((time.perf_counter() - t0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+               df.memory_usage(deep=True).sum() / 2**20))
+
+
+def measure(fn, path: pathlib.Path):
+    """(секунды, пиковый RSS процесса МБ, размер кадра МБ) — в отдельном процессе"""
+    ctx = multiprocessing.get_context("forkserver")
+    queue = ctx.Queue()
+    proc = ctx.Process(target=_child, args=(fn, path, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def check_same(old: pd.DataFrame, new: pd.DataFrame):
+    assert list(new.columns) == [c for c in SALES_COLS if c in old.columns], "лишние колонки"
+    for col in new.columns:
+        a, b = old[col].to_numpy(), new[col].to_numpy()
+        assert (a == b).all(), f"расхождение в {col}"
+
+
+def main(args):
+    # ru_maxrss наследуется через fork/exec: процессы замеров порождаются
+    # сервером, запущенным до того, как выгрузки сгенерированы в памяти
+    multiprocessing.set_start_method("forkserver")
+    multiprocessing.forkserver.ensure_running()
+    args.dir.mkdir(parents=True, exist_ok=True)
+    write_csv(args.dir / "check.csv", 200_000)
+    write_json(args.dir / "check.json", 200_000)
+    check_same(legacy_csv(args.dir / "check.csv"), new_csv(args.dir / "check.csv"))
+    check_same(legacy_json(args.dir / "check.json"), new_json(args.dir / "check.json"))
+
+    runs = []
+    if args.rows:
+        path = args.dir / f"export-{args.rows}.csv"
+        if not path.exists():
+            write_csv(path, args.rows)
+        runs.append((f"CSV {args.rows}", path, legacy_csv, new_csv))
+    if args.json_rows:
+        path = args.dir / f"export-{args.json_rows}.json"
+        if not path.exists():
+            write_json(path, args.json_rows)
+        runs.append((f"JSON {args.json_rows}", path, legacy_json, new_json))
+
+    print(f"{'вход':>16} {'МБ':>6} | {'прежде, s':>9} {'RSS, МБ':>8} {'кадр, МБ':>8} "
+          f"| {'ingest, s':>9} {'RSS, МБ':>8} {'кадр, МБ':>8} {'x':>5}")
+    for name, path, old, new in runs:
+        t_old, rss_old, mem_old = measure(old, path)
+        t_new, rss_new, mem_new = measure(new, path)
+        print(f"{name:>16} {path.stat().st_size / 2**20:>6.0f} "
+              f"| {t_old:>9.2f} {rss_old:>8.0f} {mem_old:>8.0f} "
+              f"| {t_new:>9.2f} {rss_new:>8.0f} {mem_new:>8.0f} {t_old / t_new:>5.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=10_000_000, help="Строк в CSV-выгрузке (0 — пропустить)")
+    p.add_argument("--json-rows", type=int, default=1_000_000,
+                   help="Событий в JSON-выгрузке (0 — пропустить)")
+    p.add_argument("--dir", type=pathlib.Path, default=pathlib.Path("/tmp/ingest"),
+                   help="Каталог для сгенерированных выгрузок")
+    main(p.parse_args())
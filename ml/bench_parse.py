@@ -0,0 +1,96 @@
+# src/bench_parse.py
+"""
+Бенчмарк разбора JSON-тела /forecast.
+Сравнивает прежний путь (TypeAdapter(List[Union[DaysHeader, SaleEvt, SuppEvt]])
++ DataFrame из s.dict()) с однопроходным разбором events.parse_events_json
+на запросе из N событий (продажи с полным набором колонок + поставки)
+и проверяет, что продажи получаются одинаковыми.
+
+    python bench_parse.py --events 10000 100000
+"""
+
+import argparse, json, time
+from typing import List, Union
+
+import numpy as np
+import pandas as pd
+from pydantic import TypeAdapter
+
+from api_main import DaysHeader, SaleEvt, SuppEvt
+from events import NEEDED_COLS, parse_events_json
+
+legacy_adapter = TypeAdapter(List[Union[DaysHeader, SaleEvt, SuppEvt]])
+
+
+def make_body(n_events: int, n_skus: int = 500, supply_share: float = 0.1, seed: int = 42) -> bytes:
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2023-01-01", periods=365).strftime("%Y-%m-%d")
+    events: list = [{"DaysCount": 7}]
+    for i in range(n_events):
+        sku = int(rng.integers(n_skus))
+        evt = {
+            "Type": "Поставка" if rng.random() < supply_share else "Продажа",
+            "Период": dates[int(rng.integers(len(dates)))],
+            "Номенклатура": f"Товар{sku}",
+            "Количество": int(rng.integers(1, 20)),
+            "Код": f"T{sku:06d}",
+            "ВидНоменклатуры": "Продукты",
+            "Поставщик": "ООО Поставщик",
+            "Вес": 0.5,
+            "Сумма": 120.0,
+            "Адрес_точки": "ул. Ленина, 1",
+            "Наличие_товара": True,
+            "Остаток_в_магазине": int(rng.integers(0, 100)),
+        }
+        if evt["Type"] == "Поставка":
+            evt["Цена"] = 99.9
+        events.append(evt)
+    return json.dumps(events, ensure_ascii=False).encode()
+
+
+def legacy_parse(body: bytes):
+    payload = legacy_adapter.validate_json(body)
+    horizon = next(p for p in payload if isinstance(p, DaysHeader)).DaysCount
+    sales = [p for p in payload if isinstance(p, SaleEvt)]
+    # smart-режим Union относит к SaleEvt и поставки с полями продажи
+    # (Поставщик, Вес, ...) — для сравнения отбрасываем их по Type
+    sales = [s for s in sales if s.Type != "Поставка"]
+    sales_df = pd.DataFrame([s.dict() for s in sales])
+    sales_df["Период"] = pd.to_datetime(sales_df["Период"])
+    return horizon, sales_df
+
+
+def fast_parse(body: bytes):
+    return parse_events_json(body, DaysHeader)
+
+
+def timeit(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def check_same(body: bytes):
+    h1, old = legacy_parse(body)
+    h2, new = fast_parse(body)
+    assert h1 == h2
+    cols = [c for c in NEEDED_COLS if c in new.columns]
+    old = old[cols].astype({"Период": new["Период"].dtype})
+    pd.testing.assert_frame_equal(old.reset_index(drop=True), new[cols], check_dtype=False)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--events", type=int, nargs="+", default=[10_000, 100_000])
+    args = p.parse_args()
+
+    print(f"{'events':>8} {'MB':>6} {'legacy, s':>10} {'fast, s':>8} {'x':>6}")
+    for n in args.events:
+        body = make_body(n)
+        check_same(body)
+        t_old = timeit(legacy_parse, body)
+        t_new = timeit(fast_parse, body)
+        print(f"{n:>8} {len(body) / 2**20:>6.1f} {t_old:>10.3f} {t_new:>8.3f} {t_old / t_new:>6.1f}")
@@ -0,0 +1,93 @@
+# src/bench_response.py
+"""
+Микро-бенчмарк сборки ответа /forecast (строки Row).
+Сравнивает прежний цикл iterrows + фильтрация sales_df по каждому товару
+с build_rows (один groupby-проход) и показывает время на один SKU:
+у build_rows оно должно оставаться примерно постоянным при росте числа SKU.
+
+    python bench_response.py --skus 1000 5000 20000 --legacy-max 5000
+"""
+
+import argparse, time
+
+import numpy as np
+import pandas as pd
+
+from api_main import build_rows, Row
+from series import SERIES_COL, intern_series
+
+
+def make_frames(n_skus: int, rows_per_sku: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    items = np.array([f"Товар{i}" for i in range(n_skus)], dtype=object)
+    sales_df = pd.DataFrame({
+        "Номенклатура": np.repeat(items, rows_per_sku),
+        "Период": np.tile(pd.date_range("2024-01-01", periods=rows_per_sku), n_skus),
+        "Количество": rng.integers(0, 50, n_skus * rows_per_sku),
+        "Код": np.repeat([f"T{i:06d}" for i in range(n_skus)], rows_per_sku).astype(object),
+        "ВидНоменклатуры": np.repeat(["Продукты"] * n_skus, rows_per_sku).astype(object),
+    })
+    # часть метаданных пустая — проверяем выбор первого непустого значения
+    sales_df.loc[sales_df.index % 3 == 0, "Код"] = None
+    sales_df[SERIES_COL], keys = intern_series(sales_df)
+    latest = sales_df.groupby(SERIES_COL).tail(1)
+    period_pred = rng.integers(0, 500, len(latest))
+    return latest, sales_df, period_pred, keys
+
+
+def legacy_rows(latest, sales_df, period_pred, day_pred, period_str, mape, mae):
+    rows = []
+    for (_, row), qty, days in zip(latest.iterrows(), period_pred, day_pred):
+        subset = sales_df[sales_df["Номенклатура"] == row["Номенклатура"]]
+        vis = subset["ВидНоменклатуры"].dropna().head(1)
+        name = vis.iloc[0] if not vis.empty else row["Номенклатура"]
+        code = subset["Код"].dropna().head(1)
+        rows.append(Row(
+            Период=period_str,
+            Номенклатура=name,
+            Код=code.iloc[0] if not code.empty else None,
+            MAPE=mape,
+            MAE=mae,
+            Количество=int(qty),
+            КоличествоПоДням=np.round(days, 2).tolist()
+        ).dict(exclude={"Адрес_точки"}))   # запрос без точек продаж
+    return rows
+
+
+def timeit(fn, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(args):
+    period_str = "2024-03-31 - 2024-04-06"
+    print(f"{'SKU':>8} {'build_rows, s':>14} {'мкс/SKU':>9} {'legacy, s':>11} {'мкс/SKU':>9}")
+    for n in args.skus:
+        latest, sales_df, period_pred, keys = make_frames(n, args.rows_per_sku)
+        day_pred = np.repeat(period_pred[:, None] / 7, 7, axis=1)   # неделя по дням
+        frames = latest, sales_df, period_pred, day_pred
+        series = latest[SERIES_COL].to_numpy()
+        t_new = timeit(build_rows, series, keys, sales_df, period_pred,
+                       period_str, 21.6, 3.338, day_pred)
+        line = f"{n:>8} {t_new:>14.4f} {t_new / n * 1e6:>9.2f}"
+        if n <= args.legacy_max:
+            new = build_rows(series, keys, sales_df, period_pred,
+                             period_str, 21.6, 3.338, day_pred)
+            old = legacy_rows(*frames, period_str, 21.6, 3.338)
+            assert new == old, "build_rows расходится с прежней реализацией"
+            t_old = timeit(legacy_rows, *frames, period_str, 21.6, 3.338, repeat=1)
+            line += f" {t_old:>11.4f} {t_old / n * 1e6:>9.2f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, nargs="+", default=[1000, 5000, 20000])
+    p.add_argument("--rows-per-sku", type=int, default=30)
+    p.add_argument("--legacy-max", type=int, default=5000,
+                   help="Не гонять старый (квадратичный) вариант на большем числе SKU")
+    main(p.parse_args())
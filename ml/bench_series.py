@@ -0,0 +1,77 @@
+# src/bench_series.py
+"""
+Бенчмарк интернированных ключей рядов: группировка и сортировка по
+строковой Номенклатуре против int32-номера ряда series.SERIES_COL
+(признаки последней даты — LagMaker.transform_latest, пред-агрегация
+чеков — aggregate_daily). Время интернирования (один factorize на
+колонку) показано отдельно; результаты заодно сверяются.
+
+    python bench_series.py --skus 1000 10000 --days 100 --stores 1 4
+"""
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from bench_aggregate import timeit
+from features import LagMaker, aggregate_daily
+from series import SERIES_COL, intern_series
+
+
+def make_sales(n_skus: int, days: int, stores: int, seed: int = 42) -> pd.DataFrame:
+    """n_skus × stores рядов по days дней, строки вперемешку; названия — кириллица"""
+    rng = np.random.default_rng(seed)
+    n_series = n_skus * stores
+    item = np.repeat(np.arange(n_series) // stores, days)
+    n = len(item)
+    df = pd.DataFrame({
+        "Номенклатура": pd.array(np.array([f"Молоко пастеризованное 3,2% №{i}"
+                                           for i in range(n_skus)])[item], dtype="str"),
+        "Период": pd.Timestamp("2024-01-01").to_datetime64()
+                  + np.tile(np.arange(days), n_series).astype("timedelta64[D]"),
+        "Количество": rng.integers(0, 20, n),
+    })
+    if stores > 1:
+        df["Адрес_точки"] = pd.array(np.array([f"г. Москва, ул. Тверская, д. {s}"
+                                               for s in range(stores)])[np.repeat(np.arange(n_series) % stores, days)],
+                                     dtype="str")
+    return df.sample(frac=1.0, random_state=seed, ignore_index=True)
+
+
+def interned(df: pd.DataFrame) -> pd.DataFrame:
+    codes, _ = intern_series(df, by_store=True)
+    return df.assign(**{SERIES_COL: codes})
+
+
+def main(args):
+    print(f"{'SKU':>7} {'точек':>6} {'строк':>9} {'intern, s':>10} "
+          f"| {'latest str, s':>13} {'int32, s':>9} {'x':>5} "
+          f"| {'aggr str, s':>11} {'int32, s':>9} {'x':>5}")
+    for stores in args.stores:
+        for n_skus in args.skus:
+            df = make_sales(n_skus, args.days, stores)
+            t_int = timeit(interned, df)
+            ddf = interned(df)
+            by_item, by_series = LagMaker(), LagMaker(group_col=SERIES_COL)
+            if stores == 1:   # ряд = товар: признаки совпадают
+                a = by_item.transform_latest(df)
+                b = by_series.transform_latest(ddf)
+                assert np.array_equal(a["Количество"].to_numpy(), b["Количество"].to_numpy())
+                assert np.array_equal(a["ma_30"].to_numpy(), b["ma_30"].to_numpy()), "расхождение в ma_30"
+            t_ls = timeit(by_item.transform_latest, df)
+            t_li = timeit(by_series.transform_latest, ddf)
+            t_as = timeit(aggregate_daily, df)
+            t_ai = timeit(aggregate_daily, ddf, SERIES_COL)
+            print(f"{n_skus:>7} {stores:>6} {len(df):>9} {t_int:>10.3f} "
+                  f"| {t_ls:>13.3f} {t_li:>9.3f} {t_ls / t_li:>5.1f} "
+                  f"| {t_as:>11.3f} {t_ai:>9.3f} {t_as / t_ai:>5.1f}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser()
+    p.add_argument("--skus", type=int, nargs="+", default=[1_000, 10_000])
+    p.add_argument("--days", type=int, default=100)
+    p.add_argument("--stores", type=int, nargs="+", default=[1, 4],
+                   help="Точек на товар (1 — запрос без Адрес_точки)")
+    main(p.parse_args())
@@ -1,150 +1,1020 @@
+import asyncio
 import hashlib
 import json
-import pickle
+import os
 import logging
-from typing import Any, Optional, Dict, List
+import time
+import zlib
+from typing import Any, Optional, Dict, List, NamedTuple
 from datetime import datetime, timedelta
-import redis
+import numpy as np
+import pandas as pd
+import redis.asyncio as aioredis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import LockError
 from fastapi import HTTPException
 from pydantic import BaseModel
 
+from features import GroupIndex, LagMaker
+from forecast_codec import DecodeError, forecast_codec
+from executor import stage_executor
+from local_cache import LocalCache
+from series import SERIES_COL, SeriesKeys, intern_series
+from metrics import metrics_collector
+
 logger = logging.getLogger(__name__)
 
+# Колонки, от которых зависит прогноз ряда (см. events.NEEDED_COLS)
+DIGEST_COLS = ["Период", "Количество", "Код", "ВидНоменклатуры"] + LagMaker().exog_cols
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    """Финализатор splitmix64 (векторно, с переполнением по модулю 2**64)"""
+    z = x + _GOLDEN
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def series_digests(sales_df: pd.DataFrame, keys: SeriesKeys = None) -> pd.Series:
+    """
+    Отпечаток истории каждого ряда: {ряд: 32 hex-символа}; ряд — номер
+    SERIES_COL, а при заданной таблице keys — его метка keys.labels
+    (товар или «товар\tточка», по ней строятся ключи кеша).
+    Строки хешируются векторно (hash_pandas_object по DIGEST_COLS) и
+    сворачиваются в порядке (ряд, Период) двумя независимыми суммами,
+    зависящими от позиции строки в ряду. Порядок событий в запросе и
+    лишние поля на отпечаток не влияют; любое изменение продаж ряда — влияет.
+    """
+    if sales_df.empty:
+        return pd.Series([], dtype=object)
+    cols = [c for c in DIGEST_COLS if c in sales_df.columns]
+    rows = pd.util.hash_pandas_object(sales_df[cols], index=False).to_numpy()
+    gi = GroupIndex(sales_df[SERIES_COL], sales_df["Период"])
+    h = rows[gi.pos]
+    rank = gi.rank.astype(np.uint64)
+    d1 = np.add.reduceat(_mix64(h + rank * _GOLDEN), gi.starts)
+    d2 = np.add.reduceat(_mix64(h ^ _mix64(rank)), gi.starts)
+    series = sales_df[SERIES_COL].to_numpy()[gi.pos[gi.starts]]
+    items = series if keys is None else keys.labels(series)
+    return pd.Series([f"{a:016x}{b:016x}" for a, b in zip(d1.tolist(), d2.tolist())],
+                     index=items, dtype=object)
+
+class WarmupRecipe(NamedTuple):
+    """Частый запрос /forecast, сохранённый для прогрева"""
+    recipe_id: str
+    hits: float
+    content_type: str
+    horizon: Optional[int]   # None — горизонт внутри JSON-тела
+    org: str
+    body_digest: str
+    body: bytes
+    by_store: bool   # ряды по точкам продаж (X-Per-Store)
+
+class CircuitBreaker:
+    """
+    Предохранитель для Redis: после max_failures ошибок подряд размыкается,
+    и операции кеша сразу отвечают промахом, не дожидаясь таймаутов.
+    Замыкается фоновым переподключением (CacheManager._reconnect).
+    """
+
+    def __init__(self, max_failures: int, reset_seconds: float):
+        self.max_failures = max_failures
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+
+    @property
+    def open(self) -> bool:
+        return self.opened_at is not None
+
+    def success(self):
+        self.failures = 0
+
+    def failure(self) -> bool:
+        """Учитывает ошибку; True — предохранитель только что разомкнулся"""
+        self.failures += 1
+        if self.failures >= self.max_failures and not self.open:
+            self.trip()
+            return True
+        return False
+
+    def trip(self):
+        self.opened_at = time.monotonic()
+        metrics_collector.set_cache_circuit_open(True)
+
+    def close(self):
+        self.failures = 0
+        self.opened_at = None
+        metrics_collector.set_cache_circuit_open(False)
+
+
 class CacheManager:
+    """
+    Кеш прогнозов: локальный уровень (local_cache) + Redis через асинхронный
+    пул redis.asyncio. Размер пула ограничен (REDIS_POOL_SIZE), у каждой
+    операции свой таймаут (REDIS_OP_TIMEOUT, с; служебные операции —
+    REDIS_ADMIN_TIMEOUT), ошибки размыкают CircuitBreaker (REDIS_BREAKER_FAILURES
+    ошибок подряд), после чего фоновая задача переподключается с
+    экспоненциальной задержкой от REDIS_BREAKER_RESET с. Недоступный Redis
+    никогда не роняет запрос и не задерживает его дольше таймаута операции.
+    Ответ свеж default_ttl секунд и ещё CACHE_STALE_TTL отдаётся устаревшим;
+    попадание в устаревший ответ продлевает его (ключ — по содержимому и
+    версии модели, пересчёт дал бы тот же ответ). Частые запросы
+    прогреваются после смены модели.
+    """
+    MGET_CHUNK = 1000   # ключей в одной команде MGET
+    SKU_CHUNK = 1000    # прогнозов по рядам в одном конвейере (своя операция со своим таймаутом)
+    # ответы крупнее кодируются в пуле stage_executor (десятки мс на 20k строк),
+    # мелкие — прямо в event loop: переход в поток дороже самого кодирования
+    CODEC_INLINE_ROWS = 1000
+    CODEC_INLINE_BYTES = 64 * 1024
+    MAX_RECONNECT_DELAY = 60.0
+    RECIPE_TOTAL = "_total"        # поле суммы в учёте объёма тел прогрева
+    RECIPE_RECONCILE_EVERY = 60.0  # не чаще раза в столько секунд сверять учёт с телами
+    
     def __init__(self, redis_url: str = None):
-        import os
         if redis_url is None:
             redis_url = os.getenv('REDIS_URL', 'redis://localhost:6379')
-        try:
-            self.redis_client = redis.Redis.from_url(redis_url, decode_responses=False, socket_connect_timeout=5)
-            # Проверяем подключение
-            self.redis_client.ping()
-            logger.info(f"Successfully connected to Redis at {redis_url}")
-        except Exception as e:
-            logger.error(f"Failed to connect to Redis: {str(e)}")
-            self.redis_client = None
-        self.async_redis = None
+        self.redis_url = redis_url
+        self.pool_size = int(os.getenv("REDIS_POOL_SIZE", "20"))
+        self.op_timeout = float(os.getenv("REDIS_OP_TIMEOUT", "0.25"))
+        # ожидание свободного соединения — отдельно от таймаута операции:
+        # пул занят при пиковой нагрузке, а не при отказе Redis
+        self.pool_timeout = float(os.getenv("REDIS_POOL_TIMEOUT", "0.5"))
+        self.admin_timeout = float(os.getenv("REDIS_ADMIN_TIMEOUT", "30"))
+        self.connect_timeout = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0.5"))
+        self.breaker = CircuitBreaker(int(os.getenv("REDIS_BREAKER_FAILURES", "3")),
+                                      float(os.getenv("REDIS_BREAKER_RESET", "5")))
+        # клиент и фоновые задачи привязаны к event loop, в котором созданы
+        self.redis_client = None
+        self._loop = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._subscriber: Optional[asyncio.Task] = None
         self.cache_prefix = "ml_forecast:"
         self.default_ttl = 3600  # 1 час
-        
-    async def get_async_redis(self):
-        # Для простоты используем синхронный Redis клиент
+        # после default_ttl ответ ещё stale_ttl секунд отдаётся из кеша, и
+        # попадание продлевает его ещё на default_ttl + stale_ttl: ключ
+        # адресован содержимым запроса и версией модели, так что ответ
+        # по-прежнему верен, а пересчёт ничего бы не изменил
+        self.stale_ttl = int(os.getenv("CACHE_STALE_TTL", "3600"))
+        self.index_prefix = f"{self.cache_prefix}idx:"
+        self.stats_key = f"{self.index_prefix}stats"
+        # локальный уровень перед Redis; инвалидации расходятся по репликам
+        # через канал invalidate_channel
+        self.local = LocalCache()
+        self.invalidate_channel = f"{self.cache_prefix}invalidate"
+        # single-flight: одинаковые ответы в процессе считаются один раз, между
+        # репликами — под короткой блокировкой в Redis (CACHE_LOCK_TTL=0 — без неё)
+        self._flights: Dict[str, asyncio.Future] = {}
+        self.lock_ttl = float(os.getenv("CACHE_LOCK_TTL", "10"))
+        self.lock_poll = float(os.getenv("CACHE_LOCK_POLL", "0.05"))
+        # прогрев: частота запросов (ZSET) и тела популярных запросов —
+        # вне cache_prefix, чтобы DELETE /cache не стирал статистику (тела
+        # запросов с сырыми продажами он удаляет: invalidate_warmup_recipes)
+        self.warm_prefix = "ml_warmup:"
+        self.hot_key = f"{self.warm_prefix}hot"
+        self.warm_limit = int(os.getenv("CACHE_WARMUP_LIMIT", "50"))
+        self.warm_min_hits = int(os.getenv("CACHE_WARMUP_MIN_HITS", "2"))
+        self.warm_max_body = int(float(os.getenv("CACHE_WARMUP_MAX_BODY_MB", "1")) * 2**20)
+        # сжатые тела всех запросов вместе — не больше warm_budget байт; учёт
+        # (recipe_id → размер и сумма) — в хеше recipe_sizes_key
+        self.warm_budget = int(float(os.getenv("CACHE_WARMUP_BUDGET_MB", "256")) * 2**20)
+        self.recipe_sizes_key = f"{self.warm_prefix}sizes"
+        self._recipes_reconciled = 0.0
+        self.warm_track = int(os.getenv("CACHE_WARMUP_TRACK", "10000"))
+        self.recipe_ttl = int(os.getenv("CACHE_WARMUP_RECIPE_TTL", str(7 * 86400)))
+        self.warm_lock_ttl = float(os.getenv("CACHE_WARMUP_LOCK_TTL", "600"))
+        self._background: set = set()
+    
+    # ── подключение
+    def _make_client(self):
+        # без повторов внутри redis-py: ошибки сразу идут в предохранитель.
+        # Операции _call занимают не больше pool_size соединений (_slots);
+        # сверх них — подписка на инвалидации и проверка переподключения
+        pool = aioredis.BlockingConnectionPool.from_url(
+            self.redis_url, max_connections=self.pool_size + 2, timeout=self.pool_timeout,
+            socket_timeout=self.admin_timeout, socket_connect_timeout=self.connect_timeout,
+            retry=Retry(NoBackoff(), 0))
+        return aioredis.Redis(connection_pool=pool)
+    
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self.redis_client = self._make_client()
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._reconnect_task = None
+            self._subscriber = None
+            if self.breaker.open:
+                self._start_reconnect()
+        if self._subscriber is None and self.local.enabled and not self.breaker.open:
+            self._subscriber = loop.create_task(self._listen_invalidations())
         return self.redis_client
     
-    def generate_cache_key(self, payload: List[Dict], horizon: int) -> str:
-        """Генерирует ключ кеша на основе хеша данных и горизонта прогноза"""
-        # Создаем хеш из payload и horizon
-        data_str = json.dumps(payload, sort_keys=True, default=str)
-        hash_obj = hashlib.sha256(f"{data_str}:{horizon}".encode())
-        return f"{self.cache_prefix}{hash_obj.hexdigest()}"
+    async def connect(self) -> bool:
+        """Проверка подключения при старте сервиса (без блокировки импорта)"""
+        ok = await self.health_check()
+        if ok:
+            logger.info(f"Successfully connected to Redis at {self.redis_url}")
+        else:
+            logger.error(f"Failed to connect to Redis at {self.redis_url}; cache disabled until reconnect")
+            if not self.breaker.open:
+                self.breaker.trip()
+                self._start_reconnect()
+        return ok
     
-    def get_cached_forecast(self, cache_key: str) -> Optional[Dict]:
-        """Получает прогноз из кеша"""
-        if not self.redis_client:
-            return None
+    def _start_reconnect(self):
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+    
+    async def _reconnect(self):
+        delay = self.breaker.reset_seconds
+        while self.breaker.open:
+            await asyncio.sleep(delay)
+            try:
+                await asyncio.wait_for(self._client().ping(), self.op_timeout)
+            except Exception as e:
+                logger.warning(f"Redis still unavailable: {str(e)}")
+                delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+                continue
+            # пока Redis был недоступен, инвалидации могли пройти мимо
+            self.local.clear()
+            self.breaker.close()
+            logger.info(f"Reconnected to Redis at {self.redis_url}")
+    
+    async def _call(self, fn, default=None, timeout: float = None, count_timeouts: bool = True):
+        """
+        await fn(client) с таймаутом операции. Ошибка, таймаут или
+        разомкнутый предохранитель → default (кеш — необязательный слой).
+        count_timeouts=False — таймаут не считается отказом Redis
+        (массовая запись: её длительность зависит от объёма, а не от Redis).
+        Все соединения пула заняты дольше pool_timeout → default без отказа
+        в предохранитель: это пик нагрузки, а не недоступный Redis.
+        """
+        if self.breaker.open:
+            self._client()
+            return default
+        client = self._client()
         try:
-            cached_data = self.redis_client.get(cache_key)
-            if cached_data:
-                result = pickle.loads(cached_data)
-                logger.info(f"Cache hit for key: {cache_key}")
+            await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Redis connection pool exhausted; treating as cache miss")
+            metrics_collector.record_cache_operation("pool", "wait_timeout")
+            return default
+        try:
+            result = await asyncio.wait_for(fn(client), timeout or self.op_timeout)
+            self.breaker.success()
+            return result
+        except asyncio.TimeoutError as e:
+            if not count_timeouts:
+                logger.warning("Redis bulk operation timed out")
+                return default
+            logger.error(f"Redis operation failed: {type(e).__name__}: {str(e)}")
+            if self.breaker.failure():
+                logger.error("Redis circuit breaker opened")
+                self._start_reconnect()
+            return default
+        except Exception as e:
+            logger.error(f"Redis operation failed: {type(e).__name__}: {str(e)}")
+            if self.breaker.failure():
+                logger.error("Redis circuit breaker opened")
+                self._start_reconnect()
+            return default
+        finally:
+            self._slots.release()
+    
+    async def _encode(self, forecast: List[Dict]) -> bytes:
+        if len(forecast) <= self.CODEC_INLINE_ROWS:
+            return forecast_codec.encode(forecast)
+        return await stage_executor.run("cache", forecast_codec.encode, forecast)
+    
+    async def _decode(self, cached_data: bytes) -> List[Dict]:
+        if len(cached_data) <= self.CODEC_INLINE_BYTES:
+            return forecast_codec.decode(cached_data)
+        return await stage_executor.run("cache", forecast_codec.decode, cached_data)
+    
+    # Ключи кеша — по содержимому, версия модели входит в ключ (после
+    # горячей замены модели старые прогнозы просто перестают находиться)
+    def generate_body_cache_key(self, body_digest: str, horizon: Optional[int],
+                                model_version: str = "", org: str = "",
+                                by_store: bool = False) -> str:
+        """
+        Ключ по хешу сырого тела запроса, посчитанному при его чтении
+        (api_main.read_body). Для JSON горизонт уже внутри тела (horizon=None),
+        поэтому попадание в кеш не требует разбора запроса. Ответ по точкам
+        продаж (by_store) на то же тело — другой ключ.
+        """
+        stores = ":stores" if by_store else ""
+        hash_obj = hashlib.sha256(f"{body_digest}:{horizon}:{model_version}:{org}{stores}".encode())
+        return f"{self.cache_prefix}{hash_obj.hexdigest()}"
+    
+    def generate_frame_cache_key(self, sales_df: pd.DataFrame, horizon: int,
+                                 model_version: str = "", digests: pd.Series = None,
+                                 org: str = "") -> str:
+        """
+        Канонический ключ по уже разобранным продажам: хеш отпечатков рядов
+        (series_digests, отсортированы по ряду) — не зависит от порядка
+        событий и форматирования JSON.
+        """
+        if digests is None:
+            series, keys = intern_series(sales_df)
+            digests = series_digests(sales_df.assign(**{SERIES_COL: series}), keys)
+        hash_obj = hashlib.sha256("".join(
+            f"{item}\t{digest}\n" for item, digest in zip(digests.index, digests.values)).encode())
+        hash_obj.update(f":{horizon}:{model_version}:{org}".encode())
+        return f"{self.cache_prefix}{hash_obj.hexdigest()}"
+    
+    # ── кеш по рядам: (организация, ряд, отпечаток истории, горизонт, модель)
+    def generate_sku_cache_keys(self, org: str, digests: pd.Series, horizon: int,
+                                model_version: str = "", ref_date=None) -> List[str]:
+        """
+        Ключи прогнозов отдельных рядов по дням; digests — series_digests(sales_df, keys),
+        ref_date — дата отсчёта запроса (ряд прогнозируется с неё, а не со своей
+        последней продажи)
+        """
+        # "days" — значение — вектор прогнозов по дням (не прежнее суточное число)
+        ref = "" if ref_date is None else f"{pd.Timestamp(ref_date):%Y-%m-%d}"
+        suffix = f"\t{horizon}\t{model_version}\t{ref}\tdays"
+        return [
+            f"{self.cache_prefix}sku:"
+            + hashlib.sha1(f"{org}\t{item}\t{digest}{suffix}".encode()).hexdigest()
+            for item, digest in zip(digests.index, digests.values)
+        ]
+    
+    async def get_sku_forecasts(self, keys: List[str], horizon: int) -> np.ndarray:
+        """
+        Прогнозы товаров по дням (ключи × horizon): MGET пачками по
+        SKU_CHUNK ключей, каждая — отдельная операция со своим таймаутом
+        (между ними event loop обслуживает другие запросы); строка NaN —
+        промах. Если Redis не ответил, остальные ключи — промахи.
+        """
+        out = np.full((len(keys), horizon), np.nan)
+        if not keys:
+            return out
+        
+        values = []
+        for lo in range(0, len(keys), self.SKU_CHUNK):
+            chunk = await self._call(lambda client: client.mget(keys[lo:lo + self.SKU_CHUNK]))
+            if chunk is None:
+                break
+            values += chunk
+        values += [None] * (len(keys) - len(values))
+        # значение — horizon чисел float64 подряд; другой длины — промах
+        size = horizon * 8
+        hit = np.array([v is not None and len(v) == size for v in values])
+        if hit.any():
+            out[hit] = np.frombuffer(b"".join(v for v, h in zip(values, hit) if h),
+                                     dtype="<f8").reshape(-1, horizon)
+        metrics_collector.record_cache_lookup("sku", int(hit.sum()), len(keys))
+        return out
+    
+    async def set_sku_forecasts(self, keys: List[str], values: np.ndarray, ttl: int = None,
+                                items: List[str] = (), org: str = None,
+                                model_version: str = None) -> bool:
+        """
+        Сохраняет прогнозы товаров по дням (ключи × дни) конвейерами SETEX
+        по SKU_CHUNK ключей; items[i] — товар ключа keys[i] (для индексов
+        инвалидации: один SADD на индекс товара в конвейере). Таймаут
+        массовой записи не размыкает предохранитель: это промах записи,
+        а не отказ Redis.
+        """
+        if not keys:
+            return False
+        ttl = ttl or self.default_ttl
+        rows = np.ascontiguousarray(values, dtype="<f8")
+        items = list(items)
+        tags = self._tag_indexes(org, model_version)
+        
+        async def setex(client, lo: int, hi: int):
+            pipe = client.pipeline(transaction=False)
+            for key, row in zip(keys[lo:hi], rows[lo:hi]):
+                pipe.setex(key, ttl, row.tobytes())
+            by_item: Dict[str, List[str]] = {}
+            for item, key in zip(items[lo:hi], keys[lo:hi]):
+                by_item.setdefault(item, []).append(key)
+            for item, item_keys in by_item.items():
+                self._index(pipe, [self._sku_index(item)], item_keys, ttl)
+            self._index(pipe, tags, keys[lo:hi], ttl)
+            pipe.hincrby(self.stats_key, "sku_sets", hi - lo)
+            return await pipe.execute()
+        
+        written = 0
+        for lo in range(0, len(keys), self.SKU_CHUNK):
+            hi = min(lo + self.SKU_CHUNK, len(keys))
+            if await self._call(lambda client: setex(client, lo, hi), count_timeouts=False) is None:
+                break
+            written = hi
+        if not written:
+            return False
+        logger.info(f"Cache set for {written} of {len(keys)} SKU forecasts, TTL: {ttl}")
+        return written == len(keys)
+    
+    async def get_cached_forecast(self, cache_key: str) -> Optional[List[Dict]]:
+        """
+        Прогноз из кеша или None: сначала локальный уровень, затем Redis.
+        Устаревшая запись (срок свежести default_ttl истёк, но она ещё в
+        окне stale_ttl) отдаётся и продлевается в фоне (_extend).
+        """
+        if self.local.enabled:
+            result = self.local.get(cache_key)
+            metrics_collector.record_cache_lookup("local", int(result is not None))
+            if result is not None:
                 return result
+        if self.breaker.open:
+            return None
+        
+        async def get(client):
+            pipe = client.pipeline(transaction=False)
+            pipe.get(cache_key)
+            pipe.pttl(cache_key)
+            return await pipe.execute()
+        
+        cached_data, pttl = await self._call(get, (None, -2))
+        metrics_collector.record_cache_lookup("redis", int(cached_data is not None))
+        if not cached_data:
             logger.info(f"Cache miss for key: {cache_key}")
             return None
-        except Exception as e:
-            logger.error(f"Error getting cached forecast: {str(e)}")
+        try:
+            result = await self._decode(cached_data)
+        except DecodeError as e:
+            # запись другого формата (старые реплики, pickle) — промах, перезапишется
+            logger.warning(f"Error decoding cached forecast: {str(e)}")
             return None
+        # pttl = -1 — запись без срока (положена не нами), считаем свежей
+        fresh_left = pttl / 1000 - self.stale_ttl if pttl >= 0 else self.default_ttl
+        if fresh_left <= 0:
+            logger.info(f"Stale cache hit for key: {cache_key}")
+            metrics_collector.record_cache_operation("get", "stale")
+            self.spawn(self._extend(cache_key))
+            return result
+        logger.info(f"Cache hit for key: {cache_key}")
+        # локальная копия не переживает свежесть записи в Redis
+        self.local.set(cache_key, result, len(cached_data), fresh_left)
+        return result
     
-    def set_cached_forecast(self, cache_key: str, forecast: Dict, ttl: int = None) -> bool:
-        """Сохраняет прогноз в кеш"""
-        if not self.redis_client:
-            return False
-        try:
-            ttl = ttl or self.default_ttl
-            cached_data = pickle.dumps(forecast)
-            self.redis_client.setex(cache_key, ttl, cached_data)
-            logger.info(f"Cache set for key: {cache_key}, TTL: {ttl}")
-            return True
-        except Exception as e:
-            logger.error(f"Error setting cached forecast: {str(e)}")
+    async def _extend(self, cache_key: str):
+        """
+        Продлевает устаревшую запись и её индексы (список — в _entry_index)
+        на default_ttl + stale_ttl: индексы не должны истечь раньше записи,
+        иначе инвалидация по товару / организации её не найдёт.
+        """
+        redis_ttl = self.default_ttl + self.stale_ttl
+        entry_index = self._entry_index(cache_key)
+        
+        async def extend(client):
+            indexes = [i.decode() for i in await client.smembers(entry_index)]
+            for lo in range(0, len(indexes), self.SKU_CHUNK):
+                pipe = client.pipeline(transaction=False)
+                for index in indexes[lo:lo + self.SKU_CHUNK]:
+                    pipe.expire(index, redis_ttl)
+                await pipe.execute()
+            pipe = client.pipeline(transaction=False)
+            pipe.expire(entry_index, redis_ttl)
+            pipe.expire(cache_key, redis_ttl)
+            return await pipe.execute()
+        
+        if await self._call(extend, timeout=self.admin_timeout) is not None:
+            metrics_collector.record_cache_operation("extend", "success")
+    
+    async def set_cached_forecast(self, cache_key: str, forecast: List[Dict], ttl: int = None,
+                                  items: List[str] = (), org: str = None,
+                                  model_version: str = None) -> bool:
+        """Сохраняет прогноз в кеш; items / org / model_version — для индексов инвалидации"""
+        ttl = ttl or self.default_ttl
+        cached_data = await self._encode(forecast)
+        self.local.set(cache_key, forecast, len(cached_data), ttl, items, org, model_version)
+        
+        # свежая ttl секунд, затем ещё stale_ttl отдаётся как устаревшая
+        redis_ttl = ttl + self.stale_ttl
+        
+        # индексы товаров (их может быть десятки тысяч) — конвейерами по
+        # SKU_CHUNK, до самой записи: запись без индексов не появляется
+        indexes = [self._sku_index(item) for item in dict.fromkeys(items)]
+        indexes += self._tag_indexes(org, model_version)
+        
+        async def index(client, chunk: List[str]):
+            pipe = client.pipeline(transaction=False)
+            self._index(pipe, chunk, [cache_key], redis_ttl)
+            return await pipe.execute()
+        
+        for lo in range(0, len(indexes), self.SKU_CHUNK):
+            chunk = indexes[lo:lo + self.SKU_CHUNK]
+            if await self._call(lambda client: index(client, chunk), count_timeouts=False) is None:
+                return False
+        
+        async def setex(client):
+            pipe = client.pipeline(transaction=False)
+            # какие индексы продлевать вместе с записью (_extend)
+            pipe.delete(self._entry_index(cache_key))
+            self._index(pipe, [self._entry_index(cache_key)], indexes, redis_ttl)
+            pipe.setex(cache_key, redis_ttl, cached_data)
+            pipe.hincrby(self.stats_key, "sets", 1)
+            return await pipe.execute()
+        
+        if await self._call(setex, count_timeouts=False) is None:
             return False
+        logger.info(f"Cache set for key: {cache_key}, TTL: {ttl}")
+        return True
+    
+    # ── single-flight
+    async def single_flight(self, cache_key: Optional[str], compute):
+        """
+        await compute() один раз на ключ: параллельные запросы с тем же
+        ключом в этом процессе ждут результат первого, а на других репликах —
+        появления ответа в кеше, пока первая держит блокировку в Redis.
+        compute сам кладёт ответ в кеш (до снятия блокировки).
+        """
+        if not cache_key:
+            return await compute()
+        loop = asyncio.get_running_loop()
+        flight = self._flights.get(cache_key)
+        if flight is not None and flight.get_loop() is loop:
+            metrics_collector.record_cache_operation("single_flight", "coalesced")
+        else:
+            # отдельная задача: отмена первого запроса не отменяет ожидающих
+            flight = loop.create_task(self._compute_locked(cache_key, compute))
+            self._flights[cache_key] = flight
+            flight.add_done_callback(lambda f: self._flight_done(cache_key, f))
+        return await asyncio.shield(flight)
     
-    def invalidate_cache_by_pattern(self, pattern: str = None):
-        """Инвалидирует кеш по паттерну"""
+    def _flight_done(self, cache_key: str, flight: asyncio.Future):
+        if self._flights.get(cache_key) is flight:
+            del self._flights[cache_key]
+        if not flight.cancelled():
+            flight.exception()   # ошибка уже передана ожидающим; без них asyncio не ругается
+    
+    async def _compute_locked(self, cache_key: str, compute):
+        if self.lock_ttl <= 0 or self.breaker.open:
+            return await compute()
+        lock_key = f"{cache_key}:lock"
+        lock = None
+        
+        async def acquire(client):
+            nonlocal lock
+            lock = client.lock(lock_key, timeout=self.lock_ttl, blocking=False)
+            return await lock.acquire()
+        
+        acquired = await self._call(acquire)
+        if acquired is None:   # Redis недоступен — считаем сами
+            return await compute()
+        if not acquired:
+            result = await self._wait_for_forecast(cache_key, lock_key)
+            if result is not None:
+                return result
+            metrics_collector.record_cache_operation("single_flight", "lock_timeout")
+            return await compute()
+        metrics_collector.record_cache_operation("single_flight", "leader")
         try:
-            pattern = pattern or f"{self.cache_prefix}*"
-            keys = self.redis_client.keys(pattern)
-            if keys:
-                self.redis_client.delete(*keys)
-                logger.info(f"Invalidated {len(keys)} cache entries with pattern: {pattern}")
-                return len(keys)
-            return 0
-        except Exception as e:
-            logger.error(f"Error invalidating cache: {str(e)}")
-            return 0
+            return await compute()
+        finally:
+            await self._call(lambda client: self._release(lock), default=False)
     
-    def invalidate_cache_for_items(self, item_names: List[str]):
-        """Инвалидирует кеш для конкретных товаров"""
+    @staticmethod
+    async def _release(lock):
         try:
-            all_keys = self.redis_client.keys(f"{self.cache_prefix}*")
-            invalidated = 0
-            
-            for key in all_keys:
+            await lock.release()
+        except LockError:
+            pass   # блокировка истекла раньше — это не ошибка Redis
+    
+    async def _wait_for_forecast(self, cache_key: str, lock_key: str) -> Optional[List[Dict]]:
+        """Ответ, положенный держателем блокировки; None — блокировка снята без ответа или истекла"""
+        deadline = time.monotonic() + self.lock_ttl
+        
+        async def poll(client):
+            pipe = client.pipeline(transaction=False)
+            pipe.get(cache_key)
+            pipe.exists(lock_key)
+            return await pipe.execute()
+        
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.lock_poll)
+            polled = await self._call(poll)
+            if polled is None:
+                return None
+            cached_data, locked = polled
+            if cached_data:
                 try:
-                    cached_data = self.redis_client.get(key)
-                    if cached_data:
-                        forecast = pickle.loads(cached_data)
-                        # Проверяем, содержит ли прогноз данные о товарах
-                        if self._forecast_contains_items(forecast, item_names):
-                            self.redis_client.delete(key)
-                            invalidated += 1
-                except Exception as e:
-                    logger.error(f"Error checking cache key {key}: {str(e)}")
-                    continue
-            
-            logger.info(f"Invalidated {invalidated} cache entries for items: {item_names}")
-            return invalidated
-        except Exception as e:
-            logger.error(f"Error invalidating cache for items: {str(e)}")
-            return 0
+                    result = await self._decode(cached_data)
+                except DecodeError:
+                    return None
+                metrics_collector.record_cache_operation("single_flight", "lock_wait")
+                self.local.set(cache_key, result, len(cached_data))
+                return result
+            if not locked:
+                return None
+        return None
     
-    def _forecast_contains_items(self, forecast: Dict, item_names: List[str]) -> bool:
-        """Проверяет, содержит ли прогноз указанные товары"""
-        if not isinstance(forecast, list):
-            return False
+    # ── фоновые задачи, статистика запросов и прогрев
+    def spawn(self, coro) -> asyncio.Task:
+        """Фоновая задача в текущем event loop (ссылка держится до завершения)"""
+        task = asyncio.get_running_loop().create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+    
+    def _background_done(self, task: asyncio.Task):
+        self._background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Background cache task failed: {task.exception()!r}")
+    
+    def generate_recipe_id(self, body_digest: str, horizon: Optional[int], org: str = "",
+                           by_store: bool = False) -> str:
+        """Идентификатор запроса для статистики прогрева (не зависит от версии модели)"""
+        stores = ":stores" if by_store else ""
+        return hashlib.sha1(f"{body_digest}:{horizon}:{org}{stores}".encode()).hexdigest()
+    
+    def _recipe_key(self, recipe_id: str) -> str:
+        return f"{self.warm_prefix}recipe:{recipe_id}"
+    
+    def _recipe_org_index(self, org: str) -> str:
+        """Сохранённые тела запросов организации (для их удаления вместе с кешем)"""
+        return f"{self.warm_prefix}org:{org}"
+    
+    async def record_request(self, recipe_id: str, body: bytes, content_type: str,
+                             horizon: Optional[int], org: str, body_digest: str,
+                             by_store: bool = False):
+        """
+        Учитывает запрос в статистике прогрева (ZINCRBY). Тело запроса,
+        набравшего warm_min_hits обращений, сохраняется сжатым — по нему
+        прогрев пересчитает ответ новой моделью; тела крупнее warm_max_body
+        и сверх общего бюджета warm_budget не сохраняются.
+        """
+        if self.warm_min_hits <= 0 or self.breaker.open:
+            return
+        recipe_key = self._recipe_key(recipe_id)
         
-        for item in forecast:
-            if isinstance(item, dict) and "Номенклатура" in item:
-                if item["Номенклатура"] in item_names:
-                    return True
-        return False
+        async def count(client):
+            pipe = client.pipeline(transaction=False)
+            pipe.zincrby(self.hot_key, 1, recipe_id)
+            pipe.expire(recipe_key, self.recipe_ttl)   # 0 — тела ещё нет
+            return await pipe.execute()
+        
+        counted = await self._call(count)
+        if counted is None:
+            return
+        hits, stored = counted
+        if stored or hits < self.warm_min_hits or len(body) > self.warm_max_body:
+            return
+        packed = await asyncio.to_thread(zlib.compress, body, 1)
+        
+        async def store(client):
+            used = int(await client.hget(self.recipe_sizes_key, self.RECIPE_TOTAL) or 0)
+            if used + len(packed) > self.warm_budget:
+                # в учёте могут числиться истёкшие тела — сверяем (не чаще RECIPE_RECONCILE_EVERY)
+                if time.monotonic() - self._recipes_reconciled < self.RECIPE_RECONCILE_EVERY:
+                    return None
+                self._recipes_reconciled = time.monotonic()
+                if await self._reconcile_recipes(client) + len(packed) > self.warm_budget:
+                    return None
+            pipe = client.pipeline(transaction=False)
+            pipe.hset(recipe_key, mapping={
+                "content_type": content_type, "horizon": "" if horizon is None else str(horizon),
+                "org": org, "body_digest": body_digest, "body": packed,
+                "by_store": "1" if by_store else "",
+            })
+            pipe.expire(recipe_key, self.recipe_ttl)
+            pipe.sadd(self._recipe_org_index(org), recipe_id)
+            pipe.expire(self._recipe_org_index(org), self.recipe_ttl)
+            pipe.hset(self.recipe_sizes_key, recipe_id, len(packed))
+            pipe.hincrby(self.recipe_sizes_key, self.RECIPE_TOTAL, len(packed))
+            return await pipe.execute()
+        
+        await self._call(store)
+    
+    async def _forget_recipes(self, client, recipe_ids: List[str], untrack: bool = False) -> int:
+        """
+        Удаляет тела запросов и их учёт в recipe_sizes_key (untrack — и сами
+        запросы из статистики частоты); возвращает число удалённых тел
+        """
+        removed = 0
+        for i in range(0, len(recipe_ids), self.MGET_CHUNK):
+            chunk = recipe_ids[i:i + self.MGET_CHUNK]
+            sizes = await client.hmget(self.recipe_sizes_key, chunk)
+            pipe = client.pipeline(transaction=False)
+            pipe.unlink(*[self._recipe_key(r) for r in chunk])
+            if untrack:
+                pipe.zrem(self.hot_key, *chunk)
+            pipe.hdel(self.recipe_sizes_key, *chunk)
+            pipe.hincrby(self.recipe_sizes_key, self.RECIPE_TOTAL,
+                         -sum(int(n) for n in sizes if n is not None))
+            removed += (await pipe.execute())[0]
+        return removed
+    
+    async def _reconcile_recipes(self, client) -> int:
+        """
+        Сверяет учёт объёма тел с Redis: истёкшие по TTL тела из него
+        убираются, сумма пересчитывается. → занятый объём, байт
+        """
+        sizes = {k.decode(): int(v) for k, v in (await client.hgetall(self.recipe_sizes_key)).items()
+                 if k.decode() != self.RECIPE_TOTAL}
+        ids = list(sizes)
+        exists = []
+        for i in range(0, len(ids), self.MGET_CHUNK):
+            pipe = client.pipeline(transaction=False)
+            for recipe_id in ids[i:i + self.MGET_CHUNK]:
+                pipe.exists(self._recipe_key(recipe_id))
+            exists += await pipe.execute()
+        gone = [r for r, e in zip(ids, exists) if not e]
+        used = sum(sizes.values()) - sum(sizes[r] for r in gone)
+        pipe = client.pipeline(transaction=False)
+        for i in range(0, len(gone), self.MGET_CHUNK):
+            pipe.hdel(self.recipe_sizes_key, *gone[i:i + self.MGET_CHUNK])
+        pipe.hset(self.recipe_sizes_key, self.RECIPE_TOTAL, used)
+        await pipe.execute()
+        return used
+    
+    async def invalidate_warmup_recipes(self, org: str = None) -> int:
+        """
+        Удаляет сохранённые тела запросов (в них сырые продажи): все или
+        одной организации. Счётчики частоты остаются, но без тела запрос
+        не прогревается, пока снова не наберёт warm_min_hits обращений.
+        """
+        async def invalidate(client):
+            if org is not None:
+                index = self._recipe_org_index(org)
+                removed = await self._forget_recipes(
+                    client, [r.decode() for r in await client.smembers(index)])
+                await client.unlink(index)
+                return removed
+            keys = [k async for k in client.scan_iter(match=f"{self.warm_prefix}recipe:*",
+                                                      count=self.MGET_CHUNK)]
+            indexes = [k async for k in client.scan_iter(match=f"{self.warm_prefix}org:*",
+                                                         count=self.MGET_CHUNK)]
+            removed = await self._unlink(client, keys)
+            await self._unlink(client, indexes + [self.recipe_sizes_key])
+            return removed
+        
+        removed = await self._call(invalidate, 0, self.admin_timeout)
+        if removed:
+            logger.info(f"Removed {removed} warm-up request bodies" + (f" for org: {org}" if org is not None else ""))
+        return removed
+    
+    async def acquire_warmup_lock(self):
+        """Блокировка прогрева (одна реплика на всех); None — занята или Redis недоступен"""
+        lock = None
+        
+        async def acquire(client):
+            nonlocal lock
+            lock = client.lock(f"{self.warm_prefix}lock", timeout=self.warm_lock_ttl,
+                               blocking=False)
+            return await lock.acquire()
+        
+        return lock if await self._call(acquire) else None
+    
+    async def release_warmup_lock(self, lock):
+        """
+        Снимает блокировку прогрева и «состаривает» статистику: счётчики
+        делятся пополам (частота — по недавним запросам), хвост за
+        warm_track самыми частыми отбрасывается вместе с сохранёнными
+        телами этих запросов; учёт объёма тел сверяется.
+        """
+        async def decay(client):
+            pipe = client.pipeline(transaction=False)
+            pipe.zunionstore(self.hot_key, {self.hot_key: 0.5})
+            pipe.zrange(self.hot_key, 0, -(self.warm_track + 1))
+            evicted = [r.decode() for r in (await pipe.execute())[1]]
+            await self._forget_recipes(client, evicted, untrack=True)
+            self._recipes_reconciled = time.monotonic()
+            return await self._reconcile_recipes(client)
+        
+        await self._call(decay, timeout=self.admin_timeout)
+        await self._call(lambda client: self._release(lock), default=False)
+    
+    async def hot_recipes(self, limit: int = None) -> List["WarmupRecipe"]:
+        """Самые частые запросы с сохранённым телом, по убыванию частоты"""
+        limit = limit or self.warm_limit
+        
+        async def load(client):
+            # по убыванию частоты, страницами; берутся запросы с сохранённым телом
+            chosen, page = [], max(limit * 4, 100)
+            for start in range(0, self.warm_track, page):
+                hot = await client.zrevrange(self.hot_key, start, start + page - 1, withscores=True)
+                if not hot:
+                    break
+                pipe = client.pipeline(transaction=False)
+                for recipe_id, _ in hot:
+                    pipe.exists(self._recipe_key(recipe_id.decode()))
+                chosen += [h for h, stored in zip(hot, await pipe.execute()) if stored]
+                if len(chosen) >= limit:
+                    break
+            chosen = chosen[:limit]
+            pipe = client.pipeline(transaction=False)
+            for recipe_id, _ in chosen:
+                pipe.hgetall(self._recipe_key(recipe_id.decode()))
+            return chosen, await pipe.execute()
+        
+        loaded = await self._call(load, timeout=self.admin_timeout)
+        if loaded is None:
+            return []
+        recipes = []
+        for (recipe_id, hits), fields in zip(*loaded):
+            if not fields:
+                continue   # тело истекло между запросами
+            body = await asyncio.to_thread(zlib.decompress, fields[b"body"])
+            horizon = fields[b"horizon"].decode()
+            recipes.append(WarmupRecipe(
+                recipe_id.decode(), hits, fields[b"content_type"].decode(),
+                int(horizon) if horizon else None, fields[b"org"].decode(),
+                fields[b"body_digest"].decode(), body, fields.get(b"by_store") == b"1"))
+        return recipes
+    
+    async def is_cached(self, cache_key: str) -> bool:
+        """
+        Есть ли в Redis ответ по ключу (в том числе устаревший — он
+        продлевается при попадании и пересчёта не требует)
+        """
+        return bool(await self._call(lambda client: client.exists(cache_key), 0))
+    
+    # ── индексы для инвалидации: множества ключей по товару, организации и
+    # версии модели. Живут не меньше своих записей (EXPIRE обновляется при
+    # каждом добавлении); ключи истёкших записей в них остаются до
+    # инвалидации, DEL/UNLINK отсутствующего ключа безвреден.
+    def _sku_index(self, item: str) -> str:
+        return f"{self.index_prefix}sku:{item}"
+    
+    def _entry_index(self, cache_key: str) -> str:
+        """Индексы, в которых состоит запись ответа (для продления вместе с ней)"""
+        return f"{self.index_prefix}entry:{cache_key.removeprefix(self.cache_prefix)}"
+    
+    def _tag_indexes(self, org: str = None, model_version: str = None) -> List[str]:
+        indexes = []
+        if org is not None:
+            indexes.append(f"{self.index_prefix}org:{org}")
+        if model_version:
+            indexes.append(f"{self.index_prefix}model:{model_version}")
+        return indexes
     
-    def get_cache_stats(self) -> Dict:
-        """Получает статистику кеша"""
+    def _index(self, pipe, indexes: List[str], keys: List[str], ttl: int):
+        if not keys:
+            return
+        for index in indexes:
+            pipe.sadd(index, *keys)
+            pipe.expire(index, max(ttl, self.default_ttl))
+    
+    async def _unlink(self, client, keys: List) -> int:
+        """Удаляет ключи конвейером UNLINK пачками; возвращает число удалённых"""
+        pipe = client.pipeline(transaction=False)
+        for i in range(0, len(keys), self.MGET_CHUNK):
+            pipe.unlink(*keys[i:i + self.MGET_CHUNK])
+        return sum(await pipe.execute()) if keys else 0
+    
+    async def _invalidate_indexes(self, indexes: List[str]) -> int:
+        """Удаляет все записи из индексов (SMEMBERS одним конвейером) и сами индексы"""
+        async def invalidate(client):
+            pipe = client.pipeline(transaction=False)
+            for index in indexes:
+                pipe.smembers(index)
+            keys = list(set().union(*await pipe.execute()))
+            removed = await self._unlink(client, keys)
+            await self._unlink(client, indexes)
+            return removed
+        
+        return await self._call(invalidate, 0, self.admin_timeout)
+    
+    # ── инвалидация локального уровня на всех репликах
+    async def _listen_invalidations(self):
+        """Подписка на канал инвалидаций; при обрыве — сброс локального уровня и повтор"""
+        delay = self.breaker.reset_seconds
+        while True:
+            pubsub = None
+            subscribed = False
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                await pubsub.subscribe(self.invalidate_channel)
+                subscribed = True
+                delay = self.breaker.reset_seconds
+                async for message in pubsub.listen():
+                    self._on_invalidate(message)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation subscriber error: {str(e)}")
+                if subscribed:
+                    # сообщения могли потеряться — локальному уровню больше нельзя верить
+                    self.local.clear()
+            finally:
+                if pubsub is not None:
+                    try:
+                        await pubsub.aclose()
+                    except Exception:
+                        pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.MAX_RECONNECT_DELAY)
+    
+    def _on_invalidate(self, message):
         try:
-            info = self.redis_client.info()
-            keys_count = len(self.redis_client.keys(f"{self.cache_prefix}*"))
-            
-            return {
+            msg = json.loads(message["data"])
+            self._invalidate_local(msg["kind"], msg.get("values", []))
+        except Exception as e:
+            logger.error(f"Bad cache invalidation message: {str(e)}")
+            self.local.clear()
+    
+    def _invalidate_local(self, kind: str, values: List[str]) -> int:
+        if kind == "items":
+            return self.local.invalidate(items=values)
+        if kind == "org":
+            return sum(self.local.invalidate(org=v) for v in values)
+        if kind == "model":
+            return sum(self.local.invalidate(version=v) for v in values)
+        return self.local.clear()
+    
+    async def _broadcast_invalidation(self, kind: str, values: List[str] = ()):
+        """Сбрасывает локальный уровень здесь и (через pub/sub) на остальных репликах"""
+        self._invalidate_local(kind, list(values))
+        if self.local.enabled:
+            message = json.dumps({"kind": kind, "values": list(values)})
+            await self._call(lambda client: client.publish(self.invalidate_channel, message))
+    
+    async def invalidate_cache_by_pattern(self, pattern: str = None):
+        """Инвалидирует кеш по паттерну (SCAN, без блокирующего KEYS)"""
+        # ключи локального уровня — хеши, паттерн к ним не применить: сбрасываем весь
+        await self._broadcast_invalidation("all")
+        pattern = pattern or f"{self.cache_prefix}*"
+        
+        async def invalidate(client):
+            keys = [k async for k in client.scan_iter(match=pattern, count=self.MGET_CHUNK)]
+            return await self._unlink(client, keys)
+        
+        count = await self._call(invalidate, 0, self.admin_timeout)
+        if count:
+            logger.info(f"Invalidated {count} cache entries with pattern: {pattern}")
+        return count
+    
+    async def invalidate_cache_for_items(self, item_names: List[str]):
+        """Инвалидирует кеш для конкретных товаров (по индексам товаров)"""
+        await self._broadcast_invalidation("items", item_names)
+        invalidated = await self._invalidate_indexes([self._sku_index(item) for item in item_names])
+        logger.info(f"Invalidated {invalidated} cache entries for items: {item_names}")
+        return invalidated
+    
+    async def invalidate_cache_for_org(self, org: str):
+        """Инвалидирует кеш организации"""
+        await self._broadcast_invalidation("org", [org])
+        invalidated = await self._invalidate_indexes(self._tag_indexes(org=org))
+        # сохранённые для прогрева тела запросов организации — тоже
+        invalidated += await self.invalidate_warmup_recipes(org)
+        logger.info(f"Invalidated {invalidated} cache entries for org: {org}")
+        return invalidated
+    
+    async def invalidate_model_version(self, model_version: str):
+        """Удаляет прогнозы версии модели (после горячей замены они не находятся)"""
+        await self._broadcast_invalidation("model", [model_version])
+        invalidated = await self._invalidate_indexes(self._tag_indexes(model_version=model_version))
+        logger.info(f"Invalidated {invalidated} cache entries for model: {model_version}")
+        return invalidated
+    
+    async def get_cache_stats(self, scan_keys: bool = True) -> Dict:
+        """
+        Статистика кеша: счётчики записей (HINCRBY при записи) и число
+        ключей по SCAN — без KEYS, Redis не блокируется. scan_keys=False —
+        без обхода ключей (их может быть очень много: прогнозы по рядам):
+        только DBSIZE и счётчики, с таймаутом обычной операции (/health).
+        """
+        local = {
+            "local_entries": len(self.local),
+            "local_bytes": self.local.bytes,
+            "hit_ratio": metrics_collector.cache_hit_ratios(),
+            "circuit_open": self.breaker.open,
+            "in_flight": len(self._flights),
+        }
+        
+        async def stats(client):
+            info = await client.info()
+            pipe = client.pipeline(transaction=False)
+            pipe.hgetall(self.stats_key)
+            pipe.dbsize()
+            counters, db_keys = await pipe.execute()
+            result = {
                 "redis_version": info.get("redis_version", "unknown"),
                 "used_memory": info.get("used_memory_human", "unknown"),
                 "connected_clients": info.get("connected_clients", 0),
-                "cache_keys_count": keys_count,
+                "db_keys_count": db_keys,
+                "writes": {k.decode(): int(v) for k, v in counters.items()},
                 "uptime_in_seconds": info.get("uptime_in_seconds", 0)
             }
-        except Exception as e:
-            logger.error(f"Error getting cache stats: {str(e)}")
-            return {"error": str(e)}
+            if scan_keys:
+                keys_count = index_count = 0
+                async for key in client.scan_iter(match=f"{self.cache_prefix}*",
+                                                  count=self.MGET_CHUNK):
+                    if key.startswith(self.index_prefix.encode()):
+                        index_count += 1
+                    else:
+                        keys_count += 1
+                result.update(cache_keys_count=keys_count, index_sets_count=index_count)
+            return result
+        
+        redis_stats = await self._call(stats, {"error": "Redis unavailable"},
+                                       self.admin_timeout if scan_keys else self.op_timeout)
+        return {**redis_stats, **local}
     
-    def health_check(self) -> bool:
+    async def health_check(self) -> bool:
         """Проверяет доступность Redis"""
-        if not self.redis_client:
-            return False
-        try:
-            self.redis_client.ping()
-            return True
-        except Exception as e:
-            logger.error(f"Redis health check failed: {str(e)}")
-            return False
+        return bool(await self._call(lambda client: client.ping(), False))
 
 # Глобальный экземпляр менеджера кеша
 cache_manager = CacheManager()
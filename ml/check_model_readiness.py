@@ -5,13 +5,14 @@
 
 import os
 import glob
-import pickle
 import subprocess
 import time
 import requests
 import sys
 from pathlib import Path
 
+from model_artifact import find_latest, load_latest
+
 def check_model_files():
     """Проверяем наличие файлов модели"""
     print("1. Проверка наличия файлов модели...")
@@ -21,20 +22,18 @@ def check_model_files():
         print("❌ Папка models не существует")
         return False
     
-    model_files = list(models_dir.glob("model-*.pkl"))
-    if not model_files:
+    latest_model = find_latest(models_dir)
+    if latest_model is None:
         print("❌ Файлы модели не найдены")
         return False
     
-    latest_model = max(model_files, key=lambda x: x.stat().st_mtime)
     print(f"✅ Найдена модель: {latest_model}")
     
     # Проверим, что модель может быть загружена
     try:
-        with open(latest_model, 'rb') as f:
-            artifact = pickle.load(f)
-        print(f"✅ Модель успешно загружена")
-        print(f"   - Метрики: MAE={artifact['metrics']['mae']:.3f}, MAPE={artifact['metrics']['mape']:.3f}")
+        artifact = load_latest(models_dir)
+        print(f"✅ Модель успешно загружена за {artifact.load_seconds:.3f} с")
+        print(f"   - Метрики: MAE={artifact.metrics['mae']:.3f}, MAPE={artifact.metrics['mape']:.3f}")
         return True
     except Exception as e:
         print(f"❌ Ошибка загрузки модели: {e}")
@@ -0,0 +1,111 @@
+# src/columnar.py
+"""
+Колоночный формат тела /forecast: Arrow IPC stream или Parquet.
+
+Таблица читается сразу в DataFrame, без объектов pydantic на строку;
+схема проверяется по колонкам. Ожидаемые колонки — те же, что у событий
+JSON: Период, Номенклатура, Количество (обязательные), Код,
+ВидНоменклатуры, Адрес_точки, Type (если есть — берутся только «Продажа») и
+экзогенные факторы LagMaker (Temp, Rain_mm, ...). Остальные колонки не
+читаются. Горизонт передаётся параметром запроса ?DaysCount=N.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+
+from error_handler import DataProcessingError
+from features import LagMaker
+from series import STORE_COL
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    logging.warning("pyarrow не установлен; Arrow/Parquet-запросы будут недоступны")
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET      = "application/vnd.apache.parquet"
+COLUMNAR_TYPES = {ARROW_STREAM, PARQUET, "application/x-parquet"}
+
+REQUIRED_COLS = ["Период", "Номенклатура", "Количество"]
+OPTIONAL_COLS = ["Код", "ВидНоменклатуры", STORE_COL, "Type"] + LagMaker().exog_cols
+
+
+def read_table(body: bytes, content_type: str):
+    """Тело запроса → pyarrow.Table (только нужные колонки)"""
+    if pa is None:
+        raise DataProcessingError("Колоночный формат недоступен: не установлен pyarrow")
+    try:
+        if content_type == ARROW_STREAM:
+            table = pa.ipc.open_stream(pa.BufferReader(body)).read_all()
+        else:
+            schema = pq.read_schema(pa.BufferReader(body))
+            wanted = [c for c in REQUIRED_COLS + OPTIONAL_COLS if c in schema.names]
+            table = pq.read_table(pa.BufferReader(body), columns=wanted)
+    except Exception as e:
+        raise DataProcessingError(f"Не удалось прочитать тело запроса ({content_type}): {str(e)}")
+    return table.select([c for c in REQUIRED_COLS + OPTIONAL_COLS if c in table.column_names])
+
+
+def _period(values: pd.Series) -> pd.Series:
+    """
+    Период: date / timestamp Arrow или строка ISO-8601 (YYYY-MM-DD, как в
+    JSON-событиях). Строки в другом формате не угадываются — «01.02.2024»
+    без формата pandas прочитал бы как 2 января.
+    """
+    try:
+        if pd.api.types.is_datetime64_any_dtype(values):
+            period = values
+        else:
+            period = pd.to_datetime(values, format="ISO8601", errors="coerce")
+            bad = period.isna().to_numpy()
+            if bad.any():
+                raise ValueError(f"ожидается дата ISO-8601 (YYYY-MM-DD), "
+                                 f"получено {values[bad].iloc[0]!r}")
+        if period.dt.tz is not None:
+            period = period.dt.tz_localize(None)
+        return period.dt.normalize()
+    except Exception as e:
+        raise DataProcessingError(f"Колонка Период: {str(e)}")
+
+
+def sales_frame_columnar(body: bytes, content_type: str) -> pd.DataFrame:
+    """
+    Arrow/Parquet → DataFrame продаж того же вида, что и sales_frame для
+    JSON. Ошибки схемы (нет колонки, пропуски, не приводится тип) →
+    DataProcessingError с именем колонки.
+    """
+    table = read_table(body, content_type)
+    missing = [c for c in REQUIRED_COLS if c not in table.column_names]
+    if missing:
+        raise DataProcessingError(f"Нет обязательных колонок: {', '.join(missing)}")
+
+    df = table.to_pandas()
+    if "Type" in df.columns:
+        df = df[df["Type"].isna() | (df["Type"] == "Продажа")].drop(columns="Type")
+    if df.empty:
+        raise DataProcessingError("Нет продаж в запросе")
+
+    for col in REQUIRED_COLS:
+        if df[col].isna().any():
+            raise DataProcessingError(f"Пропуски в обязательной колонке {col}")
+    df["Период"] = _period(df["Период"])
+    qty = pd.to_numeric(df["Количество"], errors="coerce")
+    if qty.isna().any() or (qty != np.floor(qty)).any():
+        raise DataProcessingError("Колонка Количество должна быть целой")
+    df["Количество"] = qty.astype(np.int64)
+    df["Номенклатура"] = df["Номенклатура"].astype(str)
+
+    for col in ("Код", "ВидНоменклатуры"):
+        if col not in df.columns:
+            df[col] = None
+    # точка продаж — только если есть в запросе (см. series.intern_series)
+    for col in ("Код", "ВидНоменклатуры", STORE_COL):
+        if col in df.columns:
+            s = df[col]
+            df[col] = s.astype(str).astype(object).where(s.notna(), None)
+    return df.reset_index(drop=True)
@@ -0,0 +1,158 @@
+# src/events.py
+"""
+Быстрый разбор JSON-запроса /forecast без Union-валидации pydantic.
+
+Каждый элемент массива классифицируется один раз по ключам:
+  • есть DaysCount        → заголовок (DaysHeader, проверяется pydantic);
+  • Type == "Поставка"     → событие поставки, пропускается без разбора;
+  • иначе                  → продажа.
+Из продаж забираются только нужные прогнозу поля (NEEDED_COLS), сразу
+колонками; типы проверяются векторно по колонкам. Ошибки — 422 в формате
+FastAPI: [{"loc": ["body", <индекс>, <поле>], "msg": ..., "type": ...}].
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+from features import LagMaker
+from series import STORE_COL
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
+SUPPLY_TYPE = "Поставка"
+REQUIRED_COLS = ["Период", "Номенклатура", "Количество"]
+OPTIONAL_STR_COLS = ["Код", "ВидНоменклатуры", STORE_COL]
+EXOG_COLS = LagMaker().exog_cols
+NEEDED_COLS = REQUIRED_COLS + OPTIONAL_STR_COLS + EXOG_COLS
+
+MAX_ERRORS = 20   # не раздуваем ответ 422 на больших запросах
+
+
+def _fail(errors: List[dict]):
+    raise HTTPException(422, errors[:MAX_ERRORS])
+
+
+def _error(idx: int, field: str, err_type: str, msg: str, value=None) -> dict:
+    return {"type": err_type, "loc": ["body", idx, field], "msg": msg, "input": value}
+
+
+def split_events(items) -> Tuple[dict, List[dict], List[int]]:
+    """Один проход: (заголовок, продажи, их индексы в исходном массиве)"""
+    if not isinstance(items, list):
+        _fail([{"type": "list_type", "loc": ["body"], "msg": "Input should be a valid list",
+                "input": None}])
+    header = None
+    sales, sales_idx = [], []
+    for i, e in enumerate(items):
+        if not isinstance(e, dict):
+            _fail([_error(i, "", "dict_type", "Input should be a valid dictionary", e)])
+        if "DaysCount" in e:
+            if header is None:
+                header = e
+        elif e.get("Type") != SUPPLY_TYPE:
+            sales.append(e)
+            sales_idx.append(i)
+    return header, sales, sales_idx
+
+
+def parse_horizon(header: dict, days_model: type) -> int:
+    if header is None:
+        raise HTTPException(422, "Отсутствует объект DaysCount")
+    try:
+        return days_model.model_validate(header).DaysCount
+    except ValidationError as e:
+        raise HTTPException(422, [dict(err, loc=["body", "DaysCount"]) for err in
+                                  e.errors(include_url=False, include_context=False)])
+
+
+def sales_columns(sales: List[dict], sales_idx: List[int]) -> pd.DataFrame:
+    """Продажи → DataFrame нужных колонок с проверкой типов по колонкам"""
+    if not sales:
+        raise HTTPException(422, "Нет продаж в запросе")
+    idx = np.asarray(sales_idx)
+    data = {col: [e.get(col) for e in sales] for col in NEEDED_COLS}
+    errors: List[dict] = []
+
+    for col in REQUIRED_COLS:
+        missing = [k for k, v in enumerate(data[col]) if v is None]
+        errors += [_error(int(idx[k]), col, "missing", "Field required") for k in missing]
+    if errors:
+        _fail(errors)
+
+    # Номенклатура и строковые поля: только str (как у pydantic, числа не приводятся)
+    for col in ["Номенклатура"] + OPTIONAL_STR_COLS:
+        values = data[col]
+        kind = pd.api.types.infer_dtype(values, skipna=True)
+        if kind not in ("string", "empty"):
+            errors += [_error(int(idx[k]), col, "string_type", "Input should be a valid string", v)
+                       for k, v in enumerate(values) if v is not None and not isinstance(v, str)]
+
+    # Количество: целое (допускаются целые float и строки-числа)
+    qty = pd.to_numeric(pd.Series(data["Количество"], dtype=object), errors="coerce")
+    bad = qty.isna().to_numpy() | (qty.to_numpy(dtype=float) % 1 != 0)
+    errors += [_error(int(idx[k]), "Количество", "int_parsing",
+                      "Input should be a valid integer", data["Количество"][k])
+               for k in np.flatnonzero(bad)]
+
+    # Период: дата ISO-8601 (YYYY-MM-DD, допускается нулевое время)
+    period = pd.to_datetime(pd.Series(data["Период"], dtype=object), format="ISO8601",
+                            errors="coerce")
+    bad = period.isna().to_numpy() | (period != period.dt.normalize()).to_numpy()
+    errors += [_error(int(idx[k]), "Период", "date_parsing",
+                      "Input should be a valid date", data["Период"][k])
+               for k in np.flatnonzero(bad)]
+    if errors:
+        _fail(errors)
+
+    df = pd.DataFrame({
+        "Период": period,
+        "Номенклатура": data["Номенклатура"],
+        "Количество": qty.to_numpy(dtype=np.int64),
+        "Код": pd.Series(data["Код"], dtype=object),
+        "ВидНоменклатуры": pd.Series(data["ВидНоменклатуры"], dtype=object),
+    })
+    # точка продаж и экзогенные факторы — только если встречаются в запросе
+    if any(v is not None for v in data[STORE_COL]):
+        df[STORE_COL] = pd.Series(data[STORE_COL], dtype=object)
+    for col in EXOG_COLS:
+        if any(v is not None for v in data[col]):
+            df[col] = pd.to_numeric(pd.Series(data[col], dtype=object), errors="coerce")
+    return df
+
+
+def parse_events(items, days_model: type) -> Tuple[int, pd.DataFrame]:
+    """Массив событий → (горизонт, продажи)"""
+    header, sales, sales_idx = split_events(items)
+    horizon = parse_horizon(header, days_model)
+    return horizon, sales_columns(sales, sales_idx)
+
+
+def _loads_body(body: bytes):
+    try:
+        return _loads(body)
+    except ValueError as e:
+        raise HTTPException(422, [{"type": "json_invalid", "loc": ["body"],
+                                   "msg": f"JSON decode error: {str(e)}", "input": None}])
+
+
+def parse_events_json(body: bytes, days_model: type) -> Tuple[int, pd.DataFrame]:
+    """JSON-тело /forecast → (горизонт, продажи)"""
+    return parse_events(_loads_body(body), days_model)
+
+
+def parse_batch_json(body: bytes) -> Dict[str, list]:
+    """JSON-тело /forecast/batch → {ключ: массив событий}; события разбираются по ключам"""
+    payloads = _loads_body(body)
+    if not isinstance(payloads, dict):
+        raise HTTPException(422, [{"type": "dict_type", "loc": ["body"],
+                                   "msg": "Input should be a valid dictionary", "input": None}])
+    return payloads
@@ -0,0 +1,73 @@
+# src/executor.py
+"""
+Исполнители для CPU-стадий прогноза, чтобы они не занимали event loop
+(и /health, /metrics отвечали, пока считается тяжёлый прогноз).
+
+Стадии и пулы:
+  • "features" — построение признаков (pandas): FEATURE_EXECUTOR =
+                 thread (по умолчанию) | process | inline;
+  • "predict"  — LightGBM predict (отпускает GIL): пул PREDICT_THREADS потоков;
+  • остальные  — разбор запроса, сборка ответа: пул CPU_THREADS потоков.
+
+Время каждой стадии пишется в ml_data_processing_duration_seconds{operation=<стадия>}.
+
+Для process функция и аргументы должны сериализоваться pickle, поэтому
+в процесс отдаются только функции модулей без побочных эффектов
+(features.py) и DataFrame; рабочие процессы создаются через fork.
+"""
+
+import asyncio, logging, multiprocessing, os, time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class StageExecutor:
+    def __init__(self, feature_backend: str = None, feature_workers: int = None,
+                 predict_threads: int = None, cpu_threads: int = None):
+        self.feature_backend = feature_backend or os.getenv("FEATURE_EXECUTOR", "thread")
+        feature_workers = feature_workers or int(os.getenv("FEATURE_WORKERS", str(os.cpu_count() or 2)))
+        predict_threads = predict_threads or int(os.getenv("PREDICT_THREADS", "2"))
+        cpu_threads     = cpu_threads or int(os.getenv("CPU_THREADS", "4"))
+
+        if self.feature_backend == "process":
+            self.feature_pool: Optional[Executor] = ProcessPoolExecutor(
+                feature_workers, mp_context=multiprocessing.get_context("fork"))
+        elif self.feature_backend == "thread":
+            self.feature_pool = ThreadPoolExecutor(feature_workers, thread_name_prefix="features")
+        elif self.feature_backend == "inline":
+            self.feature_pool = None
+        else:
+            raise ValueError(f"Неизвестный FEATURE_EXECUTOR: {self.feature_backend}")
+        self.predict_pool = ThreadPoolExecutor(predict_threads, thread_name_prefix="predict")
+        self.cpu_pool     = ThreadPoolExecutor(cpu_threads, thread_name_prefix="cpu")
+
+    def _pool(self, stage: str) -> Optional[Executor]:
+        if stage == "features":
+            return self.feature_pool
+        if stage == "predict":
+            return self.predict_pool
+        return self.cpu_pool
+
+    async def run(self, stage: str, fn: Callable, *args):
+        """fn(*args) в пуле стадии; время стадии — в метрики"""
+        start_time = time.time()
+        try:
+            pool = self._pool(stage)
+            if pool is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            metrics_collector.record_data_processing_time(stage, time.time() - start_time)
+
+    def shutdown(self):
+        for pool in (self.feature_pool, self.predict_pool, self.cpu_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Глобальный исполнитель стадий для всех запросов процесса
+stage_executor = StageExecutor()
@@ -4,9 +4,233 @@ import pandas as pd
 from sklearn.base import BaseEstimator, TransformerMixin
 
 
+def _group_codes(items) -> np.ndarray:
+    """
+    Коды групп в порядке возрастания ключа, самого узкого целого типа
+    (для 8/16 бит стабильная сортировка NumPy — поразрядная). Целые ключи
+    (интернированные номера рядов series.SERIES_COL) берутся как есть —
+    без хеширования строк.
+    """
+    values = items.to_numpy() if isinstance(items, pd.Series) else np.asarray(items)
+    if values.dtype.kind in "iu" and len(values) and values.min() >= 0:
+        return values.astype(np.min_scalar_type(int(values.max())), copy=False)
+    codes, uniq = pd.factorize(items, sort=True)
+    return codes.astype(np.min_scalar_type(max(len(uniq), 1)))
+
+
+class GroupIndex:
+    """
+    Порядок строк по (Номенклатура, Период) и границы групп-товаров,
+    вычисленные один раз. Колонки переставляются в этот порядок (take)
+    и раскладываются по календарной сетке DayGrid без повторного
+    разбиения на группы.
+    """
+
+    def __init__(self, items: pd.Series, period: pd.Series):
+        # тот же (стабильный) порядок, что и sort_values(["Номенклатура",
+        # "Период"]), но по целочисленным кодам товара и дате; NaT — в конец
+        codes = _group_codes(items)
+        ts = period.to_numpy().view("i8")
+        ts = np.where(period.isna().to_numpy(), np.iinfo("i8").max, ts)
+        pos = np.argsort(ts, kind="stable")
+        self.pos = pos[np.argsort(codes[pos], kind="stable")]
+
+        # код группы каждой строки (в порядке pos)
+        self.codes  = codes[self.pos]
+        self.starts = np.flatnonzero(np.r_[True, self.codes[1:] != self.codes[:-1]][:len(self.codes)])
+        self.ends   = np.r_[self.starts[1:], len(self.codes)] - 1
+        self.sizes  = self.ends - self.starts + 1
+        # номер строки внутри своей группы
+        self.rank   = np.arange(len(self.codes)) - np.repeat(self.starts, self.sizes)
+
+    def take(self, values) -> np.ndarray:
+        """Колонка → float-массив в порядке (товар, дата)"""
+        return np.asarray(values.to_numpy(dtype=float, na_value=np.nan)
+                          if isinstance(values, pd.Series) else values,
+                          dtype=float)[self.pos]
+
+
+class DayGrid:
+    """
+    Плотное представление истории: матрица «ряд × календарный день»
+    (строки — группы GroupIndex, столбцы — дни от самой ранней даты до
+    самой поздней). Колонка раскладывается по сетке один раз (pivot),
+    после чего лаг k — это сдвиг на k дней назад, а не на k строк, и
+    пропуски в истории не сдвигают признаки; скользящие средние —
+    разности кумулятивных сумм по строке матрицы.
+
+    Пропуски:
+      — день внутри истории ряда (от первой до последней его даты), для
+        которого нет строк, — fill_value (для продаж 0: «не продавали»);
+      — дни до первой и после последней даты ряда — NaN (истории нет);
+      — несколько строк одного дня складываются (how="sum") или
+        усредняются (how="mean" — погода, трафик).
+
+    Слева к сетке добавлено back NaN-столбцов, справа — ahead: сдвиг в
+    пределах запаса не выходит за строку матрицы, и признаки берутся
+    одним take по плоским индексам, без масок границ.
+
+    Матрица — float32 (50k рядов × 2 года ≈ 160 МБ); кумулятивные суммы
+    считаются в float64 блоками рядов по CHUNK_CELLS ячеек, так что
+    временная память от числа рядов не зависит.
+
+    span — только последние span дней каждого ряда (признаки последней
+    даты, LagMaker.transform_latest): каждый ряд выровнен по своей
+    последней дате, сетка — span + back столбцов, и одна дата из далёкого
+    прошлого (или ряд, давно переставший продаваться) её не раздувает.
+    Более ранние строки в сетку не попадают (признаки строк at /
+    rolling_mean для них — NaN), но история ряда до окна по-прежнему
+    означает «не продавали» (fill_value), а не «истории нет».
+
+    until (вместе со span; по дате на строку) — ряд выровнен не по своей
+    последней дате, а по самой поздней until своих строк: ряд, давно не
+    продававшийся, дополняется днями без продаж до общей даты отсчёта.
+    end — дата (день) последнего столбца каждого ряда.
+    """
+
+    CHUNK_CELLS = 2**22
+
+    def __init__(self, gi: GroupIndex, period: pd.Series, back: int, ahead: int = 0,
+                 span: int = None, until=None):
+        self.gi, self.back, self.ahead = gi, back, ahead
+        days = period.to_numpy("datetime64[D]")[gi.pos]
+        self.valid = ~np.isnat(days)
+        days = days.view("i8")
+        n_series = len(gi.starts)
+
+        # день каждой строки — номер столбца сетки (NaT → -1)
+        if span is None:
+            origin = days[self.valid].min() if self.valid.any() else 0
+            col = np.where(self.valid, days - origin + back, -1)
+        else:
+            # последняя дата каждого ряда — столбец back + span - 1
+            end = (np.maximum.reduceat(np.where(self.valid, days, np.iinfo("i8").min), gi.starts)
+                   if n_series else np.zeros(0, dtype="i8"))
+            if until is not None and n_series:
+                # NaT в until — минимальное i8 и на максимум не влияет
+                u = np.asarray(until, dtype="datetime64[D]")[gi.pos].view("i8")
+                end = np.maximum(end, np.maximum.reduceat(u, gi.starts))
+            self.end = end
+            col = np.where(self.valid, days - np.repeat(end, gi.sizes) + back + span - 1, -1)
+        # первый и последний столбец истории каждого ряда (пустой ряд: first > last)
+        if n_series:
+            self.last = np.maximum.reduceat(col, gi.starts)
+            self.first = np.minimum.reduceat(np.where(self.valid, col, np.iinfo("i8").max), gi.starts)
+            self.first = np.where(self.last < 0, 0, self.first)
+        else:
+            self.first = self.last = np.zeros(0, dtype="i8")
+        if span is not None:
+            # строки раньше окна — вне сетки; ряд с такой историей заполнен с начала окна
+            self.first = np.maximum(self.first, back)
+            if until is not None:
+                # дни от последней продажи до end — «не продавали»
+                self.last = np.where(self.last >= 0, back + span - 1, self.last)
+            old = self.valid & (col < back)
+            self.valid &= ~old
+            col[old] = -1
+        self.all_valid = bool(self.valid.all())
+        self.n_days = int(self.last.max(initial=back - 1)) + 1 + ahead
+
+        # плоский индекс ячейки каждой строки; строка матрицы — порядковый
+        # номер группы (целые коды групп могут идти с пропусками)
+        self.row_s = np.repeat(np.arange(n_series), gi.sizes)
+        self.cell = self.row_s * self.n_days + col
+
+    @property
+    def shape(self):
+        return len(self.gi.starts), self.n_days
+
+    def _chunks(self):
+        """Блоки рядов [a, b) по CHUNK_CELLS ячеек"""
+        n_series, n_days = self.shape
+        step = max(1, self.CHUNK_CELLS // max(n_days, 1))
+        for a in range(0, n_series, step):
+            yield a, min(a + step, n_series)
+
+    def _check(self, back: int):
+        if not -self.ahead <= back <= self.back:
+            raise ValueError(f"Сдвиг {back} дн. вне запаса сетки [-{self.ahead}, {self.back}]")
+
+    def pivot(self, v: np.ndarray, fill_value: float = 0.0, how: str = "sum") -> np.ndarray:
+        """Колонка в порядке GroupIndex (take) → матрица ряды × дни"""
+        m = np.full(self.shape, np.nan, dtype=np.float32)
+        if not np.isnan(fill_value):
+            cols = np.arange(self.n_days)
+            for a, b in self._chunks():
+                inside = (cols >= self.first[a:b, None]) & (cols <= self.last[a:b, None])
+                m[a:b][inside] = fill_value
+
+        # строки отсортированы по (ряд, дата) → одинаковые ячейки идут подряд
+        cells = self.cell if self.all_valid else self.cell[self.valid]
+        if not self.all_valid:
+            v = v[self.valid]
+        if len(cells):
+            runs = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            if how == "sum":
+                agg = np.add.reduceat(v, runs)
+            elif how == "mean":
+                agg = np.add.reduceat(v, runs) / np.diff(np.r_[runs, len(cells)])
+            else:
+                raise ValueError(f"Неизвестная агрегация: {how}")
+            m.reshape(-1)[cells[runs]] = agg
+        return m
+
+    def _rows(self, out: np.ndarray) -> np.ndarray:
+        if not self.all_valid:
+            out[~self.valid] = np.nan
+        return out
+
+    # ── признаки для каждой строки (порядок GroupIndex)
+    def at(self, m: np.ndarray, back: int = 0) -> np.ndarray:
+        """Значение за back дней до даты строки (back < 0 — вперёд) или NaN"""
+        self._check(back)
+        return self._rows(m.reshape(-1).take(self.cell - back).astype(float))
+
+    def rolling_mean(self, m: np.ndarray, win: int) -> np.ndarray:
+        """
+        Среднее за win дней по дату строки включительно; окно с NaN (в том
+        числе до начала истории ряда) → NaN. Для целых значений (продажи,
+        шт.) совпадает с pandas rolling(win).mean() бит-в-бит.
+        """
+        self._check(win)
+        gi, n_days = self.gi, self.n_days
+        out = np.empty(len(self.cell))
+        for a, b in self._chunks():
+            sub = m[a:b]
+            nan = np.isnan(sub)
+            cs = np.cumsum(np.where(nan, 0.0, sub), axis=1, dtype=np.float64).reshape(-1)
+            cn = np.cumsum(nan, axis=1, dtype=np.int32).reshape(-1)
+
+            # окно (t - win, t] по строке матрицы; t - win >= 0 за счёт запаса back
+            rows = slice(gi.starts[a], gi.ends[b - 1] + 1) if b > a else slice(0, 0)
+            hi = self.cell[rows] - a * n_days
+            lo = hi - win
+            val = (cs.take(hi) - cs.take(lo)) / win
+            val[cn.take(hi) != cn.take(lo)] = np.nan
+            out[rows] = val
+        return self._rows(out)
+
+    # ── признаки последней даты каждого ряда
+    def tail(self, m: np.ndarray, n: int) -> np.ndarray:
+        """n последних дней истории каждого ряда: матрица (ряды × n), слева NaN, если короче"""
+        self._check(n - 1)
+        idx = (np.arange(len(self.last)) * self.n_days + self.last)[:, None] - np.arange(n)[::-1]
+        out = m.reshape(-1).take(idx).astype(float)
+        out[self.last < 0] = np.nan
+        return out
+
+    def last_value(self, m: np.ndarray, back: int = 0) -> np.ndarray:
+        """Значение за back дней до последней даты каждого ряда (или NaN)"""
+        return self.tail(m, back + 1)[:, 0]
+
+    def last_mean(self, m: np.ndarray, win: int) -> np.ndarray:
+        """rolling_mean(win) на последнюю дату каждого ряда"""
+        return self.tail(m, win).sum(axis=1) / win
+
+
 class LagMaker(BaseEstimator, TransformerMixin):
     """
-    Добавляет:
+    Добавляет (лаги и окна — в календарных днях, см. DayGrid):
       — лаги продаж 7, 14, 30, 60;
       — скользящие средние 7, 30;
       — тренд 7;
@@ -21,10 +245,13 @@ class LagMaker(BaseEstimator, TransformerMixin):
     def __init__(self,
                  sales_lags=(7, 14, 30, 60),
                  exog_lags=(1, 7),
-                 ma_windows=(7, 30)):
+                 ma_windows=(7, 30),
+                 group_col="Номенклатура"):
         self.sales_lags = sales_lags
         self.exog_lags  = exog_lags
         self.ma_windows = ma_windows
+        # колонка-идентификатор временного ряда (по умолчанию — товар)
+        self.group_col  = group_col
 
         # как называются опциональные колонки-факторы
         self.exog_cols = ["Temp", "Rain_mm", "BadWeather", "FootTraffic"]
@@ -34,52 +261,210 @@ class LagMaker(BaseEstimator, TransformerMixin):
         return self
 
     def transform(self, X: pd.DataFrame) -> pd.DataFrame:
-        df = X.copy()
+        return self._transform(X)[0]
+
+    def transform_with_target(self, X: pd.DataFrame, ahead: int = 1) -> pd.DataFrame:
+        """
+        transform(X) и колонка Target — продажи через ahead календарных
+        дней после даты строки (пропущенный день внутри истории — 0,
+        за последней датой ряда — NaN).
+        """
+        df, grid, sales = self._transform(X, ahead)
+        df["Target"] = grid.at(sales, -ahead)
+        return df
 
+    def _transform(self, X: pd.DataFrame, ahead: int = 0):
+        period = X["Период"]
         # убеждаемся, что «Период» — datetime
-        if not np.issubdtype(df["Период"].dtype, np.datetime64):
-            df["Период"] = pd.to_datetime(df["Период"])
+        if not np.issubdtype(period.dtype, np.datetime64):
+            period = pd.to_datetime(period)
 
-        df = df.sort_values(["Номенклатура", "Период"])
-        g_sales = df.groupby("Номенклатура")["Количество"]
+        # одна сортировка и одна раскладка по дням на все признаки продаж
+        gi = GroupIndex(X[self.group_col], period)
+        grid = DayGrid(gi, period, self.history_len, ahead)
+        df = X.iloc[gi.pos].copy()
+        df["Период"] = period.iloc[gi.pos]
+        sales = grid.pivot(gi.take(X["Количество"]))
 
         # ── лаги продаж
         for lag in self.sales_lags:
-            df[f"lag_{lag}"] = g_sales.shift(lag).fillna(0)
+            df[f"lag_{lag}"] = grid.at(sales, lag)
 
-        # ── скользящее среднее/стд
+        # ── скользящее среднее
         for win in self.ma_windows:
-            df[f"ma_{win}"] = (
-                g_sales.rolling(win).mean().reset_index(0, drop=True).fillna(0)
-            )
+            df[f"ma_{win}"] = grid.rolling_mean(sales, win)
 
         # ── тренд 7
-        df["trend_7"] = g_sales.transform(
-            lambda s: (s - s.shift(7)).fillna(0) / 7
-        )
-        # ── календарные признаки
+        df["trend_7"] = np.nan_to_num(grid.at(sales) - grid.at(sales, 7), nan=0.0) / 7
+
+        self._add_calendar(df)
+        self._add_exog(df, grid, gi, X)
+
+        # любые NaN → 0 (после lag/rolling)
+        return df.fillna(0.0), grid, sales
+
+    @property
+    def history_len(self) -> int:
+        """Сколько последних продаж ряда нужно для признаков одной даты"""
+        return max(max(self.sales_lags), max(self.ma_windows), 7) + 1
+
+    def transform_latest(self, X: pd.DataFrame, until=None) -> pd.DataFrame:
+        """
+        Режим инференса: те же признаки, что и transform(X), но только
+        для последней даты каждого ряда — эквивалент
+        transform(X).groupby(group_col).tail(1).
+
+        Лаги/средние/тренд считаются напрямую по хвосту ряда длиной
+        max(лаг, окно) дней, а не по всей истории: в сетку DayGrid попадают
+        только последние history_len дней каждого ряда. Признаки продаж
+        совпадают с transform бит-в-бит, вещественные экзогенные средние —
+        с точностью до порядка суммирования.
+
+        until — общая дата отсчёта (или дата на каждую строку X): признаки
+        строятся на неё, а не на последнюю дату ряда; дни после последней
+        продажи ряда — без продаж (см. DayGrid).
+        """
+        return self._latest(X, until)[0]
+
+    def transform_latest_history(self, X: pd.DataFrame, until=None):
+        """
+        transform_latest(X) и хвост продаж каждого ряда — матрица
+        (ряды × history_len) в том же порядке строк; по ней признаки
+        сдвигаются на следующие дни (horizon.HorizonRoller).
+        """
+        last, grid, sales = self._latest(X, until)
+        return last, grid.tail(sales, self.history_len)
+
+    def _latest(self, X: pd.DataFrame, until=None):
+        period = X["Период"]
+        if not np.issubdtype(period.dtype, np.datetime64):
+            period = pd.to_datetime(period)
+        if until is not None and np.ndim(until) == 0:
+            until = np.full(len(X), pd.Timestamp(until).to_datetime64())
+
+        gi = GroupIndex(X[self.group_col], period)
+        grid = DayGrid(gi, period, self.history_len, span=self.history_len, until=until)
+        last = X.iloc[gi.pos[gi.ends]].copy()
+        if until is None:
+            last["Период"] = period.iloc[gi.pos[gi.ends]]
+        else:
+            last["Период"] = grid.end.astype("datetime64[D]").astype("datetime64[ns]")
+        sales = grid.pivot(gi.take(X["Количество"]))
+        if until is not None:
+            last["Количество"] = grid.last_value(sales)   # продажи на дату отсчёта
+
+        # ── лаги продаж
+        for lag in self.sales_lags:
+            last[f"lag_{lag}"] = grid.last_value(sales, lag)
+
+        # ── скользящее среднее
+        for win in self.ma_windows:
+            last[f"ma_{win}"] = grid.last_mean(sales, win)
+
+        # ── тренд 7
+        last["trend_7"] = np.nan_to_num(grid.last_value(sales) - grid.last_value(sales, 7), nan=0.0) / 7
+
+        self._add_calendar(last)
+
+        # ── экзогенные факторы
+        for col in self.exog_cols:
+            if col not in X.columns:
+                continue
+            ex = grid.pivot(gi.take(X[col]), fill_value=np.nan, how="mean")
+            for lag in self.exog_lags:
+                last[f"{col}_lag{lag}"] = grid.last_value(ex, lag)
+            last[f"{col}_ma7"] = grid.last_mean(ex, 7)
+
+        return last.fillna(0.0), grid, sales
+
+    # ── календарные признаки
+    @staticmethod
+    def _add_calendar(df: pd.DataFrame):
         df["dow"]     = df["Период"].dt.dayofweek
         df["weeknum"] = df["Период"].dt.isocalendar().week.astype(int)
         df["month"]   = df["Период"].dt.month
         df["quarter"] = df["Период"].dt.quarter
         df["year"]    = df["Период"].dt.year
 
-        # ── экзогенные факторы (погода, трафик) + их лаги
+    # ── экзогенные факторы (погода, трафик) + их лаги; дни без данных — NaN
+    def _add_exog(self, df: pd.DataFrame, grid: "DayGrid", gi: GroupIndex, X: pd.DataFrame):
         for col in self.exog_cols:
-            if col not in df.columns:
+            if col not in X.columns:
                 continue
-            g_ex = df.groupby("Номенклатура")[col]
+            ex = grid.pivot(gi.take(X[col]), fill_value=np.nan, how="mean")
             for lag in self.exog_lags:
-                df[f"{col}_lag{lag}"] = g_ex.shift(lag).fillna(g_ex.mean())
+                df[f"{col}_lag{lag}"] = grid.at(ex, lag)
 
             # скользящее среднее 7 для плавности
-            df[f"{col}_ma7"] = (
-                g_ex.rolling(7).mean().reset_index(0, drop=True)
-                    .fillna(g_ex.mean())
-            )
+            df[f"{col}_ma7"] = grid.rolling_mean(ex, 7)
 
-        # любые NaN → 0 (после lag/rolling)
-        return df.fillna(0.0)
+
+def aggregate_daily(X: pd.DataFrame, group_col: str = "Номенклатура",
+                    sum_cols=("Количество",), first_cols=("Код", "ВидНоменклатуры"),
+                    mean_cols=None) -> pd.DataFrame:
+    """
+    Пред-агрегация событий (чеки, смены кассы) до одной строки на
+    (ряд, день) — перед построением признаков:
+      — sum_cols складываются (пропуски — 0);
+      — mean_cols (по умолчанию экзогенные LagMaker) — среднее непустых;
+      — first_cols — первое непустое значение дня в порядке строк X.
+    Прочие колонки отбрасываются, Период усекается до дня, строки
+    упорядочены по (ряд, день) — и тогда, когда повторов (ряд, день) нет.
+    """
+    if mean_cols is None:
+        mean_cols = LagMaker().exog_cols
+    period = X["Период"]
+    if not np.issubdtype(period.dtype, np.datetime64):
+        period = pd.to_datetime(period)
+    day = period.dt.normalize()
+
+    # один argsort по ключу (код товара, день, номер строки): внутри дня
+    # сохраняется порядок строк X; NaT — отдельный «день» в начале ряда
+    codes = _group_codes(X[group_col])
+    d = day.to_numpy("datetime64[D]")
+    nat = np.isnat(d)
+    d = d.view("i8")
+    d0 = d[~nat].min() - 1 if not nat.all() else 0
+    d = np.where(nat, 0, d - d0)
+    key = codes.astype("i8") * (int(d.max(initial=0)) + 1) + d
+    n = len(X)
+    if int(key.max(initial=0)) < np.iinfo("i8").max // max(n, 1):
+        # ключи уникальны → быстрый нестабильный sort даёт стабильный порядок
+        pos = np.argsort(key * n + np.arange(n), kind="quicksort")
+    else:
+        pos = np.argsort(key, kind="stable")
+    key = key[pos]
+    runs = np.flatnonzero(np.r_[True, key[1:] != key[:-1]][:n])
+    ends = np.r_[runs[1:], n]
+    first = pos[runs]
+
+    # строковые колонки (arrow) не материализуются целиком — берутся только нужные строки
+    out = pd.DataFrame({group_col: X[group_col].iloc[first].to_numpy(),
+                        "Период": day.to_numpy()[first]})
+    for col in sum_cols:
+        v = X[col].to_numpy()[pos]
+        if v.dtype.kind not in "iu":
+            v = np.nan_to_num(v.astype(float), nan=0.0)
+        out[col] = np.add.reduceat(v, runs)
+    for col in first_cols:
+        if col not in X.columns:
+            continue
+        filled = np.flatnonzero(X[col].notna().to_numpy()[pos])
+        k = np.searchsorted(filled, runs)
+        has = k < len(filled)
+        has[has] = filled[k[has]] < ends[has]
+        res = np.full(len(runs), None, dtype=object)
+        res[has] = X[col].iloc[pos[filled[k[has]]]].to_numpy()
+        out[col] = res
+    for col in mean_cols:
+        if col not in X.columns:
+            continue
+        v = X[col].to_numpy(dtype=float, na_value=np.nan)[pos]
+        ok = ~np.isnan(v)
+        total = np.add.reduceat(np.where(ok, v, 0.0), runs)
+        count = np.add.reduceat(ok.astype(np.int64), runs)
+        out[col] = np.where(count > 0, total / np.maximum(count, 1), np.nan)
+    return out
 
 
 def safe_mape(y_true, y_pred, eps: float = 1.0) -> float:
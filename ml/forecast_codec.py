@@ -0,0 +1,202 @@
+# src/forecast_codec.py
+"""
+Компактная сериализация ответов /forecast для кеша (вместо pickle).
+
+Ответ — список строк-словарей с одинаковыми ключами (схема Row). Он
+хранится по колонкам: колонка, одинаковая во всех строках (Период, MAPE,
+MAE), записывается один раз, остальные — массивами значений; ключи
+строк не повторяются. Колонки кодируются JSON (orjson, если установлен)
+и сжимаются. Чтение не исполняет код (в отличие от pickle), поэтому
+содержимое общего Redis не может навредить процессу.
+
+Формат блоба: b"MLF" | версия формата (1 байт) | сжатие (1 байт) | данные.
+Читатель понимает все версии из DECODERS; писатель пишет версию
+CACHE_CODEC_VERSION — при смене формата сначала выкатываются читатели,
+затем переключаются писатели. Неизвестная версия, чужой блоб (например,
+pickle старых реплик) или битые данные — DecodeError, для кеша это промах.
+
+Версии:
+  1 — все строки одной таблицей колонок; строки с разными ключами
+      (ответ с заголовком Head) — как есть, списком словарей;
+  2 — строки перед однородным хвостом (заголовок Head) — как есть,
+      хвост — колонками.
+
+Настройки (env):
+  CACHE_CODEC_VERSION     — версия формата для записи, 1 (2 — после того,
+                            как все реплики умеют её читать);
+  CACHE_CODEC_COMPRESSION — zstd | lz4 | zlib | none; по умолчанию zstd,
+                            если установлен zstandard, иначе zlib;
+  CACHE_CODEC_MIN_SIZE    — данные короче (байт) не сжимаются, 512.
+"""
+
+import json, logging, os, zlib
+from typing import Any, Dict, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+MAGIC = b"MLF"
+HEADER_SIZE = len(MAGIC) + 2
+
+NONE, ZLIB, ZSTD, LZ4 = 0, 1, 2, 3
+COMPRESSION_IDS = {"none": NONE, "zlib": ZLIB, "zstd": ZSTD, "lz4": LZ4}
+
+
+class DecodeError(ValueError):
+    """Блоб не является ответом в известном формате"""
+
+
+# ────────── JSON
+def _default(obj):
+    if hasattr(obj, "item"):   # скаляры numpy
+        return obj.item()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+
+def _loads(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+# ────────── сжатие
+def _compress(comp: int, data: bytes) -> bytes:
+    if comp == ZLIB:
+        return zlib.compress(data, 6)
+    if comp == ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    if comp == LZ4:
+        return lz4_frame.compress(data)
+    return data
+
+
+def _decompress(comp: int, data: bytes) -> bytes:
+    if comp == NONE:
+        return data
+    if comp == ZLIB:
+        return zlib.decompress(data)
+    if comp == ZSTD and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    if comp == LZ4 and lz4_frame is not None:
+        return lz4_frame.decompress(data)
+    raise DecodeError(f"Сжатие {comp} не поддерживается этим процессом")
+
+
+def _default_compression() -> int:
+    name = os.getenv("CACHE_CODEC_COMPRESSION", "zstd" if zstandard is not None else "zlib")
+    comp = COMPRESSION_IDS.get(name.lower())
+    if comp is None:
+        logging.warning(f"Неизвестное CACHE_CODEC_COMPRESSION={name}; используется zlib")
+        return ZLIB
+    if (comp == ZSTD and zstandard is None) or (comp == LZ4 and lz4_frame is None):
+        logging.warning(f"Сжатие {name} недоступно (не установлен модуль); используется zlib")
+        return ZLIB
+    return comp
+
+
+# ────────── версия 1: колонки
+def _columns(rows: List[Dict[str, Any]], keys: List[str]) -> Dict[str, Any]:
+    const, cols = {}, {}
+    for key in keys:
+        values = [r[key] for r in rows]
+        first = values[0]
+        if all(v == first and type(v) is type(first) for v in values):
+            const[key] = first
+        else:
+            cols[key] = values
+    return {"n": len(rows), "keys": keys, "const": const, "cols": cols}
+
+
+def _rows(doc: Any) -> List[Dict[str, Any]]:
+    keys, const, cols = doc["keys"], doc["const"], doc["cols"]
+    if not cols:
+        return [dict(const) for _ in range(doc["n"])]
+    # шаблон строки с постоянными колонками (порядок ключей сохраняется)
+    template = {k: const.get(k) for k in keys}
+    var_keys = [k for k in keys if k in cols]
+    rows = []
+    for values in zip(*[cols[k] for k in var_keys]):
+        row = template.copy()
+        row.update(zip(var_keys, values))
+        rows.append(row)
+    return rows
+
+
+def _encode_v1(rows: List[Dict[str, Any]]) -> Any:
+    keys = list(rows[0]) if rows else []
+    if any(len(r) != len(keys) or list(r) != keys for r in rows):
+        return {"rows": rows}   # разнородные строки — как есть
+    return _columns(rows, keys)
+
+
+def _decode_v1(doc: Any) -> List[Dict[str, Any]]:
+    if "rows" in doc:
+        return doc["rows"]
+    return _rows(doc)
+
+
+# ────────── версия 2: заголовок как есть + колонки
+def _encode_v2(rows: List[Dict[str, Any]]) -> Any:
+    # строки с одинаковыми ключами в конце ответа — колонками, всё перед
+    # ними (заголовок Head) — как есть
+    keys = list(rows[-1]) if rows else []
+    start = len(rows)
+    while start > 0 and len(rows[start - 1]) == len(keys) and list(rows[start - 1]) == keys:
+        start -= 1
+    return {"head": rows[:start], **_columns(rows[start:], keys)}
+
+
+def _decode_v2(doc: Any) -> List[Dict[str, Any]]:
+    return list(doc["head"]) + _rows(doc)
+
+
+ENCODERS = {1: _encode_v1, 2: _encode_v2}
+DECODERS = {1: _decode_v1, 2: _decode_v2}
+
+
+class ForecastCodec:
+    def __init__(self, version: int = None, compression: int = None, min_size: int = None):
+        if version is None:
+            version = int(os.getenv("CACHE_CODEC_VERSION", "1"))
+        if version not in ENCODERS:
+            raise ValueError(f"Неизвестная версия формата кеша: {version}")
+        self.version = version
+        self.compression = _default_compression() if compression is None else compression
+        self.min_size = int(os.getenv("CACHE_CODEC_MIN_SIZE", "512")) if min_size is None else min_size
+
+    def encode(self, rows: List[Dict[str, Any]]) -> bytes:
+        data = _dumps(ENCODERS[self.version](rows))
+        comp = self.compression if len(data) >= self.min_size else NONE
+        return MAGIC + bytes((self.version, comp)) + _compress(comp, data)
+
+    def decode(self, blob: bytes) -> List[Dict[str, Any]]:
+        if len(blob) < HEADER_SIZE or blob[:len(MAGIC)] != MAGIC:
+            raise DecodeError("Неизвестный формат записи кеша")
+        version, comp = blob[len(MAGIC)], blob[len(MAGIC) + 1]
+        if version not in DECODERS:
+            raise DecodeError(f"Неизвестная версия формата кеша: {version}")
+        try:
+            return DECODERS[version](_loads(_decompress(comp, blob[HEADER_SIZE:])))
+        except DecodeError:
+            raise
+        except Exception as e:
+            raise DecodeError(f"Повреждённая запись кеша: {e}") from e
+
+
+forecast_codec = ForecastCodec()
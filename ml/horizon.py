@@ -0,0 +1,74 @@
+# src/horizon.py
+"""
+Рекурсивный прогноз на несколько дней вперёд.
+
+Модель предсказывает продажи следующего дня по признакам LagMaker
+последней даты ряда. HorizonRoller держит хвост продаж каждого ряда
+(LagMaker.history_len значений) и после каждого шага дописывает в него
+прогноз: лаги, скользящие средние, тренд и календарь следующей даты
+пересчитываются векторно для всех рядов сразу. Горизонт в H дней — это
+H батчевых predict по всем товарам, а не H × N одиночных.
+
+Первый шаг совпадает с прежним прогнозом на один день бит-в-бит
+(признаки берутся из transform_latest как есть). Прочие колонки
+признаков (ItemEnc, экзогенные факторы — их будущее неизвестно)
+остаются значениями последней даты.
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from features import LagMaker
+
+CALENDAR_COLS = ["dow", "weeknum", "month", "quarter", "year"]
+
+
+class HorizonRoller:
+    def __init__(self, latest: pd.DataFrame, history: np.ndarray, feature_cols: List[str],
+                 maker: LagMaker = None):
+        maker = maker or LagMaker()
+        self.feature_cols = list(feature_cols)
+        self.X = latest[self.feature_cols].to_numpy(dtype=float, copy=True)
+        self.hist = np.array(history, dtype=float)   # ряды × history_len, последний — текущий день
+        self.dates = latest["Период"].to_numpy("datetime64[D]").copy()
+
+        pos = {c: i for i, c in enumerate(self.feature_cols)}
+        self.lags = [(pos[f"lag_{k}"], k) for k in maker.sales_lags if f"lag_{k}" in pos]
+        self.mas = [(pos[f"ma_{w}"], w) for w in maker.ma_windows if f"ma_{w}" in pos]
+        self.trend = pos.get("trend_7")
+        self.calendar = [(pos[c], c) for c in CALENDAR_COLS if c in pos]
+
+    def frame(self) -> pd.DataFrame:
+        """Признаки текущей даты каждого ряда (вход predict)"""
+        return pd.DataFrame(self.X, columns=self.feature_cols, copy=False)
+
+    def last(self) -> np.ndarray:
+        """Продажи (или прогноз) текущей даты"""
+        return self.hist[:, -1]
+
+    def mean(self, win: int) -> np.ndarray:
+        """Среднее за win последних дней (0, если истории меньше — как fillna в LagMaker)"""
+        return np.nan_to_num(self.hist[:, -win:].sum(axis=1) / win, nan=0.0)
+
+    def step(self, y: np.ndarray):
+        """Дописывает прогноз следующего дня и пересчитывает признаки на эту дату"""
+        self.hist[:, :-1] = self.hist[:, 1:]
+        self.hist[:, -1] = y
+        self.dates += np.timedelta64(1, "D")
+
+        for i, lag in self.lags:
+            self.X[:, i] = np.nan_to_num(self.hist[:, -1 - lag], nan=0.0)
+        for i, win in self.mas:
+            self.X[:, i] = self.mean(win)
+        if self.trend is not None:
+            self.X[:, self.trend] = np.nan_to_num(self.hist[:, -1] - self.hist[:, -8], nan=0.0) / 7
+        if self.calendar:
+            # календарь — по уникальным датам (у рядов их обычно единицы)
+            uniq, inv = np.unique(self.dates, return_inverse=True)
+            idx = pd.DatetimeIndex(uniq)
+            values = {"dow": idx.dayofweek, "weeknum": idx.isocalendar().week.to_numpy(),
+                      "month": idx.month, "quarter": idx.quarter, "year": idx.year}
+            for i, col in self.calendar:
+                self.X[:, i] = np.asarray(values[col], dtype=float)[inv]
@@ -0,0 +1,252 @@
+# src/ingest.py
+"""
+Чтение выгрузок продаж для обучения (train.load_dataframe, --stream).
+
+  • CSV — потоковым многопоточным pyarrow.csv, только колонки SALES_COLS
+    (без pyarrow — pandas read_csv(usecols=...) в один поток);
+  • Parquet — только колонки SALES_COLS;
+  • JSON (массив событий, как приходит в API) — потоком: события
+    разбираются по одному и копятся в небольшие кадры, список словарей
+    всей выгрузки в памяти не собирается;
+  • Период — векторно по формату: заданному или определённому по первым
+    значениям (DATE_FORMATS); поэлементный pd.to_datetime(dayfirst=True)
+    остаётся запасным путём для форматов не из списка;
+  • Количество — int32, если дробных значений нет.
+"""
+
+import csv, itertools, json, logging, pathlib, re
+from typing import Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from series import ITEM_COL, STORE_COL
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    logging.warning("pyarrow не установлен; выгрузки читаются pandas в один поток")
+
+SALES_COLS = [ITEM_COL, STORE_COL, "Период", "Количество"]   # всё, что нужно признакам
+
+# Форматы Периода, которые пробуются по порядку (1С выгружает DD.MM.YYYY)
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%Y %H:%M:%S", "%Y-%m-%d", "%Y-%m-%dT%H:%M:%S",
+                "%Y-%m-%d %H:%M:%S", "%d/%m/%Y"]
+DATE_SAMPLE = 1000
+DATE_MIN_SHARE = 0.9   # доля первых значений, которую должен разобрать формат
+CSV_BLOCK = 4 << 20
+JSON_BATCH_ROWS = 50_000   # событий-словарей в памяти за раз
+
+
+# ───────────────────────── колонки ─────────────────────────
+def _strptime(values: pd.Series, fmt: str) -> pd.Series:
+    """Строки → datetime64[us] по формату fmt (pyarrow — векторно, без копии строк); не подошедшие — NaT"""
+    if pa is None:
+        return pd.to_datetime(values, format=fmt, errors="coerce").astype("datetime64[us]")
+    arr = pa.array(values, from_pandas=True)
+    if not (pa.types.is_string(arr.type) or pa.types.is_large_string(arr.type)):
+        arr = pc.cast(arr, pa.string())
+    parsed = pc.strptime(arr, format=fmt, unit="s", error_is_null=True)
+    return pd.Series(parsed.to_numpy(zero_copy_only=False).astype("datetime64[us]"),
+                     index=values.index)
+
+
+def detect_date_format(values: pd.Series, sample: int = DATE_SAMPLE) -> Optional[str]:
+    """
+    Формат DATE_FORMATS, разбирающий больше всего из первых sample непустых
+    значений (не меньше DATE_MIN_SHARE: единичный мусор формат не ломает)
+    """
+    head = values.dropna().head(sample)
+    if head.empty:
+        return None
+    parsed = [int(_strptime(head, fmt).notna().sum()) for fmt in DATE_FORMATS]
+    best = int(np.argmax(parsed))
+    return DATE_FORMATS[best] if parsed[best] >= DATE_MIN_SHARE * len(head) else None
+
+
+def parse_period(values: pd.Series, fmt: Optional[str] = None) -> pd.Series:
+    """
+    Период → datetime64; неразобранные значения — NaT (как errors="coerce").
+    fmt=None — формат определяется по первым значениям, а если ни один из
+    DATE_FORMATS не подошёл — прежний поэлементный разбор с dayfirst.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    fmt = fmt or detect_date_format(values)
+    if fmt is None:
+        return pd.to_datetime(values, dayfirst=True, errors="coerce")
+    return _strptime(values, fmt)
+
+
+def compact_quantity(values: pd.Series) -> pd.Series:
+    """Количество → int32, если все значения целые и помещаются; иначе как есть"""
+    if values.dtype.kind not in "iuf" or values.empty:
+        return values
+    v = values.to_numpy()
+    if v.dtype.kind == "f" and (np.isnan(v).any() or (v != np.round(v)).any()):
+        return values
+    if v.min() < np.iinfo(np.int32).min or v.max() > np.iinfo(np.int32).max:
+        return values
+    return values.astype(np.int32)
+
+
+def _finish(df: pd.DataFrame) -> pd.DataFrame:
+    if "Количество" in df.columns:
+        df["Количество"] = compact_quantity(df["Количество"])
+    return df
+
+
+# ───────────────────────── CSV / Parquet ─────────────────────────
+def csv_columns(path: pathlib.Path) -> List[str]:
+    """Заголовок CSV"""
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), [])
+
+
+def _open_csv(path: pathlib.Path, wanted: List[str]):
+    """
+    Потоковый многопоточный pyarrow-читатель: блоки по CSV_BLOCK байт, буферы
+    разбора переиспользуются (read_csv целиком держит их для всех блоков —
+    пик памяти втрое больше таблицы). Типы заданы явно: тип по первому блоку
+    ломается, если дробное Количество встретится дальше; Период —
+    строкой, он разбирается отдельно по формату.
+    """
+    types = {c: pa.string() for c in wanted}
+    if "Количество" in types:
+        types["Количество"] = pa.float64()
+    return pa_csv.open_csv(path,
+                           read_options=pa_csv.ReadOptions(use_threads=True, block_size=CSV_BLOCK),
+                           convert_options=pa_csv.ConvertOptions(include_columns=wanted,
+                                                                 column_types=types,
+                                                                 strings_can_be_null=True))
+
+
+def read_sales_csv(path: pathlib.Path, columns: List[str] = SALES_COLS) -> pd.DataFrame:
+    """CSV → DataFrame только с колонками columns (какие есть в файле)"""
+    wanted = [c for c in columns if c in csv_columns(path)]
+    if pa is None:
+        return _finish(pd.read_csv(path, usecols=wanted))
+    return _finish(_open_csv(path, wanted).read_all().to_pandas())
+
+
+def iter_sales_csv(path: pathlib.Path, chunksize: int,
+                   columns: List[str] = SALES_COLS) -> Iterator[pd.DataFrame]:
+    """CSV кусками примерно по chunksize строк (с точностью до блока), только колонки columns"""
+    wanted = [c for c in columns if c in csv_columns(path)]
+    if pa is None:
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=wanted):
+            yield _finish(chunk)
+        return
+    batches, rows = [], 0
+    for batch in _open_csv(path, wanted):
+        batches.append(batch)
+        rows += batch.num_rows
+        if rows >= chunksize:
+            yield _finish(pa.Table.from_batches(batches).to_pandas())
+            batches, rows = [], 0
+    if batches:
+        yield _finish(pa.Table.from_batches(batches).to_pandas())
+
+
+def read_sales_parquet(path: pathlib.Path, columns: List[str] = SALES_COLS) -> pd.DataFrame:
+    if pa is None:
+        df = pd.read_parquet(path)
+        return _finish(df[[c for c in columns if c in df.columns]])
+    names = pq.read_schema(path).names
+    return _finish(pq.read_table(path, columns=[c for c in columns if c in names],
+                                 use_threads=True).to_pandas())
+
+
+def iter_sales_parquet(path: pathlib.Path, chunksize: int,
+                       columns: List[str] = SALES_COLS) -> Iterator[pd.DataFrame]:
+    if pa is None:
+        yield read_sales_parquet(path, columns)
+        return
+    pf = pq.ParquetFile(path)
+    cols = [c for c in columns if c in pf.schema_arrow.names]
+    for batch in pf.iter_batches(batch_size=chunksize, columns=cols):
+        yield _finish(batch.to_pandas())
+
+
+# ───────────────────────── JSON ─────────────────────────
+_SKIP = re.compile(r"[\s,]*")
+
+
+def iter_json_array(f, block: int = 1 << 20) -> Iterator[dict]:
+    """
+    Элементы JSON-массива из текстового файла: файл читается блоками по
+    block символов. Целые элементы блока разбираются одним loads (orjson)
+    (блок режется по последней «}»: если разрез не на границе элемента,
+    такой префикс не является корректным JSON), остаток — по одному
+    json.JSONDecoder.raw_decode до следующего блока.
+    """
+    decoder = json.JSONDecoder()
+    buf = f.read(block).lstrip("\ufeff \t\r\n")
+    if not buf.startswith("["):
+        raise ValueError("Ожидается JSON-массив событий")
+    pos, eof, fast = 1, False, True
+    while True:
+        pos = _SKIP.match(buf, pos).end()
+        if pos < len(buf) and buf[pos] == "]":
+            return
+        if fast:
+            fast = False
+            cut = buf.rfind("}", pos) + 1
+            if cut > pos:
+                try:
+                    items = _loads("[" + buf[pos:cut] + "]")
+                except json.JSONDecodeError:
+                    pass
+                else:
+                    yield from items
+                    pos = cut
+            continue
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            end = len(buf)
+        if end == len(buf) and not eof:
+            # элемент упёрся в конец блока (число могло оборваться) — дочитываем
+            more = f.read(block)
+            eof = not more
+            buf, pos, fast = buf[pos:] + more, 0, True
+            continue
+        yield obj
+        pos = end
+
+
+def iter_sales_json(path: pathlib.Path, batch_rows: int = JSON_BATCH_ROWS,
+                    columns: List[str] = SALES_COLS) -> Iterator[pd.DataFrame]:
+    """
+    Продажи (Type == «Продажа») из JSON-массива событий — кадрами не
+    больше batch_rows строк, только колонки columns; колонка без единого
+    значения в кадр не попадает.
+    """
+    with open(path, encoding="utf-8") as f:
+        events = iter_json_array(f)
+        while batch := list(itertools.islice(events, batch_rows)):
+            sales = [e for e in batch if e.get("Type") == "Продажа"]
+            if not sales:
+                continue
+            values = {c: [e.get(c) for e in sales] for c in columns}
+            yield _finish(pd.DataFrame({c: v for c, v in values.items()
+                                        if any(x is not None for x in v)}))
+
+
+def read_sales_json(path: pathlib.Path, columns: List[str] = SALES_COLS) -> pd.DataFrame:
+    frames = list(iter_sales_json(path, columns=columns))
+    if not frames:
+        raise ValueError("JSON не содержит продаж (Type=='Продажа')")
+    return _finish(pd.concat(frames, ignore_index=True))
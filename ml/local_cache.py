@@ -0,0 +1,110 @@
+# src/local_cache.py
+"""
+Локальный (в памяти процесса) уровень кеша ответов перед Redis.
+
+LRU с TTL, ограниченный и числом записей, и суммарным размером (байты
+сериализованного ответа). Записи хранятся готовыми Python-объектами —
+повторный одинаковый запрос обслуживается без сетевого обхода и без
+десериализации.
+
+Записи, положенные этим процессом, помечены товарами, организацией и
+версией модели, чтобы инвалидировать их вместе с Redis-уровнем
+(cache_manager рассылает инвалидации всем репликам через pub/sub).
+Записи, прочитанные из Redis, пометок не имеют и сбрасываются при любой
+инвалидации.
+
+Настройки (env):
+  LOCAL_CACHE_MAX_ENTRIES — максимум записей (0 — уровень выключен), 1000;
+  LOCAL_CACHE_MAX_MB      — максимум суммарного размера, 128;
+  LOCAL_CACHE_TTL         — время жизни записи, с, 300.
+"""
+
+import os, threading, time
+from collections import OrderedDict
+from typing import Any, Iterable, NamedTuple, Optional
+
+
+class _Entry(NamedTuple):
+    value: Any
+    size: int
+    expires: float
+    items: Optional[frozenset]   # None — пометки неизвестны (запись взята из Redis)
+    org: Optional[str]
+    version: Optional[str]
+
+
+class LocalCache:
+    def __init__(self, max_entries: int = None, max_bytes: int = None, ttl: float = None):
+        if max_entries is None:
+            max_entries = int(os.getenv("LOCAL_CACHE_MAX_ENTRIES", "1000"))
+        if max_bytes is None:
+            max_bytes = int(float(os.getenv("LOCAL_CACHE_MAX_MB", "128")) * 2**20)
+        if ttl is None:
+            ttl = float(os.getenv("LOCAL_CACHE_TTL", "300"))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()   # обращения идут и из пулов stage_executor
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: str):
+        """Значение или None (промах / истёк TTL)"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry.value
+
+    def set(self, key: str, value, size: int, ttl: float = None,
+            items: Optional[Iterable[str]] = None, org: str = None, version: str = None):
+        if not self.enabled or size > self.max_bytes:
+            return
+        expires = time.monotonic() + min(ttl or self.ttl, self.ttl)
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = _Entry(value, size, expires,
+                                     None if items is None else frozenset(items), org, version)
+            self.bytes += size
+            while len(self._data) > self.max_entries or self.bytes > self.max_bytes:
+                self._pop(next(iter(self._data)))   # самая давно использованная
+
+    def _pop(self, key: str):
+        self.bytes -= self._data.pop(key).size
+
+    def invalidate(self, items: Iterable[str] = (), org: str = None, version: str = None) -> int:
+        """
+        Удаляет записи, содержащие любой из товаров, организации org или
+        модели version; записи без пометок удаляются при любой инвалидации.
+        """
+        items = set(items)
+        with self._lock:
+            stale = [k for k, e in self._data.items()
+                     if e.items is None
+                     or (items and not items.isdisjoint(e.items))
+                     or (org is not None and e.org == org)
+                     or (version is not None and e.version == version)]
+            for key in stale:
+                self._pop(key)
+        return len(stale)
+
+    def clear(self) -> int:
+        with self._lock:
+            count = len(self._data)
+            self._data.clear()
+            self.bytes = 0
+        return count
@@ -79,6 +79,52 @@ QUEUE_SIZE = Gauge(
     registry=registry
 )
 
+MODEL_LOAD_TIME = Gauge(
+    'ml_model_load_duration_seconds',
+    'Time spent loading the current model artifact',
+    registry=registry
+)
+
+MODEL_RELOADS = Counter(
+    'ml_model_reloads_total',
+    'Model artifact (re)loads',
+    ['result'],
+    registry=registry
+)
+
+UNKNOWN_ITEMS = Counter(
+    'ml_unknown_items_total',
+    'Items in forecast requests that were not seen at training time',
+    registry=registry
+)
+
+CACHE_HIT_RATIO = Gauge(
+    'ml_cache_hit_ratio',
+    'Cache hit ratio since process start, per cache tier',
+    ['tier'],
+    registry=registry
+)
+
+CACHE_CIRCUIT_OPEN = Gauge(
+    'ml_cache_circuit_open',
+    '1 while the Redis circuit breaker is open (cache bypassed)',
+    registry=registry
+)
+
+PREAGGREGATION_ROWS = Counter(
+    'ml_preaggregation_rows_total',
+    'Sales rows before (stage="in") and after (stage="out") collapsing to one row per (series, day)',
+    ['stage'],
+    registry=registry
+)
+
+PREAGGREGATION_RATIO = Histogram(
+    'ml_preaggregation_ratio',
+    'Input sales rows per (series, day) row after pre-aggregation, per request',
+    buckets=(1, 1.5, 2, 3, 5, 10, 20, 50, 100, 200),
+    registry=registry
+)
+
 # Информация о модели
 MODEL_INFO = Info(
     'ml_model_info',
@@ -89,6 +135,7 @@ MODEL_INFO = Info(
 class MetricsCollector:
     def __init__(self):
         self.start_time = time.time()
+        self.cache_lookups: Dict[str, list] = {}   # уровень кеша → [попадания, всего]
         
     def record_request(self, method: str, endpoint: str, status_code: int, duration: float):
         """Записывает метрики запроса"""
@@ -99,9 +146,25 @@ class MetricsCollector:
         """Записывает время предсказания модели"""
         MODEL_PREDICTION_TIME.labels(model_type=model_type).observe(duration)
         
-    def record_cache_operation(self, operation: str, result: str):
-        """Записывает операцию кеша"""
-        CACHE_OPERATIONS.labels(operation=operation, result=result).inc()
+    def record_cache_operation(self, operation: str, result: str, count: int = 1):
+        """Записывает операцию кеша (count — для пакетных операций)"""
+        CACHE_OPERATIONS.labels(operation=operation, result=result).inc(count)
+        
+    def record_cache_lookup(self, tier: str, hits: int, total: int = 1):
+        """Записывает обращения к уровню кеша (local / redis / sku) и обновляет долю попаданий"""
+        CACHE_OPERATIONS.labels(operation=f"{tier}_get", result="hit").inc(hits)
+        CACHE_OPERATIONS.labels(operation=f"{tier}_get", result="miss").inc(total - hits)
+        counts = self.cache_lookups.setdefault(tier, [0, 0])
+        counts[0] += hits
+        counts[1] += total
+        CACHE_HIT_RATIO.labels(tier=tier).set(counts[0] / counts[1] if counts[1] else 0.0)
+        
+    def set_cache_circuit_open(self, is_open: bool):
+        """Состояние предохранителя Redis"""
+        CACHE_CIRCUIT_OPEN.set(int(is_open))
+        
+    def cache_hit_ratios(self) -> Dict[str, float]:
+        return {tier: round(h / t, 4) if t else 0.0 for tier, (h, t) in self.cache_lookups.items()}
         
     def set_active_predictions(self, count: int):
         """Устанавливает количество активных предсказаний"""
@@ -127,6 +190,25 @@ class MetricsCollector:
         """Устанавливает размер очереди"""
         QUEUE_SIZE.labels(queue_type=queue_type).set(size)
         
+    def record_model_load_time(self, duration: float):
+        """Записывает время загрузки артефакта модели"""
+        MODEL_LOAD_TIME.set(duration)
+        
+    def record_model_reload(self, result: str):
+        """Записывает попытку (пере)загрузки модели"""
+        MODEL_RELOADS.labels(result=result).inc()
+        
+    def record_unknown_items(self, count: int):
+        """Записывает число товаров, неизвестных модели"""
+        UNKNOWN_ITEMS.inc(count)
+        
+    def record_preaggregation(self, rows_in: int, rows_out: int):
+        """Записывает пред-агрегацию продаж до (ряд, день) и степень сжатия"""
+        PREAGGREGATION_ROWS.labels(stage="in").inc(rows_in)
+        PREAGGREGATION_ROWS.labels(stage="out").inc(rows_out)
+        if rows_out:
+            PREAGGREGATION_RATIO.observe(rows_in / rows_out)
+        
     def set_model_info(self, model_info: Dict[str, Any]):
         """Устанавливает информацию о модели"""
         MODEL_INFO.info(model_info)
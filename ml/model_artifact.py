@@ -0,0 +1,239 @@
+# src/model_artifact.py
+"""
+Артефакт модели в виде каталога models/model-<date>/ вместо pickle словаря:
+  • model.txt    — бустер LightGBM в нативном текстовом формате;
+  • classes.npy  — классы LabelEncoder как отсортированный массив строк
+                   (memory-map), ItemEncoder ищет товары прямо в нём;
+  • meta.json    — признаки, метрики, версия схемы артефакта и хеш
+                   model.txt (model_digest — из него версия модели).
+
+Метаданные читаются сразу, бустер и классы — при первом обращении.
+Старые models/model-<date>.pkl по-прежнему читаются (load_latest).
+
+    python model_artifact.py convert models/model-2025-07-09.pkl
+"""
+
+import argparse, datetime, hashlib, json, logging, pathlib, pickle, time
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+SCHEMA_VERSION = 1
+
+MODEL_FILE   = "model.txt"
+CLASSES_FILE = "classes.npy"
+META_FILE    = "meta.json"
+
+logger = logging.getLogger(__name__)
+
+
+class ItemEncoder:
+    """
+    Товар → код ItemEnc из обучения: код — позиция товара в отсортированном
+    массиве классов (LabelEncoder.classes_), поиск — np.searchsorted прямо
+    по нему, так что отображённый в память classes.npy не копируется.
+    Кодирование векторное, и неизвестный товар получает -1, а не роняет
+    весь запрос, как LabelEncoder.transform.
+    """
+
+    def __init__(self, classes):
+        self.classes_ = classes if isinstance(classes, np.ndarray) and classes.dtype.kind == "U" \
+            else np.asarray(classes).astype(str)   # pickle-артефакт: object → <U…
+
+    def __len__(self):
+        return len(self.classes_)
+
+    def encode(self, items) -> np.ndarray:
+        """Коды товаров (int64); -1 — товар не встречался при обучении"""
+        items = pd.Series(items, dtype=object).to_numpy()
+        known = np.fromiter((isinstance(x, str) for x in items), dtype=bool, count=len(items))
+        codes = np.full(len(items), -1, dtype=np.int64)
+        if not len(self.classes_) or not known.any():
+            return codes
+        names = items[known].astype(str)
+        pos = np.searchsorted(self.classes_, names)
+        found = pos < len(self.classes_)
+        found[found] = self.classes_[pos[found]] == names[found]
+        codes[np.flatnonzero(known)[found]] = pos[found]
+        return codes
+
+
+class ModelArtifact:
+    """Загруженная модель: бустер, энкодер товаров, признаки и метрики"""
+
+    def __init__(self, path: pathlib.Path, meta: dict,
+                 booster=None, encoder: Optional[ItemEncoder] = None):
+        self.path = path
+        self.meta = meta
+        self._booster = booster
+        self._encoder = encoder
+        self.load_seconds = 0.0
+
+    @property
+    def version(self) -> str:
+        """
+        Имя артефакта и хеш модели, например model-2025-07-09-1f3a9c0d2b7e:
+        меняется при любом переобучении, даже если каталог перезаписан
+        (от версии зависят ключи кеша и инвалидация прогнозов старой модели)
+        """
+        name = self.path.name.removesuffix(".pkl")
+        digest = self.meta.get("model_digest")
+        return f"{name}-{digest[:12]}" if digest else name
+
+    @property
+    def feature_cols(self):
+        return self.meta["feature_cols"]
+
+    @property
+    def metrics(self) -> dict:
+        return self.meta["metrics"]
+
+    @property
+    def booster(self):
+        if self._booster is None:
+            import lightgbm as lgb
+            t0 = time.perf_counter()
+            self._booster = lgb.Booster(model_file=str(self.path / MODEL_FILE))
+            self.load_seconds += time.perf_counter() - t0
+        return self._booster
+
+    @property
+    def encoder(self) -> ItemEncoder:
+        if self._encoder is None:
+            t0 = time.perf_counter()
+            # массив фиксированной ширины (<U…) — отображается в память как есть
+            self._encoder = ItemEncoder(np.load(self.path / CLASSES_FILE, mmap_mode="r"))
+            self.load_seconds += time.perf_counter() - t0
+        return self._encoder
+
+    def predict(self, X):
+        return self.booster.predict(X)
+
+    def load(self) -> "ModelArtifact":
+        """Принудительно загружает ленивые части (бустер и классы)"""
+        _ = self.booster, self.encoder
+        return self
+
+
+def file_digest(path: pathlib.Path) -> str:
+    """blake2b содержимого файла (hex)"""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def new_artifact_dir(models_dir: pathlib.Path = pathlib.Path("models")) -> pathlib.Path:
+    """
+    Свободный каталог для нового артефакта: models/model-<date>-<HHMMSS>.
+    Каждое обучение пишет в свой каталог и не перезаписывает модель,
+    которую, возможно, прямо сейчас читает сервис; имя по-прежнему
+    упорядочено по времени (find_latest).
+    """
+    now = datetime.datetime.now()
+    base = models_dir / f"model-{now:%Y-%m-%d-%H%M%S}"
+    path, n = base, 1
+    while path.exists():
+        n += 1
+        path = base.with_name(f"{base.name}-{n}")
+    return path
+
+
+def save_artifact(out_dir: pathlib.Path, model, encoder: LabelEncoder,
+                  feature_cols, metrics: dict) -> pathlib.Path:
+    """Сохраняет обученную модель в каталог артефакта"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    booster = getattr(model, "booster_", model)
+    booster.save_model(str(out_dir / MODEL_FILE))
+    np.save(out_dir / CLASSES_FILE, np.asarray(encoder.classes_).astype(str))
+
+    import lightgbm as lgb
+    meta = {
+        "schema_version": SCHEMA_VERSION,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "lightgbm_version": lgb.__version__,
+        "feature_cols": list(feature_cols),
+        "metrics": {k: float(v) for k, v in metrics.items()},
+        "model_digest": file_digest(out_dir / MODEL_FILE),
+    }
+    # meta.json пишется последним и атомарно: по нему реестр моделей
+    # понимает, что артефакт готов
+    tmp = out_dir / (META_FILE + ".tmp")
+    tmp.write_text(json.dumps(meta, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(out_dir / META_FILE)
+    return out_dir
+
+
+def open_artifact(path: pathlib.Path) -> ModelArtifact:
+    """Открывает каталог артефакта (только meta.json; остальное — лениво)"""
+    t0 = time.perf_counter()
+    meta = json.loads((path / META_FILE).read_text(encoding="utf-8"))
+    version = meta.get("schema_version")
+    if version != SCHEMA_VERSION:
+        raise ValueError(f"Неподдерживаемая версия артефакта {version} в {path}")
+    if "model_digest" not in meta:   # артефакт, сохранённый до появления хеша
+        meta["model_digest"] = file_digest(path / MODEL_FILE)
+    art = ModelArtifact(path, meta)
+    art.load_seconds = time.perf_counter() - t0
+    return art
+
+
+def open_legacy_pickle(path: pathlib.Path) -> ModelArtifact:
+    """Старый формат: pickle словаря {model, encoder, feature_cols, metrics}"""
+    t0 = time.perf_counter()
+    with open(path, "rb") as f:
+        legacy = pickle.load(f)
+    meta = {
+        "schema_version": 0,
+        "feature_cols": legacy["feature_cols"],
+        "metrics": legacy["metrics"],
+        "model_digest": file_digest(path),
+    }
+    art = ModelArtifact(path, meta, booster=legacy["model"],
+                        encoder=ItemEncoder(legacy["encoder"].classes_))
+    art.load_seconds = time.perf_counter() - t0
+    return art
+
+
+def find_latest(models_dir: pathlib.Path) -> Optional[pathlib.Path]:
+    """
+    Самый новый артефакт по дате в имени; при равной дате каталог
+    нового формата предпочтительнее pkl.
+    """
+    candidates = [p for p in models_dir.glob("model-*")
+                  if (p.is_dir() and (p / META_FILE).exists()) or p.suffix == ".pkl"]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda p: (p.name.removesuffix(".pkl"), p.is_dir()))
+
+
+def load_latest(models_dir: pathlib.Path = pathlib.Path("models")) -> ModelArtifact:
+    """Находит и полностью загружает самый новый артефакт, логируя время загрузки"""
+    path = find_latest(models_dir)
+    if path is None:
+        raise FileNotFoundError(f"Нет обученных моделей в директории {models_dir}")
+    art = open_legacy_pickle(path) if path.suffix == ".pkl" else open_artifact(path)
+    art.load()
+    logger.info("Модель %s загружена за %.3f с", path, art.load_seconds)
+    return art
+
+
+def convert_pickle(pkl_path: pathlib.Path) -> pathlib.Path:
+    """models/model-<date>.pkl → models/model-<date>/"""
+    legacy = open_legacy_pickle(pkl_path)
+    return save_artifact(pkl_path.with_suffix(""), legacy.booster, legacy.encoder,
+                         legacy.feature_cols, legacy.metrics)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    p = argparse.ArgumentParser()
+    sub = p.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("convert", help="Перевести pkl-артефакт в новый формат")
+    c.add_argument("pkl", type=pathlib.Path)
+    args = p.parse_args()
+    if args.cmd == "convert":
+        logger.info("Saved → %s", convert_pickle(args.pkl))
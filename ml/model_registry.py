@@ -0,0 +1,97 @@
+# src/model_registry.py
+"""
+Реестр текущей модели сервиса с горячей заменой.
+
+Новый артефакт в models/ (опрос раз в MODEL_WATCH_INTERVAL секунд) или
+вызов POST /model/reload → артефакт загружается и прогревается в фоновом
+потоке, затем одной операцией присваивания становится текущим.
+Запрос берёт ссылку registry.current один раз в начале и доводит работу
+на ней, так что запросы «в полёте» заканчиваются на старой модели.
+"""
+
+import logging, os, pathlib, threading
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+
+from model_artifact import META_FILE, ModelArtifact, find_latest, load_latest
+from metrics import metrics_collector
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    def __init__(self, models_dir: pathlib.Path = pathlib.Path("models"),
+                 poll_interval: float = None):
+        if poll_interval is None:
+            poll_interval = float(os.getenv("MODEL_WATCH_INTERVAL", "30"))
+        self.models_dir = models_dir
+        self.poll_interval = poll_interval
+        self._current: Optional[ModelArtifact] = None
+        self._signature: Optional[Tuple[str, float]] = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        # вызывается потоком опроса после замены: on_swap(старая, новая)
+        self.on_swap: Optional[Callable[[Optional[ModelArtifact], ModelArtifact], None]] = None
+
+    @property
+    def current(self) -> Optional[ModelArtifact]:
+        return self._current
+
+    def _latest_signature(self) -> Optional[Tuple[str, float]]:
+        """(путь, mtime) самого нового артефакта — меняется и при перезаписи"""
+        path = find_latest(self.models_dir)
+        if path is None:
+            return None
+        stamp = path / META_FILE if path.is_dir() else path
+        return str(path), stamp.stat().st_mtime
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Загружает и прогревает самый новый артефакт и делает его текущим.
+        Возвращает True, если модель заменена. Если новый артефакт битый,
+        исключение пробрасывается, а текущая модель остаётся прежней.
+        """
+        with self._reload_lock:
+            signature = self._latest_signature()
+            if signature is None:
+                raise FileNotFoundError(f"Нет обученных моделей в директории {self.models_dir}")
+            if not force and signature == self._signature:
+                return False
+            try:
+                art = load_latest(self.models_dir)
+                # прогрев: первый predict до того, как модель увидят запросы
+                art.predict(np.zeros((1, len(art.feature_cols))))
+            except Exception:
+                metrics_collector.record_model_reload("error")
+                raise
+
+            self._current, self._signature = art, signature
+            metrics_collector.record_model_reload("success")
+            metrics_collector.record_model_load_time(art.load_seconds)
+            metrics_collector.set_model_info({
+                "path": str(art.path),
+                "schema_version": str(art.meta["schema_version"]),
+            })
+            logger.info("Текущая модель: %s", art.path)
+            return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                old = self._current
+                if self.reload() and self.on_swap is not None:
+                    self.on_swap(old, self._current)
+            except Exception as e:
+                logger.error(f"Ошибка горячей перезагрузки модели: {str(e)}")
+
+    def start_watching(self):
+        """Фоновый опрос каталога моделей (poll_interval <= 0 — выключен)"""
+        if self.poll_interval <= 0 or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
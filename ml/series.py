@@ -0,0 +1,109 @@
+# src/series.py
+"""
+Интернированные ключи рядов: (Номенклатура, Адрес_точки) → int32.
+
+Строки (обычно кириллица) хешируются один раз — pd.factorize по каждой
+колонке, пары кодов сворачиваются в плотный номер ряда SERIES_COL. Дальше
+группировка, сортировка, отпечатки рядов, кодирование товаров и сборка
+ответа работают с этой int32-колонкой, а строки хранятся один раз в
+таблице SeriesKeys (ряд → товар, точка).
+
+Номера рядов упорядочены по (товар, точка): ряды одного товара идут
+подряд, как прежде при группировке по Номенклатуре. По умолчанию ряд —
+товар по всей сети (модель обучена на таких рядах, бэкенд сопоставляет
+строки ответа по Номенклатуре), Адрес_точки не учитывается. Ряды по
+точкам — по запросу (by_store=True, заголовок X-Per-Store в API): тогда
+точки одного товара не смешиваются между собой, а продажи без
+Адрес_точки — ряд товара по всей сети.
+"""
+
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+SERIES_COL = "_series"
+ITEM_COL = "Номенклатура"
+STORE_COL = "Адрес_точки"
+
+
+class SeriesKeys(NamedTuple):
+    """Ряд (индекс массивов) → товар и точка"""
+    item_names: pd.Index      # товары (в склейке запросов могут повторяться)
+    store_names: pd.Index     # точки; пусто — точек в запросе нет
+    item_index: np.ndarray    # ряд → позиция в item_names (int32)
+    store_index: np.ndarray   # ряд → позиция в store_names или -1 (без точки)
+
+    def __len__(self):
+        return len(self.item_index)
+
+    @property
+    def has_stores(self) -> bool:
+        return len(self.store_names) > 0
+
+    def items(self, series) -> np.ndarray:
+        """Товары рядов (object)"""
+        return self.item_names.to_numpy(dtype=object)[self.item_index[series]]
+
+    def stores(self, series) -> np.ndarray:
+        """Точки рядов (object, None — ряд по всей сети)"""
+        out = np.full(len(series), None, dtype=object)
+        if self.has_stores:
+            idx = self.store_index[series]
+            out[idx >= 0] = self.store_names.to_numpy(dtype=object)[idx[idx >= 0]]
+        return out
+
+    def labels(self, series) -> List[str]:
+        """
+        Строковая идентичность рядов для ключей кеша: товар или
+        «товар\\tточка» — для рядов без точки ключи прежние.
+        """
+        items = self.items(series)
+        if not self.has_stores:
+            return items.tolist()
+        return [i if s is None else f"{i}\t{s}" for i, s in zip(items, self.stores(series))]
+
+    def encode_items(self, encoder) -> np.ndarray:
+        """Коды ItemEnc по рядам: каждый товар кодируется один раз"""
+        return encoder.encode(self.item_names)[self.item_index]
+
+
+def intern_series(df: pd.DataFrame, by_store: bool = False) -> Tuple[np.ndarray, SeriesKeys]:
+    """
+    Номер ряда каждой строки df (int32) и таблица рядов; by_store=False —
+    ряд = товар (Адрес_точки не учитывается)
+    """
+    item_codes, item_names = pd.factorize(df[ITEM_COL], sort=True)
+    stores = df[STORE_COL] if by_store and STORE_COL in df.columns else None
+    if stores is None or not stores.notna().any():
+        return (item_codes.astype(np.int32),
+                SeriesKeys(pd.Index(item_names, dtype=object), pd.Index([], dtype=object),
+                           np.arange(len(item_names), dtype=np.int32),
+                           np.full(len(item_names), -1, dtype=np.int32)))
+
+    store_codes, store_names = pd.factorize(stores, sort=True)   # без точки → -1
+    width = len(store_names) + 1
+    pairs = item_codes.astype(np.int64) * width + (store_codes + 1)
+    series, uniq = pd.factorize(pairs, sort=True)
+    return (series.astype(np.int32),
+            SeriesKeys(pd.Index(item_names, dtype=object), pd.Index(store_names, dtype=object),
+                       (uniq // width).astype(np.int32), (uniq % width - 1).astype(np.int32)))
+
+
+def concat_series(keys: Sequence[SeriesKeys]) -> Tuple[SeriesKeys, np.ndarray]:
+    """
+    Таблицы рядов нескольких запросов → общая таблица и сдвиги номеров:
+    ряд s запроса i — это ряд offsets[i] + s общей таблицы.
+    """
+    offsets = np.cumsum([0] + [len(k) for k in keys])
+    item_off = np.cumsum([0] + [len(k.item_names) for k in keys])
+    store_off = np.cumsum([0] + [len(k.store_names) for k in keys])
+    store_index = [np.where(k.store_index >= 0, k.store_index + off, -1)
+                   for k, off in zip(keys, store_off)]
+    merged = SeriesKeys(
+        pd.Index(np.concatenate([k.item_names.to_numpy(dtype=object) for k in keys]), dtype=object),
+        pd.Index(np.concatenate([k.store_names.to_numpy(dtype=object) for k in keys]), dtype=object),
+        np.concatenate([k.item_index + off for k, off in zip(keys, item_off)]).astype(np.int32),
+        np.concatenate(store_index).astype(np.int32),
+    )
+    return merged, offsets
@@ -0,0 +1,79 @@
+# src/test_features.py
+"""
+aggregate_daily: одна строка на (ряд, день), Период усечён до дня,
+строки по (ряд, день), лишние колонки отброшены — и с повторами
+(ряд, день), и без них.
+
+    pytest test_features.py
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import LagMaker, aggregate_daily
+
+
+def receipts(repeats: bool) -> pd.DataFrame:
+    """Чеки двух товаров вперемешку, со временем и лишней колонкой"""
+    rows = [("Сметана", "2024-01-02 18:30", 2, None), ("Кефир", "2024-01-03 09:15", 1, "T1"),
+            ("Кефир", "2024-01-02 11:00", 4, None), ("Сметана", "2024-01-01 10:05", 3, "T2")]
+    if repeats:
+        rows += [("Кефир", "2024-01-02 20:45", 5, "T1"), ("Сметана", "2024-01-01 12:00", 1, None)]
+    return pd.DataFrame({
+        "Номенклатура": [r[0] for r in rows],
+        "Период": pd.to_datetime([r[1] for r in rows]),
+        "Количество": [r[2] for r in rows],
+        "Код": [r[3] for r in rows],
+        "Сумма": 100.0,
+    })
+
+
+def reference(df: pd.DataFrame) -> pd.DataFrame:
+    return (df.assign(Период=df["Период"].dt.normalize())
+              .groupby(["Номенклатура", "Период"], sort=True)
+              .agg(Количество=("Количество", "sum"), Код=("Код", "first"))
+              .reset_index())
+
+
+@pytest.mark.parametrize("repeats", [True, False], ids=["repeats", "no-repeats"])
+def test_aggregate_daily(repeats):
+    df = receipts(repeats)
+    out = aggregate_daily(df)
+    expected = reference(df)
+
+    assert list(out.columns) == ["Номенклатура", "Период", "Количество", "Код"]
+    assert out["Номенклатура"].tolist() == expected["Номенклатура"].tolist()
+    assert np.array_equal(out["Период"].to_numpy("datetime64[ns]"),
+                          expected["Период"].to_numpy("datetime64[ns]"))
+    assert out["Количество"].tolist() == expected["Количество"].tolist()
+    assert out["Код"].fillna("").tolist() == expected["Код"].fillna("").tolist()
+
+
+def test_transform_latest_until():
+    """
+    until: признаки всех рядов — на общую дату; ряд, переставший
+    продаваться, — как если бы до неё были дни с нулевыми продажами
+    """
+    rng = np.random.default_rng(0)
+    frames = []
+    for item, days in [("Кефир", 90), ("Ряженка", 70), ("Сметана", 5)]:
+        period = pd.date_range("2024-01-01", periods=days)
+        frames.append(pd.DataFrame({"Номенклатура": item, "Период": period,
+                                    "Количество": rng.integers(0, 9, days).astype(float)}))
+    df = pd.concat(frames, ignore_index=True)
+    until = df["Период"].max()
+
+    padded = pd.concat([df] + [
+        pd.DataFrame({"Номенклатура": item, "Количество": 0.0,
+                      "Период": pd.date_range(g["Период"].max() + pd.Timedelta(days=1), until)})
+        for item, g in df.groupby("Номенклатура")], ignore_index=True)
+    maker = LagMaker()
+    expected = maker.transform(padded).groupby("Номенклатура").tail(1).reset_index(drop=True)
+    out, history = maker.transform_latest_history(df, until)
+    out = out.reset_index(drop=True)
+
+    assert (out["Период"] == until).all()
+    for col in expected.columns:
+        assert np.array_equal(out[col].to_numpy(), expected[col].to_numpy()), col
+    assert np.array_equal(history[:, -1], expected["Количество"].to_numpy())
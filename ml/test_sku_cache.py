@@ -0,0 +1,92 @@
+# src/test_sku_cache.py
+"""
+Регрессия покомпонентного кеша (CacheManager.get_sku_forecasts): частичное
+попадание — у части SKU история изменилась — пересчитывает только их, и
+ответ совпадает с ответом без кеша. Номера рядов промахов идут с
+пропусками (miss_frame), признаки по ним строятся так же.
+
+    pytest test_sku_cache.py
+"""
+
+import os
+
+os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:1")   # без кеша — пока не подменён клиент
+
+import pandas as pd
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+from fastapi.testclient import TestClient
+
+import api_main
+from cache_manager import cache_manager
+
+ITEMS = ["Кефир 1%", "Молоко 3,2%", "Сметана 20%"]
+
+
+def sales(changed: str = None) -> list:
+    """70 дней продаж трёх SKU; у changed последний день продан на 5 штук больше"""
+    days = pd.date_range("2024-01-01", periods=70).strftime("%Y-%m-%d")
+    events = []
+    for i, item in enumerate(ITEMS):
+        for d, day in enumerate(days):
+            qty = 5 + (d * (i + 3)) % 11 + (5 if item == changed and d == len(days) - 1 else 0)
+            events.append({"Type": "Продажа", "Период": day, "Номенклатура": item,
+                           "Количество": qty, "Код": f"T{i:03d}", "ВидНоменклатуры": "Молочная продукция"})
+    return events
+
+
+@pytest.fixture(scope="module")
+def client():
+    with TestClient(api_main.app) as c:
+        yield c
+
+
+@pytest.fixture()
+def cached():
+    """Кеш на fakeredis (общий сервер на все соединения теста)"""
+    server = fakeredis.FakeServer()
+    make_client = cache_manager._make_client
+    cache_manager._make_client = lambda: fakeredis.FakeAsyncRedis(server=server)
+    cache_manager._loop = None
+    cache_manager.breaker.close()
+    cache_manager.local.clear()
+    yield
+    cache_manager._make_client = make_client
+    cache_manager._loop = None
+    cache_manager.local.clear()
+
+
+def uncached(client, path: str, body):
+    """Ответ без кеша: Redis недоступен, локальный уровень пуст"""
+    make_client = cache_manager._make_client
+    cache_manager._make_client = lambda: fakeredis.FakeAsyncRedis(connected=False)
+    cache_manager._loop = None
+    cache_manager.local.clear()
+    try:
+        return client.post(path, json=body).json()
+    finally:
+        cache_manager._make_client = make_client
+        cache_manager._loop = None
+
+
+@pytest.mark.parametrize("changed", ITEMS)
+def test_forecast_partial_hit(client, cached, changed):
+    headers = {"X-Organization-Id": "org-1"}
+    assert client.post("/forecast", json=[{"DaysCount": 7}] + sales(), headers=headers).status_code == 200
+
+    body = [{"DaysCount": 7}] + sales(changed)
+    r = client.post("/forecast", json=body, headers=headers)
+    assert r.status_code == 200, r.text
+    assert r.json() == uncached(client, "/forecast", body)
+
+
+@pytest.mark.parametrize("changed", ITEMS)
+def test_batch_partial_hit(client, cached, changed):
+    first = {"org-1": [{"DaysCount": 7}] + sales(), "org-2": [{"DaysCount": 14}] + sales()}
+    assert client.post("/forecast/batch", json=first).status_code == 200
+
+    body = {"org-1": [{"DaysCount": 7}] + sales(changed), "org-2": [{"DaysCount": 14}] + sales()}
+    r = client.post("/forecast/batch", json=body)
+    assert r.status_code == 200, r.text
+    assert r.json() == uncached(client, "/forecast/batch", body)
@@ -1,22 +1,36 @@
 # src/train.py
 """
-Обучает LightGBM-регрессию и сохраняет artefact models/model-<date>.pkl.
+Обучает LightGBM-регрессию и сохраняет artefact models/model-<date>-<HHMMSS>/
+(model.txt + classes.npy + meta.json, см. model_artifact.py).
 Поддержка:
   • CSV / Parquet / каталог CSV
   • JSON (масив событий, как приходит в API)
   • Optuna-тюнинг по --optuna-trials N  (если N=0 — без тюнинга)
+  • --stream: обучение по SKU-партициям с ограниченной памятью, когда
+    история не помещается в RAM
 """
 
-import argparse, json, pickle, pathlib, datetime, logging, sys
+import argparse, os, pathlib, logging, resource, sys, tempfile
+from typing import Iterator, List, Optional
 
 import numpy as np
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error
+import lightgbm as lgb
 from lightgbm import LGBMRegressor
 
-from features import LagMaker, safe_mape
+from features import LagMaker, aggregate_daily, safe_mape
+from ingest import (iter_sales_csv, iter_sales_json, iter_sales_parquet,
+                    parse_period, read_sales_csv, read_sales_json, read_sales_parquet)
+from model_artifact import new_artifact_dir, save_artifact
+from series import ITEM_COL, SERIES_COL, STORE_COL, intern_series
+
+logging.basicConfig(level=logging.INFO)
+
+MAX_HISTORY_DAYS = 3 * 365   # глубина истории обучения, дней до последней даты
+VAL_FRAC = 0.2                # доля строк валидации (см. val_mask)
+VAL_HASH_KEY = "ml-train-val-000"   # 16 символов — ключ hash_pandas_object
 
 try:
     import optuna
@@ -24,60 +38,127 @@ except ImportError:
     optuna = None
     logging.warning("Optuna не установлен; гипер-тюнинг будет недоступен")
 
-logging.basicConfig(level=logging.INFO)
-
 # ───────────────────────── data-loader ─────────────────────────
 # ───────────────────────── data-loader ─────────────────────────
-def load_dataframe(path: pathlib.Path) -> pd.DataFrame:
+def load_dataframe(path: pathlib.Path, max_days: int = MAX_HISTORY_DAYS,
+                   by_store: bool = False) -> pd.DataFrame:
     """
-    CSV / Parquet / каталог CSV / JSON → DataFrame (только продажи).
-    Формат даты 'Период' может быть DD.MM.YYYY, поэтому используем
-    pd.to_datetime(..., dayfirst=True).
+    CSV / Parquet / каталог CSV / JSON → DataFrame (только продажи,
+    по одной строке на (ряд, день) — см. features.aggregate_daily;
+    ряд — Номенклатура по всей сети или, при by_store, (Номенклатура,
+    Адрес_точки); номер ряда в колонке SERIES_COL).
+    Читаются только нужные признакам колонки (см. ingest.py); формат
+    даты 'Период' (обычно DD.MM.YYYY) определяется по первым значениям;
+    даты вне последних max_days дней отбрасываются (см. _bound_period).
     """
-    def _add_period(df: pd.DataFrame) -> pd.DataFrame:
-        # единое место преобразования даты
-        df["Период"] = pd.to_datetime(df["Период"], dayfirst=True, errors="coerce")
-        return df.dropna(subset=["Период"])
-
     if path.is_dir():                        # каталог *.csv
         files = sorted(path.glob("*.csv"))
         if not files:
             raise FileNotFoundError("В каталоге нет CSV")
-        df_cat = pd.concat((pd.read_csv(f) for f in files), ignore_index=True)
-        return _add_period(df_cat)
+        df_cat = pd.concat((read_sales_csv(f) for f in files), ignore_index=True)
+        return _add_period(df_cat, max_days, by_store)
 
     suf = path.suffix.lower()
     if suf == ".csv":
-        return _add_period(pd.read_csv(path))
+        return _add_period(read_sales_csv(path), max_days, by_store)
     if suf == ".parquet":
-        return _add_period(pd.read_parquet(path))
+        return _add_period(read_sales_parquet(path), max_days, by_store)
     if suf == ".json":
-        events = json.load(open(path, encoding="utf-8"))
-        sales = [e for e in events if e.get("Type") == "Продажа"]
-        if not sales:
-            raise ValueError("JSON не содержит продаж (Type=='Продажа')")
-        return _add_period(pd.DataFrame(sales))
+        return _add_period(read_sales_json(path), max_days, by_store)
 
     raise ValueError(f"Не понимаю формат: {path}")
 
 
+def latest_date(period: pd.Series) -> Optional[pd.Timestamp]:
+    """Последняя дата продаж не позже сегодняшнего дня (None — таких нет)"""
+    period = period[period <= pd.Timestamp.now().normalize()]
+    return period.max() if len(period) else None
+
+
+def _bound_period(df: pd.DataFrame, max_days: int,
+                  latest: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    """
+    Строки с Периодом позже сегодняшнего дня или раньше max_days дней до
+    последней даты отбрасываются с предупреждением: сетка признаков
+    (features.DayGrid) охватывает все даты от самой ранней до самой
+    поздней, и одна опечатка (01.01.1950) раздула бы её на десятилетия.
+    latest — последняя дата всего набора (--stream: df — одна партиция);
+    None — последняя дата df.
+    """
+    period = df["Период"]
+    keep = period <= pd.Timestamp.now().normalize()
+    latest = latest if latest is not None else latest_date(period)
+    if latest is not None:
+        keep &= period > latest - pd.Timedelta(days=max_days)
+    dropped = int((~keep).sum())
+    if dropped:
+        logging.warning("Отброшено %d строк с Периодом вне %d дней истории (%s … %s)",
+                        dropped, max_days, period[~keep].min().date(), period[~keep].max().date())
+        df = df[keep.to_numpy()]
+    return df
+
+
+def _add_period(df: pd.DataFrame, max_days: int = MAX_HISTORY_DAYS,
+                by_store: bool = False, latest: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+    # единое место преобразования даты; чеки / смены → одна строка на (ряд, день)
+    df["Период"] = parse_period(df["Период"])
+    df = _bound_period(df.dropna(subset=["Период"]), max_days, latest)
+    df[SERIES_COL], _ = intern_series(df, by_store)
+    store_cols = (STORE_COL,) if by_store else ()
+    daily = aggregate_daily(df, group_col=SERIES_COL,
+                            first_cols=(ITEM_COL, *store_cols, "Код", "ВидНоменклатуры"))
+    logging.info("Пред-агрегация: %d → %d строк (x%.1f)",
+                 len(df), len(daily), len(df) / max(len(daily), 1))
+    return daily
+
+
 # ───────────────────────── dataset builder ─────────────────────────
 def build_dataset(df: pd.DataFrame):
-    df_feat = LagMaker().fit_transform(df)
-
-    grp = df_feat.groupby("Номенклатура")["Количество"]
-    df_feat["Target"] = grp.shift(-1)            # ← 1-day ahead
+    # ← 1-day ahead: продажи следующего календарного дня
+    df_feat = LagMaker(group_col=SERIES_COL).transform_with_target(df, ahead=1)
     df_feat = df_feat.dropna(subset=["Target"])
 
     feature_cols = [c for c in df_feat.columns
                     if c.startswith(("lag_", "ma_", "trend_"))
                     or c in ["dow", "weeknum", "month", "quarter", "year"]]
-    return df_feat[["Номенклатура"] + feature_cols + ["Target"]], feature_cols
+    key_cols = [c for c in (ITEM_COL, STORE_COL, "Период") if c in df_feat.columns]
+    return df_feat[[SERIES_COL] + key_cols + feature_cols + ["Target"]], feature_cols
+
+
+def val_mask(ds: pd.DataFrame, val_frac: float = VAL_FRAC) -> np.ndarray:
+    """
+    Строки валидации: хеш ключа строки (товар, точка, дата) < val_frac.
+    Правило не зависит от порядка строк и разбиения на партиции — обычное
+    обучение и --stream делят один и тот же набор одинаково.
+    """
+    key_cols = [c for c in (ITEM_COL, STORE_COL, "Период") if c in ds.columns]
+    h = pd.util.hash_pandas_object(ds[key_cols], index=False, hash_key=VAL_HASH_KEY).to_numpy()
+    return (h % np.uint64(10_000)) < int(val_frac * 10_000)
+
+
+def item_codes(ds: pd.DataFrame, le: LabelEncoder = None):
+    """
+    ItemEnc строк ds и энкодер: товар кодируется один раз на ряд, строкам —
+    выборка по номеру ряда (le=None — энкодер обучается по товарам ds).
+    """
+    items = ds.groupby(SERIES_COL, sort=True)[ITEM_COL].first()
+    if le is None:
+        le = LabelEncoder().fit(items.unique())
+    item_enc = np.full(int(items.index.max()) + 1, -1, dtype=np.int64)
+    item_enc[items.index.to_numpy()] = le.transform(items.to_numpy())
+    return item_enc[ds[SERIES_COL].to_numpy()], le
 
 
 # ───────────────────────── optuna objective ─────────────────────────
-def optuna_objective(trial, X_tr, X_val, y_tr, y_val):
-    params = {
+DEFAULT_PARAMS = {
+    "objective": "regression_l1",
+    "n_estimators": 400,
+    "learning_rate": 0.05,
+    "random_state": 42,
+}
+
+def suggest_params(trial) -> dict:
+    return {
         "objective": "regression_l1",
         "n_estimators": trial.suggest_int("n_estimators", 200, 800, step=100),
         "learning_rate": trial.suggest_float("learning_rate", 0.01, 0.15, log=True),
@@ -86,25 +167,233 @@ def optuna_objective(trial, X_tr, X_val, y_tr, y_val):
         "min_child_samples": trial.suggest_int("min_child_samples", 10, 100, step=10),
         "random_state": 42,
     }
-    model = LGBMRegressor(**params)
+
+def optuna_objective(trial, X_tr, X_val, y_tr, y_val):
+    model = LGBMRegressor(**suggest_params(trial))
     model.fit(X_tr, y_tr)
     pred = model.predict(X_val)
     return mean_absolute_error(y_val, pred)
 
+# ───────────────────────── out-of-core ─────────────────────────
+# Вся история не помещается в RAM: проход 1 читает вход кусками и
+# раскладывает строки по SKU-партициям на диске (история товара — целиком
+# в одной партиции, хвосты рядов между кусками переносить не нужно);
+# проход 2 строит признаки по одной партиции и дописывает их в матрицы
+# float32 на диске; LightGBM собирает из них Dataset батчами (lgb.Sequence).
+# В памяти одновременно — кусок входа или одна партиция и бинаризованный
+# Dataset (байт на признак строки).
+
+def peak_rss_mb() -> float:
+    """Пиковый RSS процесса, МБ (ru_maxrss в Linux — в КБ)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def iter_chunks(path: pathlib.Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    """CSV / каталог CSV / Parquet / JSON кусками не больше chunksize строк"""
+    if path.is_dir():
+        files = sorted(path.glob("*.csv"))
+        if not files:
+            raise FileNotFoundError("В каталоге нет CSV")
+    else:
+        files = [path]
+    for f in files:
+        suf = f.suffix.lower()
+        if suf == ".csv":
+            yield from iter_sales_csv(f, chunksize)
+        elif suf == ".parquet":
+            yield from iter_sales_parquet(f, chunksize)
+        elif suf == ".json":
+            yield from iter_sales_json(f)
+        else:
+            raise ValueError(f"Не понимаю формат: {f}")
+
+
+class FeatureFile(lgb.Sequence):
+    """
+    Матрица float32 на диске (строки подряд, без заголовка): дописывается
+    блоками, читается диапазонами через pread — в памяти только текущий
+    батч (страницы mmap попадали бы в RSS). Для LightGBM — lgb.Sequence.
+    """
+    batch_size = 65536
+
+    def __init__(self, path: pathlib.Path, n_cols: int):
+        self.path, self.n_cols = path, n_cols
+        self.n_rows = 0
+        self._fd = None
+        path.touch()
+
+    def __len__(self):
+        return self.n_rows
+
+    def append(self, X: np.ndarray):
+        with open(self.path, "ab") as f:
+            np.ascontiguousarray(X, dtype=np.float32).tofile(f)
+        self.n_rows += len(X)
+
+    def _read(self, start: int, stop: int) -> np.ndarray:
+        if self._fd is None:
+            self._fd = os.open(self.path, os.O_RDONLY)
+        row = 4 * self.n_cols
+        buf = os.pread(self._fd, (stop - start) * row, start * row)
+        return np.frombuffer(buf, dtype=np.float32).reshape(-1, self.n_cols)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            start, stop, step = idx.indices(self.n_rows)
+            return self._read(start, max(start, stop))[::step]
+        if isinstance(idx, (list, np.ndarray)):
+            return np.stack([self[i] for i in idx])
+        return self._read(idx, idx + 1)[0].astype(np.float64)   # выборка для бинов — double
+
+    def batches(self) -> Iterator[np.ndarray]:
+        for start in range(0, self.n_rows, self.batch_size):
+            yield self[start:start + self.batch_size]
+
+
+def spill_partitions(path: pathlib.Path, workdir: pathlib.Path, partitions: int,
+                     chunksize: int):
+    """
+    Проход 1: строки входа → partitions SKU-партиций (по хешу Номенклатуры)
+    в файлах workdir/part-KKK-NNNNNN.pkl; Период разбирается здесь, один
+    раз. → файлы каждой партиции, товары (для LabelEncoder) и последняя
+    дата всего набора (от неё отсчитывается --max-history-days).
+    """
+    parts: List[List[pathlib.Path]] = [[] for _ in range(partitions)]
+    items = set()
+    rows = 0
+    latest = None
+    for i, chunk in enumerate(iter_chunks(path, chunksize)):
+        chunk["Период"] = parse_period(chunk["Период"])
+        chunk_latest = latest_date(chunk["Период"])
+        if chunk_latest is not None:
+            latest = chunk_latest if latest is None else max(latest, chunk_latest)
+        part = pd.util.hash_array(chunk[ITEM_COL].to_numpy(dtype=object)) % partitions
+        for k, rows_k in chunk.groupby(part, sort=False):
+            f = workdir / f"part-{k:03d}-{i:06d}.pkl"
+            rows_k.to_pickle(f)
+            parts[k].append(f)
+        items.update(chunk[ITEM_COL].dropna().unique().tolist())
+        rows += len(chunk)
+    logging.info("Проход 1: %d строк, %d товаров → %d партиций, peak RSS %.0f МБ",
+                 rows, len(items), partitions, peak_rss_mb())
+    return parts, sorted(items), latest
+
+
+def write_features(parts: List[List[pathlib.Path]], le: LabelEncoder, workdir: pathlib.Path,
+                   val_frac: float = VAL_FRAC, max_days: int = MAX_HISTORY_DAYS,
+                   by_store: bool = False, latest: Optional[pd.Timestamp] = None):
+    """
+    Проход 2: по каждой партиции — суточные ряды, признаки и Target
+    (build_dataset), ItemEnc. Валидация — по тому же правилу, что без
+    --stream (val_mask); окно истории — от последней даты latest всего
+    набора. → (X_tr, y_tr, X_val, y_val) — FeatureFile, и колонки признаков.
+    """
+    out, feat_cols = None, None
+    for k, files in enumerate(parts):
+        if not files:
+            continue
+        df = _add_period(pd.concat([pd.read_pickle(f) for f in files], ignore_index=True),
+                         max_days, by_store, latest)
+        for f in files:
+            f.unlink()
+        if df.empty:   # вся история партиции старше окна --max-history-days
+            continue
+        ds, feat_cols = build_dataset(df)
+        del df
+        if ds.empty:
+            continue
+        if out is None:
+            out = [FeatureFile(workdir / name, n_cols)
+                   for name, n_cols in [("X_tr.f32", len(feat_cols) + 1), ("y_tr.f32", 1),
+                                        ("X_val.f32", len(feat_cols) + 1), ("y_val.f32", 1)]]
+        ds["ItemEnc"] = item_codes(ds, le)[0]
+        X = ds[["ItemEnc"] + feat_cols].to_numpy(dtype=np.float32)
+        y = ds["Target"].to_numpy(dtype=np.float32)[:, None]
+        val = val_mask(ds, val_frac)
+        for f, block in zip(out, [X[~val], y[~val], X[val], y[val]]):
+            f.append(block)
+        logging.info("Партиция %d/%d: %d строк признаков, peak RSS %.0f МБ",
+                     k + 1, len(parts), len(X), peak_rss_mb())
+    return out, feat_cols
+
+
+def train_booster(params: dict, train_set: lgb.Dataset) -> lgb.Booster:
+    """lgb.train с параметрами LGBMRegressor (n_estimators → число деревьев)"""
+    params = dict(params)
+    rounds = params.pop("n_estimators", 100)
+    return lgb.train(params, train_set, num_boost_round=rounds)
+
+
+def evaluate(booster: lgb.Booster, X_val: FeatureFile, y_val: FeatureFile) -> dict:
+    """MAE / MAPE (как safe_mape) на валидации — батчами, без матрицы целиком"""
+    abs_err = pct_err = 0.0
+    for X, y in zip(X_val.batches(), y_val.batches()):
+        y = y[:, 0].astype(float)
+        err = np.abs(y - booster.predict(X))
+        abs_err += err.sum()
+        pct_err += (err / np.maximum(np.abs(y), 1.0)).sum()
+    n = max(len(y_val), 1)
+    return {"mae": abs_err / n, "mape": pct_err / n}
+
+
+def main_stream(args):
+    with tempfile.TemporaryDirectory(prefix="train-", dir=args.workdir) as tmp:
+        workdir = pathlib.Path(tmp)
+        parts, items, latest = spill_partitions(pathlib.Path(args.input), workdir,
+                                                args.partitions, args.chunksize)
+        le = LabelEncoder().fit(items)
+        files, feat_cols = write_features(parts, le, workdir, max_days=args.max_history_days,
+                                          by_store=args.per_store, latest=latest)
+        if files is None or not len(files[0]):
+            raise RuntimeError("После генерации фичей датасет пуст (мало истории)")
+        X_tr, y_tr, X_val, y_val = files
+
+        train_set = lgb.Dataset(X_tr, label=np.fromfile(y_tr.path, dtype=np.float32),
+                                feature_name=["ItemEnc"] + feat_cols,
+                                params={"feature_pre_filter": False})   # min_child_samples меняется в Optuna
+        train_set.construct()
+        logging.info("Dataset: %d строк, peak RSS %.0f МБ", train_set.num_data(), peak_rss_mb())
+
+        # ── подбор гиперпараметров Optuna (опционально); Dataset бинаризуется один раз
+        params = DEFAULT_PARAMS
+        if args.optuna_trials and optuna:
+            study = optuna.create_study(direction="minimize")
+            study.optimize(lambda trial: evaluate(train_booster(suggest_params(trial), train_set),
+                                                  X_val, y_val)["mae"],
+                           n_trials=args.optuna_trials)
+            params = study.best_params | {"objective": "regression_l1", "random_state": 42}
+            logging.info("Optuna best params: %s", params)
+
+        booster = train_booster(params, train_set)
+        metrics = evaluate(booster, X_val, y_val)
+    logging.info("Val MAE=%.3f  MAPE=%.2f%%", metrics["mae"], metrics["mape"] * 100)
+    logging.info("Peak RSS: %.0f МБ", peak_rss_mb())
+
+    out_path = save_artifact(
+        new_artifact_dir(pathlib.Path("models")),
+        booster, le,
+        feature_cols=["ItemEnc"] + feat_cols,
+        metrics=metrics,
+    )
+    logging.info("Saved → %s", out_path)
+
 # ───────────────────────── main ─────────────────────────
 def main(args):
-    df = load_dataframe(pathlib.Path(args.input))
+    if args.stream:
+        return main_stream(args)
+
+    df = load_dataframe(pathlib.Path(args.input), args.max_history_days, args.per_store)
     #horizon = args.horizon
 
     ds, feat_cols = build_dataset(df) #horizon)
     if ds.empty:
         raise RuntimeError("После генерации фичей датасет пуст (мало истории)")
 
-    le = LabelEncoder().fit(ds["Номенклатура"])
-    ds["ItemEnc"] = le.transform(ds["Номенклатура"])
+    ds["ItemEnc"], le = item_codes(ds)
     X = ds[["ItemEnc"] + feat_cols]
     y = ds["Target"]
-    X_tr, X_val, y_tr, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
+    val = val_mask(ds)
+    X_tr, X_val, y_tr, y_val = X[~val], X[val], y[~val], y[val]
 
     # ── подбор гиперпараметров Optuna (опционально)
     if args.optuna_trials and optuna:
@@ -118,12 +407,7 @@ def main(args):
         logging.info("Optuna best params: %s", best_params)
         model = LGBMRegressor(**best_params)
     else:
-        model = LGBMRegressor(
-            objective="regression_l1",
-            n_estimators=400,
-            learning_rate=0.05,
-            random_state=42,
-        )
+        model = LGBMRegressor(**DEFAULT_PARAMS)
 
     model.fit(X_tr, y_tr)
 
@@ -133,18 +417,14 @@ def main(args):
         "mape": safe_mape(y_val, y_pred)
     }
     logging.info("Val MAE=%.3f  MAPE=%.2f%%", metrics["mae"], metrics["mape"] * 100)
+    logging.info("Peak RSS: %.0f МБ", peak_rss_mb())
 
-    artefact = {
-        "model": model,
-        "encoder": le,
-    #    "horizon": horizon,
-        "feature_cols": ["ItemEnc"] + feat_cols,
-        "metrics": metrics,
-    }
-    out_dir = pathlib.Path("models")
-    out_dir.mkdir(exist_ok=True)
-    out_path = out_dir / f"model-{datetime.date.today()}.pkl"
-    pickle.dump(artefact, open(out_path, "wb"))
+    out_path = save_artifact(
+        new_artifact_dir(pathlib.Path("models")),
+        model, le,
+        feature_cols=["ItemEnc"] + feat_cols,
+        metrics=metrics,
+    )
     logging.info("Saved → %s", out_path)
 
 # ───────────────────────── CLI ─────────────────────────
@@ -153,6 +433,18 @@ if __name__ == "__main__":
     p.add_argument("--input", required=True,
                    help="CSV | Parquet | каталог CSV | JSON событий")
     p.add_argument("--horizon", type=int, default=5)
+    p.add_argument("--max-history-days", type=int, default=MAX_HISTORY_DAYS,
+                   help="Строки старше стольких дней до последней даты отбрасываются")
+    p.add_argument("--per-store", action="store_true",
+                   help="Ряды (товар, Адрес_точки) вместо товара по всей сети")
     p.add_argument("--optuna-trials", type=int, default=0,
                    help="Число итераций Optuna (0=без тюнинга)")
+    p.add_argument("--stream", action="store_true",
+                   help="Обучение по SKU-партициям с ограниченной памятью")
+    p.add_argument("--partitions", type=int, default=16,
+                   help="Число SKU-партиций (--stream); больше — меньше пик памяти")
+    p.add_argument("--chunksize", type=int, default=1_000_000,
+                   help="Строк входа за одно чтение (--stream)")
+    p.add_argument("--workdir", default=None,
+                   help="Каталог временных файлов (--stream); по умолчанию системный tmp")
     sys.exit(main(p.parse_args()))